@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест HTTP/JSON API ERP системы на localhost.
+
+Несколько потоков-клиентов с keep-alive соединениями в течение заданного
+времени отправляют смесь запросов: остатки, карточки товаров, заказы и
+создание заказов. В конце печатаются пропускная способность, перцентили
+задержки и распределение HTTP-статусов.
+
+Запуск (сервер должен быть уже запущен):
+    python main.py --serve --quiet &
+    python api_load_test.py --threads 16 --duration 20 --write-ratio 0.1
+"""
+
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _request(conn, method, path, body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    headers = {'Content-Type': 'application/json'} if data else {}
+    started = time.perf_counter()
+    conn.request(method, path, body=data, headers=headers)
+    response = conn.getresponse()
+    payload = response.read()
+    return response.status, payload, time.perf_counter() - started
+
+
+class LoadTest:
+    """Смесь запросов к API и сбор статистики по всем потокам."""
+
+    def __init__(self, host, port, write_ratio, seed=None):
+        self.host = host
+        self.port = port
+        self.write_ratio = write_ratio
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = Counter()
+        self.kinds = Counter()
+        self.errors = Counter()
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        status, payload, _ = _request(conn, 'GET', '/api/products?limit=500')
+        self.product_ids = [p['id'] for p in json.loads(payload)] if status == 200 else []
+        status, payload, _ = _request(conn, 'GET', '/api/customers?limit=500')
+        self.customer_ids = [c['id'] for c in json.loads(payload)] if status == 200 else []
+        status, payload, _ = _request(conn, 'GET', '/api/orders?limit=500')
+        self.order_ids = [o['id'] for o in json.loads(payload)] if status == 200 else []
+        conn.close()
+        if not self.product_ids or not self.customer_ids:
+            raise SystemExit("❌ В базе нет товаров или клиентов — нечего нагружать")
+
+    def next_request(self, rnd):
+        """Следующий запрос смеси: (вид, метод, путь, тело)."""
+        if rnd.random() < self.write_ratio:
+            items = [{'product_id': pid, 'quantity': 1} for pid in rnd.sample(self.product_ids, min(3, len(self.product_ids)))]
+            return 'create_order', 'POST', '/api/orders', {'customer_id': rnd.choice(self.customer_ids), 'items': items}
+        roll = rnd.random()
+        if roll < 0.5:
+            ids = ','.join(str(pid) for pid in rnd.sample(self.product_ids, min(10, len(self.product_ids))))
+            return 'stock', 'GET', f'/api/stock?ids={ids}', None
+        if roll < 0.8:
+            return 'product', 'GET', f'/api/products/{rnd.choice(self.product_ids)}', None
+        if self.order_ids:
+            return 'order', 'GET', f'/api/orders/{rnd.choice(self.order_ids)}', None
+        return 'orders', 'GET', '/api/orders?limit=20', None
+
+    def worker(self, deadline, seed):
+        rnd = random.Random(seed)
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        latencies, statuses, kinds, errors = [], Counter(), Counter(), Counter()
+        while time.perf_counter() < deadline:
+            kind, method, path, body = self.next_request(rnd)
+            try:
+                status, _, elapsed = _request(conn, method, path, body)
+            except (OSError, http.client.HTTPException) as e:
+                errors[type(e).__name__] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                continue
+            latencies.append(elapsed)
+            statuses[status] += 1
+            kinds[kind] += 1
+        conn.close()
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.statuses.update(statuses)
+            self.kinds.update(kinds)
+            self.errors.update(errors)
+
+    def run(self, threads, duration):
+        deadline = time.perf_counter() + duration
+        workers = [threading.Thread(target=self.worker, args=(deadline, self.random.random()))
+                   for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        total = len(self.latencies)
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            return ordered[min(int(p / 100 * total), total - 1)] * 1000 if total else 0.0
+        print(f"📊 Запросов: {total} за {elapsed:.1f} с — {total / elapsed:,.0f} запросов/с")
+        print(f"⏱  Задержка, мс: p50 {percentile(50):.1f}, p95 {percentile(95):.1f}, "
+              f"p99 {percentile(99):.1f}, max {percentile(100):.1f}")
+        print("📨 Виды запросов: " + ", ".join(f"{kind} {count}" for kind, count in self.kinds.most_common()))
+        print("🔢 Статусы: " + ", ".join(f"{status} {count}" for status, count in sorted(self.statuses.items())))
+        if self.statuses.get(409):
+            print("   (409 — отказ из-за нехватки остатка, ожидаем при длительной записи)")
+        if self.errors:
+            print("❌ Ошибки соединения: " + ", ".join(f"{name} {count}" for name, count in self.errors.items()))
+        server_errors = sum(count for status, count in self.statuses.items() if status >= 500)
+        return 1 if server_errors or self.errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP/JSON API ERP системы")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=16, help="параллельных клиентов")
+    parser.add_argument('--duration', type=float, default=10.0, help="длительность, с")
+    parser.add_argument('--write-ratio', type=float, default=0.1, help="доля запросов на создание заказа")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    test = LoadTest(args.host, args.port, args.write_ratio, args.seed)
+    print(f"🚀 {args.threads} клиентов, {args.duration:.0f} с, доля записи {args.write_ratio:.0%} → "
+          f"http://{args.host}:{args.port}")
+    elapsed = test.run(args.threads, args.duration)
+    return test.report(elapsed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP/JSON API ERP системы для складских сканеров и интернет-магазина.
+
+Сервер построен на ThreadingHTTPServer из стандартной библиотеки: каждое
+подключение обслуживается своим потоком (с keep-alive). Чтение идет через
+пул соединений — в режиме WAL читатели не блокируют друг друга и писателя.
+Все записи выполняет очередь записи базы (write_queue): запросы ставят
+задание и ждут его фиксации, одновременные записи фиксируются одной
+транзакцией, а параллельные клиенты не соревнуются за блокировку файла.
+
+Запуск:
+    python main.py --serve [--host 127.0.0.1] [--port 8080] [--db erp_database.db]
+
+Маршруты:
+    GET    /api/health
+    GET    /api/stats
+    GET    /api/writes             очередь записи (глубина, размеры фиксаций) и буфер журнала аудита
+    GET    /api/products?after=<id>&limit=<n>&q=<поиск>
+    GET    /api/products/<id>
+    GET    /api/stock?ids=1,2,3  (свободный остаток: без резервов открытых форм заказа)
+    GET    /api/customers?after=<id>&limit=<n>&q=<поиск>
+    GET    /api/customers/<id>
+    POST   /api/customers          {"name", "email", "phone", "address"}
+    GET    /api/orders?after=<id>&limit=<n>&status=<статус>
+    GET    /api/orders/<id>
+    POST   /api/orders             {"customer_id", "items": [{"product_id", "quantity"}], "status"}
+    PATCH  /api/orders/<id>        {"status"}
+    DELETE /api/orders/<id>
+
+Статус заказа — один из order_service.ORDER_STATUSES. Ошибки возвращаются
+JSON-объектом {"error": ...}: 4xx — ошибка запроса, 503 — база недоступна,
+500 — ошибка сервера.
+"""
+
+import json
+import re
+import sqlite3
+import time
+import traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from order_lines import fetch_order_lines
+from order_service import ORDER_STATUSES, InsufficientStockError, OrderError, OrderService
+from search import lookup
+from stats_summary import read_summary
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+PAGE_LIMIT = 50         # записей на страницу по умолчанию
+MAX_PAGE_LIMIT = 500
+MAX_BODY = 1024 * 1024  # байт в теле запроса
+AUDIT_USER = 'api'      # пользователь изменений через API в журнале аудита
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая возвращается клиенту с HTTP-статусом."""
+
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+# ------------------ ОПЕРАЦИИ ------------------
+
+def _page_params(query):
+    try:
+        after = int(query.get('after', 0))
+        limit = min(int(query.get('limit', PAGE_LIMIT)), MAX_PAGE_LIMIT)
+    except ValueError:
+        raise ApiError(400, "Параметры after и limit должны быть целыми числами") from None
+    return after, max(limit, 1)
+
+
+def _rows(cursor):
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def _found(record, what):
+    """Запись репозитория как словарь или 404, если ее нет."""
+    if record is None:
+        raise ApiError(404, f"{what} не найден")
+    return record._asdict()
+
+
+def _required(body, *fields):
+    missing = [field for field in fields if body.get(field) in (None, '')]
+    if missing:
+        raise ApiError(400, f"Не заполнены поля: {', '.join(missing)}")
+
+
+def _status(body, default=None):
+    """Статус заказа из тела запроса: только из ORDER_STATUSES."""
+    status = body.get('status') or default
+    if status not in ORDER_STATUSES:
+        raise ApiError(400, f"Неизвестный статус заказа: {status!r}", statuses=list(ORDER_STATUSES))
+    return status
+
+
+class ErpApi:
+    """Операции API поверх базы: чтение через пул, запись через очередь записи базы."""
+
+    def __init__(self, db):
+        self.db = db
+        # Клиенты API не входят под своими пользователями: изменения в журнале — от имени API
+        db.audit.user = AUDIT_USER
+        self.orders = OrderService(db)
+        self.writer = db.writes
+
+    def close(self):
+        self.db.close()
+
+    def read(self, fn):
+        """Выполняет fn(conn) на соединении из пула; репозитории db внутри fn используют его же."""
+        with self.db.pool.connection() as conn:
+            return fn(conn)
+
+    # --- справочники ---
+
+    def list_products(self, query):
+        after, limit = _page_params(query)
+        if query.get('q'):
+            rows = self.read(lambda conn: lookup(conn, 'products', query['q'], limit))
+            return [dict(zip(('id', 'name', 'price', 'quantity'), row)) for row in rows]
+        return self.read(lambda conn: _rows(conn.execute(
+            "SELECT id, sku, name, price, quantity, reserved, category FROM products WHERE id > ? ORDER BY id LIMIT ?",
+            (after, limit))))
+
+    def get_product(self, product_id):
+        return _found(self.read(lambda conn: self.db.products.get(product_id)), "Товар")
+
+    def stock(self, query):
+        try:
+            ids = [int(value) for value in query.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            raise ApiError(400, "ids — список целых чисел через запятую") from None
+        if not ids or len(ids) > MAX_PAGE_LIMIT:
+            raise ApiError(400, f"Укажите от 1 до {MAX_PAGE_LIMIT} id товаров")
+        stock = self.read(lambda conn: self.db.products.stock(ids))
+        return {str(product_id): quantity for product_id, quantity in stock.items()}
+
+    def list_customers(self, query):
+        after, limit = _page_params(query)
+        if query.get('q'):
+            rows = self.read(lambda conn: lookup(conn, 'customers', query['q'], limit))
+            return [dict(zip(('id', 'name', 'email'), row)) for row in rows]
+        return self.read(lambda conn: _rows(conn.execute(
+            "SELECT id, name, email, phone, address FROM customers WHERE id > ? ORDER BY id LIMIT ?",
+            (after, limit))))
+
+    def get_customer(self, customer_id):
+        return _found(self.read(lambda conn: self.db.customers.get(customer_id)), "Клиент")
+
+    def create_customer(self, body):
+        _required(body, 'name')
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        values = {'name': body['name'], 'email': body.get('email'), 'phone': body.get('phone'),
+                  'address': body.get('address'), 'created_at': now}
+        try:
+            customer_id = self.writer.call(lambda conn: self.db.customers.insert(values))
+        except sqlite3.IntegrityError as e:
+            raise ApiError(409, f"Клиент не создан: {e}") from None
+        return self.get_customer(customer_id)
+
+    # --- заказы ---
+
+    def list_orders(self, query):
+        after, limit = _page_params(query)
+        orders = self.read(lambda conn: self.db.orders.page(after, limit, query.get('status')))
+        return [order._asdict() for order in orders]
+
+    def get_order(self, order_id):
+        def load(conn):
+            order = _found(self.db.orders.get(order_id), "Заказ")
+            order['items'] = [
+                {'product_id': product_id, 'name': name, 'quantity': quantity, 'price': price}
+                for product_id, name, quantity, price in fetch_order_lines(conn, order_id)]
+            return order
+        return self.read(load)
+
+    def create_order(self, body):
+        _required(body, 'customer_id', 'items')
+        try:
+            customer_id = int(body['customer_id'])
+            requested = [(int(item['product_id']), int(item['quantity'])) for item in body['items']]
+        except (TypeError, ValueError, KeyError):
+            raise ApiError(400, "items — список объектов {product_id, quantity} с целыми значениями") from None
+        if not requested or any(quantity <= 0 for _, quantity in requested):
+            raise ApiError(400, "Количество в каждой позиции должно быть положительным")
+        status = _status(body, "Новый")
+
+        def create(conn):
+            if conn.execute("SELECT 1 FROM customers WHERE id = ?", (customer_id,)).fetchone() is None:
+                raise ApiError(404, "Клиент не найден")
+            ids = sorted({product_id for product_id, _ in requested})
+            prices = dict(conn.execute(
+                f"SELECT id, price FROM products WHERE id IN ({', '.join('?' for _ in ids)})", ids))
+            unknown = [product_id for product_id in ids if product_id not in prices]
+            if unknown:
+                raise ApiError(404, "Товары не найдены", product_ids=unknown)
+            # Цена берется из каталога, а не из запроса клиента
+            items = [{'product_id': product_id, 'quantity': quantity, 'price': prices[product_id]}
+                     for product_id, quantity in requested]
+            return self.orders.create_order(customer_id, items, status, conn=conn)
+        try:
+            order_id = self.writer.call(create)
+        except InsufficientStockError as e:
+            raise ApiError(409, "Недостаточно товара на складе", shortages=[
+                {'product_id': product_id, 'name': name, 'requested': requested_qty, 'available': available}
+                for product_id, name, requested_qty, available in e.shortages]) from None
+        except OrderError as e:
+            raise ApiError(400, str(e)) from None
+        return self.get_order(order_id)
+
+    def update_order(self, order_id, body):
+        _required(body, 'status')
+        status = _status(body)
+        if not self.writer.call(lambda conn: self.db.orders.set_status(order_id, status)):
+            raise ApiError(404, "Заказ не найден")
+        return self.get_order(order_id)
+
+    def delete_order(self, order_id):
+        try:
+            self.writer.call(lambda conn: self.orders.delete_order(order_id, conn=conn))
+        except OrderError as e:
+            raise ApiError(404, str(e)) from None
+        return {'deleted': order_id}
+
+    def stats(self):
+        return self.read(read_summary)
+
+    def write_metrics(self):
+        return {**self.writer.metrics(), 'audit': self.db.audit.metrics()}
+
+
+# ------------------ HTTP ------------------
+
+# (метод, шаблон пути, обработчик(api, id, query, body))
+ROUTES = [
+    ('GET', r'/api/health', lambda api, _id, query, body: {'status': 'ok'}),
+    ('GET', r'/api/stats', lambda api, _id, query, body: api.stats()),
+    ('GET', r'/api/writes', lambda api, _id, query, body: api.write_metrics()),
+    ('GET', r'/api/products', lambda api, _id, query, body: api.list_products(query)),
+    ('GET', r'/api/products/(\d+)', lambda api, _id, query, body: api.get_product(_id)),
+    ('GET', r'/api/stock', lambda api, _id, query, body: api.stock(query)),
+    ('GET', r'/api/customers', lambda api, _id, query, body: api.list_customers(query)),
+    ('GET', r'/api/customers/(\d+)', lambda api, _id, query, body: api.get_customer(_id)),
+    ('POST', r'/api/customers', lambda api, _id, query, body: api.create_customer(body)),
+    ('GET', r'/api/orders', lambda api, _id, query, body: api.list_orders(query)),
+    ('GET', r'/api/orders/(\d+)', lambda api, _id, query, body: api.get_order(_id)),
+    ('POST', r'/api/orders', lambda api, _id, query, body: api.create_order(body)),
+    ('PATCH', r'/api/orders/(\d+)', lambda api, _id, query, body: api.update_order(_id, body)),
+    ('DELETE', r'/api/orders/(\d+)', lambda api, _id, query, body: api.delete_order(_id)),
+]
+_COMPILED = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in ROUTES]
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Разбор запроса, выбор маршрута и JSON-ответ."""
+
+    protocol_version = 'HTTP/1.1'   # keep-alive: клиент не открывает соединение на каждый запрос
+    server_version = 'ERP-API/1.0'
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY keep-alive
+    # клиент ждет задержанного ACK (~40 мс) на каждом запросе
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        try:
+            body = self.read_body()
+            for route_method, pattern, handler in _COMPILED:
+                match = pattern.match(parts.path)
+                if match and route_method == method:
+                    record_id = int(match.group(1)) if match.groups() else None
+                    status = 201 if method == 'POST' else 200
+                    self.send_json(status, handler(self.server.api, record_id, query, body))
+                    return
+            allowed = any(pattern.match(parts.path) for _, pattern, _ in _COMPILED)
+            raise ApiError(405 if allowed else 404, "Метод не поддерживается" if allowed else "Маршрут не найден")
+        except ApiError as e:
+            self.send_json(e.status, {'error': str(e), **e.details})
+        except sqlite3.Error as e:
+            self.send_json(503, {'error': f"Ошибка базы данных: {e}"})
+        except Exception:
+            # Ошибка в коде обработчика: клиент получает JSON, а трассировка — в вывод сервера
+            traceback.print_exc()
+            self.send_json(500, {'error': "Внутренняя ошибка сервера"})
+
+    def read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Где кончается тело, неизвестно — соединение не переиспользуется
+            self.close_connection = True
+            raise ApiError(400, "Некорректный заголовок Content-Length")
+        if not length:
+            return {}
+        if length > MAX_BODY:
+            # Непрочитанное тело нельзя оставить в соединении keep-alive
+            self.close_connection = True
+            raise ApiError(413, "Слишком большое тело запроса")
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, "Тело запроса должно быть JSON") from None
+        if not isinstance(body, dict):
+            raise ApiError(400, "Тело запроса должно быть JSON-объектом")
+        return body
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Многопоточный HTTP-сервер, держащий общий ErpApi."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, api, quiet=False):
+        super().__init__(address, ApiRequestHandler)
+        self.api = api
+        self.quiet = quiet
+
+
+def serve(db, host=DEFAULT_HOST, port=DEFAULT_PORT, quiet=False):
+    """Запускает API над Database db и обслуживает запросы до Ctrl+C."""
+    api = ErpApi(db)
+    server = ApiServer((host, port), api, quiet=quiet)
+    print(f"🌐 API ERP: http://{host}:{server.server_address[1]}/api/health "
+          f"(БД: {db.db_name}, профиль: {db.profile.name})")
+    started = time.perf_counter()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.close()
+        print(f"\n🛑 API остановлен после {time.perf_counter() - started:.0f} с работы")
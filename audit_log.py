@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал изменений данных: кто, когда и что изменил.
+
+Каждая вставка, изменение и удаление записей через репозитории (а значит,
+через Database интерфейса, database.py и HTTP API), а также проведение и
+удаление заказов дают запись журнала: пользователь, время, действие,
+таблица, id и разница «было/стало» по колонкам.
+
+Запись не стоит отдельной фиксации: record() кладет кортеж в кольцевой
+буфер в памяти, а фоновый поток раз в FLUSH_INTERVAL (или как только
+накопится FLUSH_BATCH записей) переносит буфер в таблицу audit_log одним
+заданием очереди записи. Разница колонок и JSON собираются уже в фоновом
+потоке. Записи из заданий очереди попадают в буфер только после фиксации
+задания, поэтому откаченные изменения в журнал не попадают.
+
+Если база долго недоступна и буфер переполняется, вытесняются самые старые
+записи; их число видно в metrics()['dropped'].
+
+Журнал хранится RETENTION_DAYS дней: тот же поток раз в PRUNE_INTERVAL
+удаляет старые записи порциями по PRUNE_CHUNK, не держа блокировку записи.
+
+Просмотр журнала из командной строки:
+    python audit_log.py [--table products] [--id 42] [--user admin] [--limit 50]
+    python audit_log.py --prune [--days 90]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+RETENTION_DAYS = 365
+BUFFER_SIZE = 100000    # записей в кольцевом буфере
+FLUSH_INTERVAL = 1.0    # с: как часто буфер переносится в базу
+FLUSH_BATCH = 1000      # записей в буфере, при которых перенос начинается раньше срока
+PRUNE_INTERVAL = 6 * 3600
+PRUNE_CHUNK = 10000     # записей, удаляемых одним заданием очереди записи
+
+ACTIONS = ('insert', 'update', 'delete')
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY,
+        ts TEXT NOT NULL,
+        user_name TEXT,
+        action TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        record_id INTEGER,
+        changes TEXT
+    )
+    """,
+    # История записи, действия пользователя и срез по времени (и удаление по сроку хранения)
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_record ON audit_log(table_name, record_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_user ON audit_log(user_name, id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_ts ON audit_log(ts)",
+]
+
+_INSERT = ("INSERT INTO audit_log (ts, user_name, action, table_name, record_id, changes) "
+           "VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def diff(before, after):
+    """Разница записи: {колонка: [было, стало]} по колонкам after (для удаления — before)."""
+    before = before or {}
+    after = after or {}
+    columns = after if after else before
+    return {column: [before.get(column), after.get(column)]
+            for column in columns if before.get(column) != after.get(column)}
+
+
+def _row(entry):
+    stamp, user, action, table, record_id, before, after = entry
+    changes = diff(before, after)
+    return (datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M:%S"), user, action, table, record_id,
+            json.dumps(changes, ensure_ascii=False, default=str) if changes else None)
+
+
+class AuditJournal:
+    """Кольцевой буфер записей журнала и фоновый поток, переносящий его в audit_log.
+
+    writes — очередь записи базы (write_queue.WriteQueue); user — имя
+    пользователя, от которого записываются изменения (задает интерфейс).
+    """
+
+    def __init__(self, writes, capacity=BUFFER_SIZE, interval=FLUSH_INTERVAL, retention_days=RETENTION_DAYS):
+        self.writes = writes
+        self.user = None
+        self.interval = interval
+        self.retention_days = retention_days
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()     # буфер пополняет поток записи, а возвращает записи поток журнала
+        self._wake = threading.Event()
+        self._closing = False
+        self._stats = {'written': 0, 'dropped': 0, 'flushes': 0, 'pruned': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='erp-audit', daemon=True)
+        self._thread.start()
+
+    def record(self, action, table, record_id, before=None, after=None):
+        """Записывает изменение: before и after — словари колонок до и после (None — записи не было)."""
+        self.writes.after_commit(self._append, (time.time(), self.user, action, table, record_id, before, after))
+
+    def _append(self, entry):
+        buffer = self._buffer
+        with self._lock:
+            if len(buffer) == buffer.maxlen:
+                self._stats['dropped'] += 1
+            buffer.append(entry)
+        if len(buffer) >= FLUSH_BATCH:
+            self._wake.set()
+
+    def _restore(self, entries):
+        """Возвращает неперенесенные записи в начало буфера; при переполнении вытесняются самые старые."""
+        buffer = self._buffer
+        with self._lock:
+            newer = list(buffer)
+            buffer.clear()
+            buffer.extend(entries)
+            buffer.extend(newer)
+            self._stats['dropped'] += max(0, len(entries) + len(newer) - buffer.maxlen)
+
+    def flush(self):
+        """Переносит накопленные записи в базу сейчас (ждет фиксации)."""
+        entries = [self._buffer.popleft() for _ in range(len(self._buffer))]
+        if not entries:
+            return 0
+        try:
+            # Строки собираются здесь, а не в потоке записи: разница и JSON не задерживают пакет очереди
+            rows = [_row(entry) for entry in entries]
+            self.writes.call(lambda conn: conn.executemany(_INSERT, rows))
+        except Exception:
+            # База недоступна: записи возвращаются в буфер и уйдут со следующим переносом
+            self._restore(entries)
+            self._stats['errors'] += 1
+            raise
+        self._stats['written'] += len(entries)
+        self._stats['flushes'] += 1
+        return len(entries)
+
+    def prune(self, days=None):
+        """Удаляет записи старше срока хранения порциями; возвращает число удаленных."""
+        days = self.retention_days if days is None else days
+        total = 0
+        while True:
+            deleted = self.writes.call(lambda conn: prune(conn, days))
+            total += deleted
+            if deleted < PRUNE_CHUNK:
+                break
+        self._stats['pruned'] += total
+        return total
+
+    def metrics(self):
+        return {'buffered': len(self._buffer), **self._stats}
+
+    def close(self):
+        """Переносит остаток буфера и останавливает поток (до закрытия очереди записи)."""
+        if self._thread.is_alive():
+            self._closing = True
+            self._wake.set()
+            self._thread.join()
+
+    def _run(self):
+        # Первое удаление по сроку хранения — вскоре после запуска, затем раз в PRUNE_INTERVAL
+        next_prune = time.monotonic() + self.interval
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if self._closing:
+                    break
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + PRUNE_INTERVAL
+                    self.prune()
+            except Exception:
+                if self._closing:
+                    break
+                # Следующая попытка — на следующем круге; записи остаются в буфере
+                continue
+
+
+def prune(conn, days=RETENTION_DAYS, chunk=PRUNE_CHUNK):
+    """Удаляет до chunk записей старше days дней; возвращает число удаленных."""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    return conn.execute(
+        "DELETE FROM audit_log WHERE id IN (SELECT id FROM audit_log WHERE ts < ? LIMIT ?)",
+        (cutoff, chunk)).rowcount
+
+
+def history(conn, table=None, record_id=None, user=None, since=None, limit=100):
+    """Последние записи журнала по фильтрам, новые сверху: [(id, ts, user, action, table, id, {изменения})]."""
+    where, params = [], []
+    if table:
+        where.append("table_name = ?")
+        params.append(table)
+        if record_id is not None:
+            where.append("record_id = ?")
+            params.append(record_id)
+    if user:
+        where.append("user_name = ?")
+        params.append(user)
+    if since:
+        where.append("ts >= ?")
+        params.append(since)
+    sql = "SELECT id, ts, user_name, action, table_name, record_id, changes FROM audit_log"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    rows = conn.execute(sql + " ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+    return [(*row[:6], json.loads(row[6]) if row[6] else {}) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Журнал изменений данных ERP")
+    parser.add_argument('--table')
+    parser.add_argument('--id', type=int, help="id записи (вместе с --table)")
+    parser.add_argument('--user')
+    parser.add_argument('--since', help="не раньше даты/времени, ГГГГ-ММ-ДД[ ЧЧ:ММ:СС]")
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--prune', action='store_true', help="удалить записи старше срока хранения")
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help="срок хранения, дней")
+    parser.add_argument('--db', default=os.environ.get('ERP_DB_PATH', 'erp_database.db'))
+    parser.add_argument('--profile')
+    args = parser.parse_args(argv)
+
+    # Таблица журнала появилась в миграции схемы
+    from data_access import DataAccess
+    data = DataAccess(args.db, args.profile)
+    try:
+        if args.prune:
+            print(f"🧹 Удалено записей журнала старше {args.days} дн.: {data.audit.prune(args.days)}")
+            return 0
+        rows = history(data.connect(), args.table, args.id, args.user, args.since, args.limit)
+    finally:
+        data.close()
+    for entry_id, ts, user, action, table, record_id, changes in rows:
+        print(f"#{entry_id} {ts} {user or '—'} {action} {table}#{record_id}")
+        for column, (before, after) in changes.items():
+            print(f"    {column}: {before!r} → {after!r}")
+    if not rows:
+        print("ℹ️  Записей не найдено")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
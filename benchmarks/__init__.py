@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+Замеры производительности ERP системы на синтетических базах разного масштаба.
+
+    datagen — генератор базы на 10 тыс. – 10 млн заказов с перекосом по клиентам и товарам;
+    suite   — замеры реальных путей кода (Database, экран заказов, статистика, заказы);
+    report  — сравнение прогона с эталоном из benchmarks/baselines;
+    overhead — цена слоя доступа к данным на один вызов в сравнении с прежними классами;
+    writes  — записей в секунду у нескольких писателей: очередь записи против прямых транзакций.
+
+Запуск из корня проекта:
+    python -m benchmarks generate --scale 1m
+    python -m benchmarks run --scale 100k --out results.json
+    python -m benchmarks run --scale 10k --save-baseline
+    python -m benchmarks run --scale 10k --cases update_product --accept "причина замедления"
+    python -m benchmarks compare benchmarks/baselines/10k.json results.json
+    python -m benchmarks overhead --scale 10k
+    python -m benchmarks writes --scale 10k --profile shared
+"""
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Командная строка замеров: generate, run, overhead, writes, compare (см. benchmarks/__init__.py)."""
+
+import argparse
+import os
+import sys
+
+from benchmarks.datagen import DEFAULT_SEED, DEFAULT_SKEW, SCALES, ensure_dataset
+from benchmarks.overhead import CALLS, format_overhead, measure
+from benchmarks.report import (THRESHOLD, accept_regressions, compare, format_report, has_regressions, load_results,
+                               save_results)
+from benchmarks.suite import CASES, DEFAULT_REPEAT, run_suite
+from benchmarks.writes import WRITERS, WRITES, format_writes
+from benchmarks.writes import measure as measure_writes
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(PACKAGE_DIR, 'baselines')
+DATA_DIR = os.environ.get('ERP_BENCH_DATA', os.path.join(PACKAGE_DIR, 'data'))
+
+
+def baseline_path(scale):
+    return os.path.join(BASELINE_DIR, f"{scale}.json")
+
+
+def cmd_generate(args):
+    ensure_dataset(args.data_dir, args.scale, args.seed, args.skew)
+    return 0
+
+
+def cmd_run(args):
+    dataset = ensure_dataset(args.data_dir, args.scale, args.seed, args.skew)
+    names = args.cases.split(',') if args.cases else None
+
+    def report(name, result):
+        print(f"⏱  {name:<20} медиана {result['median_ms']:9.3f} мс   p95 {result['p95_ms']:9.3f} мс")
+    print(f"🚀 Замеры на {os.path.basename(dataset)}, повторов: {args.repeat}")
+    try:
+        results = run_suite(dataset, names, repeat=args.repeat, progress=report)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    results['meta']['scale'] = args.scale
+    results['meta']['seed'] = args.seed
+    if args.out:
+        save_results(results, args.out)
+        print(f"💾 Результаты: {args.out}")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        save_results(results, baseline_path(args.scale))
+        print(f"💾 Эталон обновлен: {baseline_path(args.scale)}")
+        return 0
+    baseline = args.baseline or baseline_path(args.scale)
+    if not os.path.exists(baseline):
+        print(f"ℹ️  Эталона {baseline} нет — сравнение пропущено")
+        return 0
+    base = load_results(baseline)
+    rows = compare(base, results, threshold=args.threshold)
+    print("\n" + format_report(rows, base, results))
+    if args.accept and has_regressions(rows):
+        names = accept_regressions(base, rows, args.accept)
+        save_results(base, baseline)
+        print(f"⚠️  Приняты регрессии ({', '.join(names)}): {baseline}")
+        return 0
+    return 1 if has_regressions(rows) else 0
+
+
+def cmd_overhead(args):
+    dataset = ensure_dataset(args.data_dir, args.scale, args.seed, args.skew)
+    print(format_overhead(measure(dataset, args.calls)))
+    return 0
+
+
+def cmd_writes(args):
+    dataset = ensure_dataset(args.data_dir, args.scale, args.seed, args.skew)
+    print(format_writes(measure_writes(dataset, args.profile, args.writers, args.writes)))
+    return 0
+
+
+def cmd_compare(args):
+    base, current = load_results(args.baseline), load_results(args.current)
+    rows = compare(base, current, threshold=args.threshold)
+    print(format_report(rows, base, current))
+    return 1 if has_regressions(rows) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Замеры производительности ERP системы")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def dataset_options(command):
+        command.add_argument('--scale', choices=list(SCALES), default='10k', help="число заказов в базе")
+        command.add_argument('--seed', type=int, default=DEFAULT_SEED)
+        command.add_argument('--skew', type=float, default=DEFAULT_SKEW, help="показатель закона Ципфа")
+        command.add_argument('--data-dir', default=DATA_DIR, help="каталог сгенерированных баз")
+
+    generate = commands.add_parser('generate', help="сгенерировать базу заданного масштаба")
+    dataset_options(generate)
+    generate.set_defaults(handler=cmd_generate)
+
+    run = commands.add_parser('run', help="выполнить замеры и сравнить с эталоном")
+    dataset_options(run)
+    run.add_argument('--cases', help="замеры через запятую: " + ", ".join(CASES))
+    run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run.add_argument('--out', help="файл JSON с результатами")
+    run.add_argument('--baseline', help="эталон для сравнения (по умолчанию baselines/<scale>.json)")
+    run.add_argument('--save-baseline', action='store_true', help="сохранить результаты как эталон масштаба")
+    run.add_argument('--threshold', type=float, default=THRESHOLD, help="допустимое замедление, доля")
+    run.add_argument('--accept', metavar='ПРИЧИНА',
+                     help="записать регрессии прогона в эталон как принятые, с причиной")
+    run.set_defaults(handler=cmd_run)
+
+    overhead = commands.add_parser('overhead', help="накладные расходы слоя доступа к данным на вызов")
+    dataset_options(overhead)
+    overhead.add_argument('--calls', type=int, default=CALLS)
+    overhead.set_defaults(handler=cmd_overhead)
+
+    writes = commands.add_parser('writes', help="пропускная способность записи: очередь против прямых транзакций")
+    dataset_options(writes)
+    writes.add_argument('--profile', help="профиль соединения (по умолчанию ERP_DB_PROFILE / desktop)")
+    writes.add_argument('--writers', type=int, default=WRITERS, help="одновременных потоков-писателей")
+    writes.add_argument('--writes', type=int, default=WRITES, help="записей на поток")
+    writes.set_defaults(handler=cmd_writes)
+
+    compare_cmd = commands.add_parser('compare', help="сравнить два файла результатов")
+    compare_cmd.add_argument('baseline')
+    compare_cmd.add_argument('current')
+    compare_cmd.add_argument('--threshold', type=float, default=THRESHOLD)
+    compare_cmd.set_defaults(handler=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
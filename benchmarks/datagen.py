@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Генератор синтетической базы ERP заданного масштаба.
+
+Число клиентов и товаров выводится из числа заказов. Выбор клиента и товара
+для заказа подчиняется закону Ципфа: немногие постоянные клиенты и ходовые
+товары дают большую часть заказов, как в реальной базе. Даты заказов
+равномерно покрывают заданный период и растут вместе с id.
+
+База создается в новом файле через обычные миграции, поэтому триггеры
+сводных счетчиков и полнотекстового индекса заполняют их по ходу загрузки.
+Генерация детерминирована: одинаковые масштаб и seed дают одинаковую базу.
+"""
+
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from connection_profiles import resolve_profile
+from migrations import migrate
+
+# имя масштаба -> число заказов
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+DEFAULT_SEED = 42
+DEFAULT_SKEW = 1.1        # показатель закона Ципфа: 0 — равномерно, больше — сильнее перекос
+DEFAULT_DAYS = 730        # период, который покрывают даты заказов
+CHUNK_SIZE = 20000        # заказов в одной транзакции
+
+STATUSES = ("Новый", "В обработке", "Отправлен", "Доставлен", "Отменен")
+STATUS_WEIGHTS = (5, 5, 10, 75, 5)
+ITEMS_PER_ORDER = (1, 2, 3, 4, 5)
+ITEMS_WEIGHTS = (35, 30, 20, 10, 5)
+CATEGORIES = ("Электроника", "Бытовая техника", "Канцелярия", "Одежда", "Обувь", "Продукты",
+              "Инструменты", "Мебель", "Спорт", "Книги", "Игрушки", "Автотовары")
+_FIRST_NAMES = ("Иван", "Петр", "Анна", "Мария", "Сергей", "Ольга", "Дмитрий", "Елена",
+                "Алексей", "Наталья", "Андрей", "Татьяна", "Михаил", "Ирина", "Николай", "Светлана")
+_LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Васильев",
+               "Соколов", "Михайлов", "Новиков", "Федоров", "Морозов", "Волков", "Лебедев")
+_CITIES = ("Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", "Самара", "Омск")
+_STREETS = ("Ленина", "Мира", "Садовая", "Школьная", "Лесная", "Новая", "Центральная")
+_PRODUCT_WORDS = ("Комплект", "Набор", "Модуль", "Устройство", "Аксессуар", "Блок", "Кабель",
+                  "Корпус", "Адаптер", "Держатель", "Фильтр", "Датчик")
+_PRODUCT_ADJECTIVES = ("компактный", "усиленный", "универсальный", "профессиональный",
+                       "бытовой", "складной", "беспроводной", "сменный")
+
+
+def dataset_size(orders):
+    """Число записей каждой таблицы для заданного числа заказов."""
+    return {'orders': orders, 'customers': max(100, orders // 10), 'products': max(200, orders // 200)}
+
+
+def zipf_cum_weights(count, skew, rnd):
+    """Накопленные веса для random.choices: ранги Ципфа, случайно распределенные по id.
+
+    Перемешивание нужно, чтобы популярные записи не совпадали с первыми id
+    и не попадали все в одни и те же страницы таблицы.
+    """
+    weights = [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+    rnd.shuffle(weights)
+    return list(itertools.accumulate(weights))
+
+
+def _customer_rows(count, rnd, now):
+    for customer_id in range(1, count + 1):
+        first, last = rnd.choice(_FIRST_NAMES), rnd.choice(_LAST_NAMES)
+        if first[-1] == 'а':
+            last += 'а'
+        yield (customer_id, f"{last} {first}", f"client{customer_id}@example.com",
+               f"+7 9{rnd.randrange(10 ** 9):09d}",
+               f"г. {rnd.choice(_CITIES)}, ул. {rnd.choice(_STREETS)}, д. {rnd.randint(1, 150)}", now)
+
+
+def _product_rows(count, rnd, now):
+    for product_id in range(1, count + 1):
+        name = f"{rnd.choice(_PRODUCT_WORDS)} {rnd.choice(_PRODUCT_ADJECTIVES)} {rnd.randint(100, 999)}"
+        # Небольшая доля товаров закончилась — как на реальном складе
+        quantity = 0 if rnd.random() < 0.03 else rnd.randint(1, 1000)
+        price = round(rnd.lognormvariate(7, 1), 2)
+        yield (product_id, name, price, quantity, rnd.choice(CATEGORIES), now, f"SKU-{product_id:07d}")
+
+
+def generate(path, orders, seed=DEFAULT_SEED, skew=DEFAULT_SKEW, days=DEFAULT_DAYS,
+             chunk_size=CHUNK_SIZE, progress=None):
+    """Создает базу path с orders заказами и возвращает число записей по таблицам.
+
+    progress(done, total) вызывается после каждой пачки заказов.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"Файл {path} уже существует — генератор создает только новую базу")
+    size = dataset_size(orders)
+    rnd = random.Random(seed)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = resolve_profile('bulk-load').connect(path)
+    try:
+        migrate(conn)
+        with conn:
+            conn.executemany(
+                "INSERT INTO customers (id, name, email, phone, address, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                _customer_rows(size['customers'], rnd, now))
+            products = list(_product_rows(size['products'], rnd, now))
+            conn.executemany(
+                "INSERT INTO products (id, name, price, quantity, category, created_at, sku) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", products)
+        prices = [row[2] for row in products]
+        customer_ids = range(1, size['customers'] + 1)
+        product_ids = range(1, size['products'] + 1)
+        customer_weights = zipf_cum_weights(size['customers'], skew, rnd)
+        product_weights = zipf_cum_weights(size['products'], skew, rnd)
+
+        start = datetime.now() - timedelta(days=days)
+        step = days * 86400 / orders
+        for first in range(1, orders + 1, chunk_size):
+            count = min(chunk_size, orders + 1 - first)
+            customers = rnd.choices(customer_ids, cum_weights=customer_weights, k=count)
+            statuses = rnd.choices(STATUSES, weights=STATUS_WEIGHTS, k=count)
+            lines = rnd.choices(ITEMS_PER_ORDER, weights=ITEMS_WEIGHTS, k=count)
+            picked = iter(rnd.choices(product_ids, cum_weights=product_weights, k=sum(lines)))
+            order_rows, item_rows = [], []
+            for offset in range(count):
+                order_id = first + offset
+                total = 0.0
+                # Один товар в заказе встречается не больше одного раза
+                for product_id in {next(picked) for _ in range(lines[offset])}:
+                    quantity = rnd.randint(1, 3)
+                    price = prices[product_id - 1]
+                    total += quantity * price
+                    item_rows.append((order_id, product_id, quantity, price))
+                created = start + timedelta(seconds=(order_id - 1) * step + rnd.random() * step)
+                order_rows.append((order_id, customers[offset], round(total, 2), statuses[offset],
+                                   created.strftime("%Y-%m-%d %H:%M:%S")))
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (id, customer_id, total_amount, status, created_date) "
+                    "VALUES (?, ?, ?, ?, ?)", order_rows)
+                conn.executemany(
+                    "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                    item_rows)
+            if progress:
+                progress(first + count - 1, orders)
+        conn.execute("ANALYZE")
+        size['order_items'] = conn.execute("SELECT COUNT(*) FROM order_items").fetchone()[0]
+    finally:
+        conn.close()
+    return size
+
+
+def dataset_path(data_dir, scale, seed=DEFAULT_SEED):
+    """Путь к сгенерированной базе масштаба scale (имя включает seed)."""
+    return os.path.join(data_dir, f"erp_{scale}_seed{seed}.db")
+
+
+def ensure_dataset(data_dir, scale, seed=DEFAULT_SEED, skew=DEFAULT_SKEW):
+    """Возвращает путь к базе масштаба scale, генерируя ее при первом обращении."""
+    path = dataset_path(data_dir, scale, seed)
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    orders = SCALES[scale]
+    print(f"🛠  Генерация базы {scale}: {orders} заказов → {path}")
+    started = time.perf_counter()
+
+    def report(done, total):
+        print(f"\r⏳ {done / total:6.1%}  заказов: {done}", end='', flush=True)
+    # Недописанный файл не должен выглядеть как готовая база
+    partial = path + '.partial'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(partial + suffix):
+            os.remove(partial + suffix)
+    size = generate(partial, orders, seed=seed, skew=skew, progress=report)
+    os.replace(partial, path)
+    print(f"\n✅ Готово за {time.perf_counter() - started:.1f} с: "
+          + ", ".join(f"{table} {count}" for table, count in size.items()))
+    return path
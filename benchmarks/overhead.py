@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Накладные расходы слоя доступа к данным на один вызов.
+
+Одни и те же короткие операции (чтение строки по id, изменение одной колонки,
+подсчет строк) выполняются тремя способами:
+
+    per_call — как прежний database.py: новое соединение на каждый вызов;
+    shared   — как прежний main.Database: общее соединение, SQL собирается
+               f-строкой при каждом вызове, курсор создается заново;
+    repository — репозиторий data_access: соединение потока из пула и
+               заранее составленный SQL; запись идет через очередь записи,
+               которая при пустой очереди фиксирует ее сразу в потоке
+               вызывающего (выигрыш очереди при нескольких писателях —
+               benchmarks/writes.py);
+    audited  — тот же репозиторий с журналом аудита, как в приложении:
+               строка до изменения и перенос записи журнала в audit_log.
+               Прежние классы журнала не вели, поэтому его цена показана
+               отдельно от цены самого слоя.
+
+Операции выбраны так, чтобы работа самой SQLite была минимальной и разница
+показывала цену обвязки. Время — среднее на вызов в лучшем из нескольких
+прогонов, в микросекундах.
+"""
+
+import gc
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from data_access import CustomerRepository, DataAccess
+
+CALLS = 2000        # вызовов в одном прогоне
+ROUNDS = 5          # прогонов: берется лучший, чтобы отсечь шум
+
+
+class _PerCallConnection:
+    """Прежний database.py: соединение открывается и закрывается в каждом методе."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, table, record_id):
+        conn = sqlite3.connect(self.path)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {table} WHERE id = ?", (record_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row
+
+    def update(self, table, record_id, columns, values):
+        conn = sqlite3.connect(self.path)
+        cursor = conn.cursor()
+        cursor.execute(f"UPDATE {table} SET {', '.join(f'{c}=?' for c in columns)} WHERE id=?",
+                       values + [record_id])
+        conn.commit()
+        conn.close()
+
+    def count(self, table):
+        conn = sqlite3.connect(self.path)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        result = cursor.fetchone()[0]
+        conn.close()
+        return result
+
+
+class _SharedConnection:
+    """Прежний main.Database: одно общее соединение, SQL собирается при каждом вызове."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, table, record_id):
+        cursor = self.conn.cursor()
+        query = f"SELECT * FROM {table}"
+        query += " WHERE id=?"
+        cursor.execute(query, (record_id,))
+        return cursor.fetchone()
+
+    def update(self, table, record_id, columns, values):
+        cursor = self.conn.cursor()
+        set_clause = ", ".join(f"{col}=?" for col in columns)
+        query = f"UPDATE {table} SET {set_clause} WHERE id=?"
+        cursor.execute(query, values + [record_id])
+        self.conn.commit()
+
+    def count(self, table):
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        return cursor.fetchone()[0]
+
+
+def _time(variants, calls, rounds=ROUNDS):
+    """Мкс на вызов для каждого способа: лучший из rounds прогонов по calls вызовов.
+
+    Прогоны способов чередуются, чтобы фоновый шум и рост WAL влияли на всех одинаково.
+    """
+    best = {name: float('inf') for name in variants}
+    for fn in variants.values():
+        for _ in range(min(calls, 100)):
+            fn()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            for name, fn in variants.items():
+                started = time.perf_counter()
+                for _ in range(calls):
+                    fn()
+                best[name] = min(best[name], time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return {name: elapsed / calls * 1e6 for name, elapsed in best.items()}
+
+
+def measure(dataset, calls=CALLS):
+    """Время на вызов, мкс: {операция: {способ: мкс}} на копии базы dataset."""
+    workdir = tempfile.mkdtemp(prefix='erp_overhead_')
+    path = os.path.join(workdir, os.path.basename(dataset))
+    shutil.copyfile(dataset, path)
+    data = DataAccess(path)
+    try:
+        ids = [row[0] for row in data.connect().execute("SELECT id FROM customers LIMIT 500")]
+        per_call = _PerCallConnection(path)
+        shared = _SharedConnection(data.open_connection())
+        # Тот же пул и очередь записи, но без журнала — как у прежних классов
+        customers = CustomerRepository(data.pool, data.writes)
+        pick = itertools.cycle(ids).__next__
+        results = {
+            'get': _time({
+                'per_call': lambda: per_call.get('customers', pick()),
+                'shared': lambda: shared.get('customers', pick()),
+                'repository': lambda: customers.get(pick()),
+            }, calls),
+            'update': _time({
+                'per_call': lambda: per_call.update('customers', pick(), ['phone'], ['+7 000']),
+                'shared': lambda: shared.update('customers', pick(), ['phone'], ['+7 000']),
+                'repository': lambda: customers.update(pick(), {'phone': '+7 000'}),
+                'audited': lambda: data.customers.update(pick(), {'phone': '+7 000'}),
+            }, calls),
+            'count': _time({
+                'per_call': lambda: per_call.count('users'),
+                'shared': lambda: shared.count('users'),
+                'repository': data.users.count,
+            }, calls),
+        }
+        shared.conn.close()
+    finally:
+        data.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_overhead(results):
+    lines = [f"{'Операция':<10}  {'per_call':>10}  {'shared':>10}  {'repository':>10}  {'audited':>10}   мкс/вызов"]
+    for operation, timings in results.items():
+        audited = f"{timings['audited']:10.1f}" if 'audited' in timings else f"{'—':>10}"
+        lines.append(f"{operation:<10}  {timings['per_call']:10.1f}  {timings['shared']:10.1f}  "
+                     f"{timings['repository']:10.1f}  {audited}")
+    return "\n".join(lines)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение результатов замеров с сохраненным эталоном.
+
+Сравнивается медиана каждого замера. Замер считается регрессией, если он
+стал медленнее эталона больше чем на threshold (доля) и одновременно больше
+порога шума — иначе шум таймера на быстрых замерах давал бы ложные
+срабатывания. Порог шума — min_delta_ms, но не больше min_delta_share
+эталона: у замеров в сотые доли миллисекунды заметное замедление меньше
+min_delta_ms, и абсолютный порог его бы скрыл. Ускорение отмечается по тем же порогам.
+
+Замедление, за которое заплачено сознательно, записывается в эталон как
+принятая регрессия (раздел 'accepted': медиана и причина), а медиана
+эталона остается прежней. Такой замер отчет показывает с причиной, но
+регрессией не считает, пока он не стал медленнее принятой медианы по тем же порогам.
+"""
+
+import json
+import time
+
+THRESHOLD = 0.25        # допустимое замедление медианы, доля
+MIN_DELTA_MS = 0.2      # разница меньше этой — шум таймера, а не изменение...
+MIN_DELTA_SHARE = 0.25  # ...и не больше этой доли эталона (быстрые замеры)
+
+REGRESSION = 'регрессия'
+IMPROVEMENT = 'ускорение'
+UNCHANGED = 'без изменений'
+ACCEPTED = 'принятая регрессия'
+ADDED = 'новый замер'
+MISSING = 'нет в прогоне'
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def compare(baseline, current, threshold=THRESHOLD, min_delta_ms=MIN_DELTA_MS, min_delta_share=MIN_DELTA_SHARE):
+    """Построчное сравнение: список (замер, эталон мс, текущее мс, отношение, вердикт)."""
+    base_cases, cur_cases = baseline['cases'], current['cases']
+    rows = []
+    for name in list(base_cases) + [name for name in cur_cases if name not in base_cases]:
+        base = base_cases.get(name, {}).get('median_ms')
+        cur = cur_cases.get(name, {}).get('median_ms')
+        if base is None:
+            rows.append((name, None, cur, None, ADDED))
+            continue
+        if cur is None:
+            rows.append((name, base, None, None, MISSING))
+            continue
+        ratio = cur / base if base else float('inf')
+        if _slower(base, cur, threshold, min_delta_ms, min_delta_share):
+            accepted = baseline.get('accepted', {}).get(name)
+            if accepted and not _slower(accepted['median_ms'], cur, threshold, min_delta_ms, min_delta_share):
+                verdict = ACCEPTED
+            else:
+                verdict = REGRESSION
+        elif _slower(cur, base, threshold, min_delta_ms, min_delta_share):
+            verdict = IMPROVEMENT
+        else:
+            verdict = UNCHANGED
+        rows.append((name, base, cur, ratio, verdict))
+    return rows
+
+
+def _slower(base, cur, threshold, min_delta_ms, min_delta_share):
+    """cur медленнее base больше чем на threshold и больше порога шума."""
+    noise = min(min_delta_ms, base * min_delta_share)
+    return cur - base > noise and cur > base * (1 + threshold)
+
+
+def accept_regressions(baseline, rows, reason):
+    """Записывает регрессии rows в эталон как принятые с причиной reason; возвращает их имена."""
+    accepted = baseline.setdefault('accepted', {})
+    names = []
+    for name, _, cur, _, verdict in rows:
+        if verdict == REGRESSION:
+            accepted[name] = {'median_ms': cur, 'reason': reason, 'date': time.strftime("%Y-%m-%d")}
+            names.append(name)
+    return names
+
+
+def format_report(rows, baseline=None, current=None):
+    """Текстовый отчет сравнения для консоли."""
+    lines = []
+    if baseline and current:
+        if baseline['meta'].get('rows') != current['meta'].get('rows'):
+            lines.append("⚠️  Объем данных эталона и прогона различается — сравнение условное")
+        if baseline['meta'].get('machine') != current['meta'].get('machine'):
+            lines.append("⚠️  Эталон снят на другой платформе: "
+                         f"{baseline['meta'].get('machine')} → {current['meta'].get('machine')}")
+    width = max([len(row[0]) for row in rows] + [6])
+    lines.append(f"{'Замер':<{width}}  {'эталон, мс':>11}  {'сейчас, мс':>11}  {'×':>6}  итог")
+    marks = {REGRESSION: '❌', IMPROVEMENT: '🚀', UNCHANGED: '✅', ACCEPTED: '⚠️', ADDED: '➕', MISSING: '➖'}
+    for name, base, cur, ratio, verdict in rows:
+        base_text = f"{base:11.3f}" if base is not None else f"{'—':>11}"
+        cur_text = f"{cur:11.3f}" if cur is not None else f"{'—':>11}"
+        ratio_text = f"{ratio:6.2f}" if ratio is not None else f"{'—':>6}"
+        lines.append(f"{name:<{width}}  {base_text}  {cur_text}  {ratio_text}  {marks[verdict]} {verdict}")
+    accepted = [row[0] for row in rows if row[4] == ACCEPTED]
+    if accepted:
+        lines.append("\n⚠️  Принятые регрессии (медиана эталона — до замедления):")
+        for name in accepted:
+            entry = baseline['accepted'][name]
+            lines.append(f"   {name}: до {entry['median_ms']:.3f} мс — {entry['reason']}")
+    regressions = sum(1 for row in rows if row[4] == REGRESSION)
+    lines.append(f"\n{'❌ Регрессий: ' + str(regressions) if regressions else '✅ Регрессий нет'}")
+    return "\n".join(lines)
+
+
+def has_regressions(rows):
+    return any(row[4] == REGRESSION for row in rows)
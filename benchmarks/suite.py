@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Набор замеров реальных путей кода ERP системы на сгенерированной базе.
+
+Каждый замер — фабрика, которая получает контекст (Database, сервис заказов,
+движок статистики) и число повторов, готовит данные без учета времени и
+возвращает функцию одного повтора. Замеры, которые пишут в базу, оставляют
+ее в исходном состоянии: созданные записи удаляются, удаленные — заранее
+созданы самим замером. Прогон идет на рабочей копии файла базы.
+"""
+
+import gc
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import sales_analytics
+import stock_reservations
+from main import ORDERS_QUERY, Database
+from order_service import OrderService
+from stats_engine import StatisticsEngine
+
+DEFAULT_REPEAT = 20
+WARMUP = 2
+
+
+class BenchContext:
+    """Общие объекты замеров поверх одной рабочей копии базы."""
+
+    def __init__(self, path, seed):
+        self.db = Database(path)
+        self.orders = OrderService(self.db)
+        self.stats = StatisticsEngine(self.db)
+        self.random = random.Random(seed)
+        self.cleanup = []   # действия, возвращающие базу в исходное состояние после замеров
+        conn = self.db.connect()
+        self.customer_ids = [row[0] for row in conn.execute("SELECT id FROM customers LIMIT 1000")]
+        # Товары с большим остатком: заказы замера не упрутся в нехватку
+        self.products = conn.execute(
+            "SELECT id, price FROM products WHERE quantity >= 100 LIMIT 1000").fetchall()
+
+    def order_items(self):
+        return [{'product_id': product_id, 'quantity': 1, 'price': price}
+                for product_id, price in self.random.sample(self.products, 3)]
+
+    def close(self):
+        self.stats.close()
+        self.db.close()
+
+
+# ------------------ ЗАМЕРЫ ------------------
+
+def _fetch_all_products(ctx, repeat):
+    return lambda: ctx.db.fetch_all('products', order_by='name')
+
+
+def _get_product(ctx, repeat):
+    ids = iter([product_id for product_id, _ in ctx.products] * (repeat + WARMUP))
+    return lambda: ctx.db.products.get(next(ids))
+
+
+def _insert_product(ctx, repeat):
+    created = []
+    ctx.cleanup.append(lambda: [ctx.db.delete('products', product_id) for product_id in created])
+    return lambda: created.append(ctx.db.insert(
+        'products', ['name', 'price', 'quantity', 'category', 'created_at'],
+        ["Замер вставки", 100.0, 10, "Замер", datetime.now().strftime("%Y-%m-%d %H:%M:%S")]))
+
+
+def _update_product(ctx, repeat):
+    product_id, price = ctx.products[0]
+    prices = iter(range(1, repeat + WARMUP + 1))
+    ctx.cleanup.append(lambda: ctx.db.update('products', product_id, ['price'], [price]))
+    return lambda: ctx.db.update('products', product_id, ['price'], [price + next(prices)])
+
+
+def _delete_product(ctx, repeat):
+    victims = [ctx.db.insert('products', ['name', 'price', 'quantity', 'category', 'created_at'],
+                             ["Замер удаления", 1.0, 0, "Замер", "2000-01-01 00:00:00"])
+               for _ in range(repeat + WARMUP)]
+    return lambda: ctx.db.delete('products', victims.pop())
+
+
+def _orders_page(sort_col, descending, middle=False):
+    def factory(ctx, repeat):
+        conn = ctx.db.connect()
+        cursor = None
+        if middle:
+            # Страница из середины выборки: keyset-переход от ключа средней строки
+            offset = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] // 2
+            expr, key = ORDERS_QUERY.sort_exprs[sort_col], ORDERS_QUERY.key
+            direction = 'DESC' if descending else 'ASC'
+            cursor = conn.execute(
+                f"SELECT {expr}, {key} FROM {ORDERS_QUERY.source} "
+                f"ORDER BY {expr} {direction}, {key} {direction} LIMIT 1 OFFSET ?", (offset,)).fetchone()
+        sql, params = ORDERS_QUERY.page(sort_col, descending, cursor=cursor)
+        return lambda: conn.execute(sql, params).fetchall()
+    return factory
+
+
+def _stats(group):
+    def factory(ctx, repeat):
+        def run():
+            # Каждый повтор — расчет с нуля, а не чтение кэша движка
+            ctx.stats.invalidate()
+            return getattr(ctx.stats, group)()
+        return run
+    return factory
+
+
+def _sales_dashboard(ctx, repeat):
+    conn = ctx.db.connect()
+    # Первый расчет сводок на свежей базе — подготовка, а не замер
+    sales_analytics.refresh(conn)
+    return lambda: sales_analytics.dashboard(conn)
+
+
+def _sales_refresh(ctx, repeat):
+    conn = ctx.db.connect()
+    sales_analytics.refresh(conn)
+    order_id, status = conn.execute("SELECT id, status FROM orders ORDER BY id LIMIT 1").fetchone()
+    statuses = iter([status, "Замер"] * (repeat + WARMUP))
+    created = []
+    ctx.cleanup.append(lambda: [ctx.orders.delete_order(order_id) for order_id in created])
+    ctx.cleanup.append(lambda: ctx.db.orders.set_status(order_id, status))
+
+    def run():
+        # Новый заказ и смена статуса уже учтенного: догоняющий расчет и пересчет одного дня
+        created.append(ctx.orders.create_order(ctx.random.choice(ctx.customer_ids), ctx.order_items()))
+        ctx.db.orders.set_status(order_id, next(statuses))
+        return sales_analytics.refresh(conn)
+    return run
+
+
+def _create_order(ctx, repeat):
+    created = []
+    ctx.cleanup.append(lambda: [ctx.orders.delete_order(order_id) for order_id in created])
+    return lambda: created.append(ctx.orders.create_order(
+        ctx.random.choice(ctx.customer_ids), ctx.order_items()))
+
+
+def _reserve_stock(ctx, repeat):
+    conn = ctx.db.connect()
+
+    def run():
+        # Форма заказа: резерв трех позиций условным UPDATE и снятие резервов при отмене
+        token = stock_reservations.new_token()
+        for item in ctx.order_items():
+            stock_reservations.reserve(conn, token, item['product_id'], item['quantity'])
+        stock_reservations.release(conn, token)
+    return run
+
+
+def _delete_order(ctx, repeat):
+    victims = [ctx.orders.create_order(ctx.random.choice(ctx.customer_ids), ctx.order_items())
+               for _ in range(repeat + WARMUP)]
+    return lambda: ctx.orders.delete_order(victims.pop())
+
+
+# имя -> (описание, фабрика)
+CASES = {
+    'fetch_all_products': ("Database.fetch_all('products') по имени", _fetch_all_products),
+    'get_product': ("Товар по id через репозиторий", _get_product),
+    'insert_product': ("Database.insert товара", _insert_product),
+    'update_product': ("Database.update цены товара", _update_product),
+    'delete_product': ("Database.delete товара", _delete_product),
+    'orders_first_page': ("Первая страница заказов с клиентом, новые сверху", _orders_page('created_date', True)),
+    'orders_middle_page': ("Страница заказов из середины выборки", _orders_page('created_date', True, middle=True)),
+    'orders_by_customer': ("Первая страница заказов по имени клиента", _orders_page('customer', False)),
+    'stats_welcome': ("Метрики приветственного экрана без кэша", _stats('welcome')),
+    'stats_detailed': ("Экран статистики без кэша", _stats('detailed')),
+    'sales_dashboard': ("Данные графиков продаж за год из сводок", _sales_dashboard),
+    'sales_refresh': ("Догоняющий расчет сводок после нового заказа", _sales_refresh),
+    'create_order': ("OrderService.create_order на 3 позиции", _create_order),
+    'reserve_stock': ("Резерв трех позиций формы заказа и его снятие", _reserve_stock),
+    'delete_order': ("OrderService.delete_order с возвратом остатков", _delete_order),
+}
+
+
+def _summary(timings):
+    ordered = sorted(timings)
+    return {
+        'repeat': len(ordered),
+        'min_ms': ordered[0] * 1000,
+        'median_ms': statistics.median(ordered) * 1000,
+        'p95_ms': ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def measure(ctx, name, repeat=DEFAULT_REPEAT):
+    """Выполняет замер name: WARMUP повторов без учета и repeat учитываемых."""
+    description, factory = CASES[name]
+    run = factory(ctx, repeat)
+    for _ in range(WARMUP):
+        run()
+    timings = []
+    # Как и timeit, сборщик мусора на время замера отключается: его паузы — главный источник шума
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return {'description': description, **_summary(timings)}
+
+
+def run_suite(dataset, names=None, repeat=DEFAULT_REPEAT, seed=0, progress=None):
+    """Прогоняет замеры names (по умолчанию все) на копии базы dataset и возвращает результат для JSON."""
+    names = names or list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        raise ValueError(f"Неизвестные замеры: {', '.join(unknown)}. Доступны: {', '.join(CASES)}")
+    workdir = tempfile.mkdtemp(prefix='erp_bench_')
+    path = os.path.join(workdir, os.path.basename(dataset))
+    shutil.copyfile(dataset, path)
+    ctx = BenchContext(path, seed)
+    try:
+        conn = ctx.db.connect()
+        sizes = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                 for table in ('customers', 'products', 'orders', 'order_items')}
+        cases = {}
+        for name in names:
+            cases[name] = measure(ctx, name, repeat)
+            if progress:
+                progress(name, cases[name])
+        for cleanup in ctx.cleanup:
+            cleanup()
+    finally:
+        ctx.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {
+            'dataset': os.path.basename(dataset),
+            'rows': sizes,
+            'profile': ctx.db.profile.name,
+            'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': f"{platform.system()} {platform.machine()}",
+        },
+        'cases': cases,
+    }
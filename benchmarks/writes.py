@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Пропускная способность записи при нескольких одновременных писателях.
+
+Потоки-писатели меняют по одной строке заказов тремя способами:
+
+    direct    — как до очереди записи: у каждого потока свое соединение,
+                каждая запись — своя транзакция BEGIN IMMEDIATE и COMMIT;
+    queued    — репозиторий через очередь записи: поток ждет фиксации
+                каждой записи, одновременные записи фиксируются группой;
+    pipelined — поток ставит в очередь все свои записи и затем ждет Future
+                (импорт, пакетные изменения).
+
+Результат — записей в секунду и средний размер групповой фиксации. Выигрыш
+очереди растет с ценой фиксации: при synchronous=FULL на диске с честным
+fsync (профиль shared) он больше, чем при synchronous=NORMAL.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from data_access import DataAccess
+from order_service import write_transaction
+
+WRITERS = 8         # одновременных потоков-писателей
+WRITES = 300        # записей на поток
+STATUSES = ("Новый", "В обработке", "Отправлен")
+
+
+def _threads(target, writers):
+    """Запускает writers потоков target(номер) и возвращает время до завершения последнего."""
+    threads = [threading.Thread(target=target, args=(number,)) for number in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def measure(dataset, profile=None, writers=WRITERS, writes=WRITES):
+    """Записей в секунду для каждого способа на копии базы dataset: {способ: (записей/с, средний пакет)}."""
+    workdir = tempfile.mkdtemp(prefix='erp_writes_')
+    path = os.path.join(workdir, os.path.basename(dataset))
+    shutil.copyfile(dataset, path)
+    data = DataAccess(path, profile)
+    try:
+        ids = [row[0] for row in data.connect().execute("SELECT id FROM orders LIMIT ?", (writers * writes,))]
+
+        def target(number, index):
+            return ids[(number * writes + index) % len(ids)], STATUSES[index % len(STATUSES)]
+
+        def direct(number):
+            conn = data.open_connection()
+            try:
+                for index in range(writes):
+                    order_id, status = target(number, index)
+                    with write_transaction(conn):
+                        conn.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
+            finally:
+                conn.close()
+
+        def queued(number):
+            for index in range(writes):
+                data.orders.set_status(*target(number, index))
+
+        def pipelined(number):
+            futures = [data.writes.submit(lambda conn, job=target(number, index): data.orders.set_status(*job))
+                       for index in range(writes)]
+            for future in futures:
+                future.result()
+
+        results = {}
+        for name, fn in (('direct', direct), ('queued', queued), ('pipelined', pipelined)):
+            before = data.writes.metrics()
+            elapsed = _threads(fn, writers)
+            after = data.writes.metrics()
+            commits = after['commits'] - before['commits']
+            batch = (after['jobs'] - before['jobs']) / commits if commits else 1.0
+            results[name] = (writers * writes / elapsed, batch)
+    finally:
+        data.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_writes(results):
+    lines = [f"{'Способ':<10}  {'записей/с':>10}  {'пакет':>6}"]
+    for name, (rate, batch) in results.items():
+        lines.append(f"{name:<10}  {rate:10.0f}  {batch:6.1f}")
+    direct = results['direct'][0]
+    lines.append(f"Ускорение очереди: queued ×{results['queued'][0] / direct:.1f}, "
+                 f"pipelined ×{results['pipelined'][0] / direct:.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Профили соединения с SQLite: режим журнала, уровень синхронизации, кэши.
+
+Профиль выбирается без правки кода — параметром командной строки --profile
+или переменной окружения ERP_DB_PROFILE. Отдельные настройки профиля можно
+переопределить переменными окружения вида ERP_DB_SYNCHRONOUS=FULL.
+"""
+
+import os
+import sqlite3
+
+from query_trace import TracedConnection
+
+DEFAULT_PROFILE = 'desktop'
+PROFILE_ENV = 'ERP_DB_PROFILE'
+OVERRIDE_ENV_PREFIX = 'ERP_DB_'
+
+# Настройки, которые применяются через PRAGMA (в порядке применения)
+PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+
+
+class ConnectionProfile:
+    """Набор настроек соединения SQLite под конкретный сценарий работы."""
+
+    def __init__(self, name, description, journal_mode='WAL', synchronous='NORMAL', cache_size=-16000,
+                 mmap_size=0, temp_store='DEFAULT', busy_timeout=5000, cached_statements=128):
+        self.name = name
+        self.description = description
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size              # > 0 — страницы, < 0 — килобайты
+        self.mmap_size = mmap_size                # байт, 0 — без отображения в память
+        self.temp_store = temp_store
+        self.busy_timeout = busy_timeout          # мс ожидания блокировки записи
+        self.cached_statements = cached_statements  # размер кэша подготовленных выражений
+
+    def settings(self):
+        """Все настройки профиля в виде словаря."""
+        return {name: getattr(self, name) for name in PRAGMAS + ('cached_statements',)}
+
+    def with_overrides(self, **overrides):
+        """Возвращает копию профиля с переопределенными настройками."""
+        settings = self.settings()
+        settings.update(overrides)
+        return ConnectionProfile(self.name, self.description, **settings)
+
+    def connect(self, db_name, **kwargs):
+        """Открывает соединение и применяет к нему профиль (kwargs передаются в sqlite3.connect)."""
+        kwargs.setdefault('factory', TracedConnection)
+        conn = sqlite3.connect(db_name, timeout=self.busy_timeout / 1000,
+                               cached_statements=self.cached_statements, **kwargs)
+        self.apply(conn)
+        return conn
+
+    def apply(self, conn):
+        """Применяет PRAGMA профиля к открытому соединению."""
+        for pragma in PRAGMAS:
+            # journal_mode возвращает строку с результатом — ее нужно выбрать
+            conn.execute(f"PRAGMA {pragma}={getattr(self, pragma)}").fetchall()
+
+    def __repr__(self):
+        return f"ConnectionProfile({self.name!r})"
+
+
+PROFILES = {
+    'desktop': ConnectionProfile(
+        'desktop', "Один оператор на локальном файле: WAL, умеренные кэши",
+        journal_mode='WAL', synchronous='NORMAL', cache_size=-16000, mmap_size=64 * 1024 ** 2,
+        temp_store='MEMORY', busy_timeout=5000, cached_statements=128),
+    'shared': ConnectionProfile(
+        'shared', "Несколько экземпляров на одном файле: долгое ожидание блокировки, полная синхронизация",
+        journal_mode='WAL', synchronous='FULL', cache_size=-16000, mmap_size=0,
+        temp_store='MEMORY', busy_timeout=30000, cached_statements=128),
+    'bulk-load': ConnectionProfile(
+        'bulk-load', "Ночной импорт: без fsync на каждый коммит, большой кэш страниц",
+        journal_mode='WAL', synchronous='OFF', cache_size=-262144, mmap_size=256 * 1024 ** 2,
+        temp_store='MEMORY', busy_timeout=60000, cached_statements=512),
+    'reporting': ConnectionProfile(
+        'reporting', "Тяжелые отчеты: большой кэш и mmap, временные B-деревья в памяти",
+        journal_mode='WAL', synchronous='NORMAL', cache_size=-131072, mmap_size=1024 ** 3,
+        temp_store='MEMORY', busy_timeout=15000, cached_statements=256),
+}
+
+
+def _env_overrides(environ):
+    """Собирает переопределения вида ERP_DB_CACHE_SIZE=-32000 из окружения."""
+    overrides = {}
+    for setting in PRAGMAS + ('cached_statements',):
+        value = environ.get(OVERRIDE_ENV_PREFIX + setting.upper())
+        if value is None:
+            continue
+        overrides[setting] = int(value) if value.lstrip('-').isdigit() else value.upper()
+    return overrides
+
+
+def resolve_profile(name=None, environ=None):
+    """Возвращает профиль по имени (или из ERP_DB_PROFILE) с учетом переопределений из окружения."""
+    environ = os.environ if environ is None else environ
+    name = name or environ.get(PROFILE_ENV) or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный профиль соединения '{name}'. Доступны: {', '.join(PROFILES)}")
+    overrides = _env_overrides(environ)
+    profile = PROFILES[name]
+    return profile.with_overrides(**overrides) if overrides else profile
+
+
+def describe_connection(conn):
+    """Читает фактические значения PRAGMA с соединения (для отображения в интерфейсе)."""
+    return {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in PRAGMAS}
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Единый слой доступа к данным ERP системы: пул соединений и репозитории.
+
+DataAccess открывает базу, приводит схему к актуальной версии и держит
+репозитории сущностей (users, products, customers, orders). Им пользуются и
+интерфейс (main.Database), и старый модуль database.py, и HTTP API.
+
+Соединения раздает ConnectionPool с учетом потоков: долгоживущий поток
+(главный поток Tk, рабочие потоки исполнителя) получает закрепленное за ним
+соединение, а короткие потоки (запросы HTTP API) берут соединение из пула на
+время операции и возвращают его. Вложенные вызовы в одном потоке используют
+одно и то же соединение.
+
+Записи идут через очередь записи (write_queue): один поток-писатель
+выполняет изменения всех потоков и фиксирует их группами, а при пустой
+очереди запись фиксируется сразу в потоке вызывающего на соединении записи
+(ConnectionPool.bind), без передачи потоку-писателю. Запись внутри уже
+открытой транзакции вызывающего выполняется сразу на его соединении.
+Каждое изменение через репозиторий попадает в журнал аудита (audit_log).
+
+Репозитории не собирают SQL при каждом вызове: тексты запросов составлены
+заранее из белого списка колонок и переиспользуются, поэтому подготовленные
+выражения берутся из кэша соединения (cached_statements профиля). Колонки
+вне белого списка и произвольные выражения сортировки отвергаются.
+"""
+
+import queue
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import query_trace
+from audit_log import AuditJournal
+from connection_profiles import ConnectionProfile, resolve_profile
+from migrations import LATEST_VERSION, current_version, migrate
+from write_queue import BUDGET_MS, WriteQueue
+
+POOL_SIZE = 8       # соединений, которые одновременно выдаются на время операции
+
+
+class ConnectionPool:
+    """Соединения SQLite с учетом потоков.
+
+    local() — соединение, закрепленное за текущим потоком (или уже взятое им
+    через connection()); connection() — соединение на время блока with,
+    после которого оно возвращается в пул.
+    """
+
+    def __init__(self, open_connection, size=POOL_SIZE):
+        self._open = open_connection
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pinned = []       # закрепленные за потоками соединения: закрываются в close()
+        self._bound = None, None, None     # соединение последнего bind() с его курсором и признаком трассировки
+
+    def local(self):
+        """Соединение текущего потока; при первом обращении потока открывается и закрепляется."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+            with self._lock:
+                self._pinned.append(conn)
+        return conn
+
+    def cursor(self):
+        """Переиспользуемый курсор соединения потока для коротких запросов.
+
+        Подходит для запросов, результат которых читается сразу (строка по id,
+        счетчик, запись): следующий вызов выполняет на нем новый запрос.
+        Курсор пересоздается при смене соединения потока и при включении или
+        выключении трассировки SQL.
+        """
+        local = self._local
+        traced = query_trace.active() is not None
+        cursor = getattr(local, 'cursor', None)
+        if cursor is None or local.traced is not traced:
+            cursor = local.cursor = self.local().cursor()
+            local.traced = traced
+        return cursor
+
+    def in_transaction(self):
+        """Открыта ли транзакция на соединении текущего потока."""
+        conn = getattr(self._local, 'conn', None)
+        return conn is not None and conn.in_transaction
+
+    @contextmanager
+    def connection(self):
+        """Соединение на время блока: у потока с соединением — оно же, иначе — из пула."""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            # Курсор потока привязан к соединению: при смене соединения он создается заново
+            self._local.conn, self._local.cursor = conn, None
+            try:
+                yield conn
+            finally:
+                self._local.conn, self._local.cursor = None, None
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def bind(self, conn):
+        """На время блока conn служит соединением текущего потока (запись очереди в потоке вызывающего).
+
+        Курсор привязанного соединения переживает блок: следующая привязка
+        того же соединения (в любом потоке) продолжает им пользоваться.
+        """
+        local = self._local
+        saved = getattr(local, 'conn', None), getattr(local, 'cursor', None), getattr(local, 'traced', None)
+        bound_conn, cursor, traced = self._bound
+        local.conn = conn
+        local.cursor, local.traced = (cursor, traced) if bound_conn is conn else (None, None)
+        try:
+            yield conn
+        finally:
+            self._bound = conn, local.cursor, local.traced
+            local.conn, local.cursor, local.traced = saved
+
+    def close(self):
+        """Закрывает свободные и закрепленные соединения."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            pinned, self._pinned = self._pinned, []
+        for conn in pinned:
+            conn.close()
+        self._local = threading.local()
+        self._bound = None, None, None
+
+
+# ------------------ РЕПОЗИТОРИИ ------------------
+
+User = namedtuple('User', 'id username full_name role email password created_at')
+Product = namedtuple('Product', 'id name price quantity category created_at sku description reserved version')
+Customer = namedtuple('Customer', 'id name email phone address created_at')
+Order = namedtuple('Order', 'id customer_id total_amount status created_date')
+# Итог записи: курсор потока-писателя переиспользуется, поэтому наружу отдаются только числа
+WriteResult = namedtuple('WriteResult', 'lastrowid rowcount')
+
+
+class Repository:
+    """Операции одной таблицы по заранее составленному SQL.
+
+    Подклассы задают TABLE, ROW (namedtuple: id и колонки в порядке выборки),
+    WRITABLE (колонки, которые можно записывать), ORDER_BY (разрешенные
+    сортировки: имя -> SQL-выражение) и VERSIONED — есть ли у строк колонка
+    version для оптимистической блокировки.
+
+    writes — очередь записи (write_queue.WriteQueue); без нее записи
+    выполняются и фиксируются на соединении текущего потока. audit — журнал
+    изменений (audit_log.AuditJournal); колонки AUDIT_MASKED пишутся в него
+    без значений — только факт изменения.
+    """
+
+    TABLE = None
+    ROW = None
+    WRITABLE = ()
+    ORDER_BY = {'id': 'id'}
+    VERSIONED = False
+    AUDIT_MASKED = ()
+
+    def __init__(self, pool, writes=None, audit=None):
+        self.pool = pool
+        self.writes = writes
+        self.audit = audit
+        table, columns = self.TABLE, ', '.join(self.ROW._fields)
+        self._select = f"SELECT {columns} FROM {table}"
+        self._get = f"{self._select} WHERE id = ?"
+        self._count = f"SELECT COUNT(*) FROM {table}"
+        self._delete = f"DELETE FROM {table} WHERE id = ?"
+        self._all = {name: f"{self._select} ORDER BY {expr}" for name, expr in self.ORDER_BY.items()}
+        self._insert = {}   # кортеж колонок -> INSERT
+        self._update = {}   # (кортеж колонок, с проверкой версии) -> UPDATE
+        self._before = {}   # кортеж колонок -> SELECT строки до изменения для журнала
+        self._make = self.ROW._make
+
+    def _columns(self, columns):
+        columns = tuple(columns)
+        unknown = [column for column in columns if column not in self.WRITABLE]
+        if unknown or not columns:
+            raise ValueError(f"Недопустимые колонки для {self.TABLE}: {', '.join(unknown) or 'пусто'}")
+        return columns
+
+    def _write(self, sql, params, change=None):
+        """Выполняет запись и возвращает WriteResult.
+
+        Внутри транзакции вызывающего (в том числе в задании очереди записи)
+        запись выполняется сразу и фиксируется вместе с ней, иначе — ставится
+        в очередь записи и ждет групповой фиксации.
+
+        change — (действие, id, новые значения) для журнала аудита: строка до
+        изменения (для изменения — только изменяемые колонки) читается в той
+        же транзакции, а запись журнала делается, только если строка
+        действительно изменилась.
+        """
+        if self.writes is not None and not self.pool.in_transaction():
+            return self.writes.call(lambda conn: self._write(sql, params, change))
+        audited = change is not None and self.audit is not None
+        before = None
+        if audited and change[0] != 'insert':
+            before = self._before_image(change[1], change[2])
+        cursor = self.pool.cursor()
+        conn = cursor.connection
+        outer = conn.in_transaction
+        cursor.execute(sql, params)
+        result = WriteResult(cursor.lastrowid, cursor.rowcount)
+        if audited and result.rowcount:
+            action, record_id, after = change
+            # Копия: вызывающий может изменить словарь значений после записи
+            after = dict(after) if after is not None else None
+            self._mask(before, after)
+            self.audit.record(action, self.TABLE, result.lastrowid if action == 'insert' else record_id,
+                              before, after)
+        if not outer:
+            conn.commit()
+        return result
+
+    def _before_image(self, record_id, after):
+        """Строка до изменения для журнала: колонки after (при удалении — вся строка) или None."""
+        if after is None:
+            row = self.get(record_id)
+            return row._asdict() if row else None
+        columns = tuple(after)
+        sql = self._before.get(columns)
+        if sql is None:
+            sql = self._before[columns] = f"SELECT {', '.join(columns)} FROM {self.TABLE} WHERE id = ?"
+        row = self.pool.cursor().execute(sql, (record_id,)).fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def _mask(self, before, after):
+        """Скрывает значения колонок AUDIT_MASKED, оставляя в журнале сам факт их изменения."""
+        for column in self.AUDIT_MASKED:
+            old = before.get(column) if before else None
+            if after and column in after:
+                after[column] = None if after[column] is None else (
+                    '***' if after[column] == old else '*** (новое значение)')
+            if old is not None:
+                before[column] = '***'
+
+    def get(self, record_id):
+        """Запись по id или None."""
+        row = self.pool.cursor().execute(self._get, (record_id,)).fetchone()
+        return self._make(row) if row else None
+
+    def all(self, order_by='id', limit=None):
+        """Все записи в порядке order_by — имени из ORDER_BY (не SQL)."""
+        sql = self._all.get(order_by)
+        if sql is None:
+            raise ValueError(f"Недопустимая сортировка для {self.TABLE}: {order_by}")
+        if limit is None:
+            rows = self.pool.local().execute(sql).fetchall()
+        else:
+            rows = self.pool.local().execute(sql + " LIMIT ?", (limit,)).fetchall()
+        return list(map(self._make, rows))
+
+    def first(self, order_by='id'):
+        rows = self.all(order_by, limit=1)
+        return rows[0] if rows else None
+
+    def count(self):
+        return self.pool.cursor().execute(self._count).fetchone()[0]
+
+    def insert(self, values):
+        """Вставляет запись из словаря колонка -> значение и возвращает ее id."""
+        columns = tuple(values)
+        sql = self._insert.get(columns)
+        if sql is None:
+            self._columns(columns)
+            sql = self._insert[columns] = (
+                f"INSERT INTO {self.TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})")
+        return self._write(sql, tuple(values.values()), ('insert', None, values)).lastrowid
+
+    def update(self, record_id, values, version=None):
+        """Обновляет колонки записи; возвращает число измененных строк (0 — записи нет).
+
+        version — версия строки, с которой работал пользователь: запись
+        обновляется, только если ее с тех пор никто не менял (иначе 0).
+        """
+        columns = tuple(values)
+        versioned = version is not None
+        sql = self._update.get((columns, versioned))
+        if sql is None:
+            self._columns(columns)
+            if versioned and not self.VERSIONED:
+                raise ValueError(f"У записей {self.TABLE} нет версии")
+            assignments = ', '.join(f'{column} = ?' for column in columns)
+            sql = self._update[(columns, versioned)] = (
+                f"UPDATE {self.TABLE} SET {assignments}, version = version + 1 WHERE id = ? AND version = ?"
+                if versioned else f"UPDATE {self.TABLE} SET {assignments} WHERE id = ?")
+        params = (*values.values(), record_id, version) if versioned else (*values.values(), record_id)
+        return self._write(sql, params, ('update', record_id, values)).rowcount
+
+    def delete(self, record_id):
+        """Удаляет запись; возвращает число удаленных строк."""
+        return self._write(self._delete, (record_id,), ('delete', record_id, None)).rowcount
+
+
+class UserRepository(Repository):
+    TABLE = 'users'
+    ROW = User
+    WRITABLE = ('username', 'full_name', 'role', 'email', 'password', 'created_at')
+    ORDER_BY = {'id': 'id', 'username': 'username, id', 'newest': 'created_at DESC, id DESC'}
+    AUDIT_MASKED = ('password',)
+
+    def __init__(self, pool, writes=None, audit=None):
+        super().__init__(pool, writes, audit)
+        self._by_username = f"{self._select} WHERE username = ?"
+
+    def by_username(self, username):
+        row = self.pool.cursor().execute(self._by_username, (username,)).fetchone()
+        return self._make(row) if row else None
+
+
+class ProductRepository(Repository):
+    # reserved и version ведут резервы и триггер (stock_reservations.py) — напрямую они не пишутся
+    TABLE = 'products'
+    ROW = Product
+    WRITABLE = ('name', 'price', 'quantity', 'category', 'created_at', 'sku', 'description')
+    ORDER_BY = {'id': 'id', 'name': 'name, id', 'newest': 'created_at DESC, id DESC'}
+    VERSIONED = True
+
+    def stock(self, ids):
+        """Свободные остатки товаров (без резервов открытых форм заказа): {id: количество}."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        return dict(self.pool.local().execute(
+            f"SELECT id, quantity - reserved FROM products WHERE id IN ({', '.join('?' for _ in ids)})", ids))
+
+    def prices(self, ids):
+        """Цены товаров из каталога: {id: цена} для найденных id."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        return dict(self.pool.local().execute(
+            f"SELECT id, price FROM products WHERE id IN ({', '.join('?' for _ in ids)})", ids))
+
+
+class CustomerRepository(Repository):
+    TABLE = 'customers'
+    ROW = Customer
+    WRITABLE = ('name', 'email', 'phone', 'address', 'created_at')
+    ORDER_BY = {'id': 'id', 'name': 'name, id', 'newest': 'created_at DESC, id DESC'}
+
+
+class OrderRepository(Repository):
+    """Шапки заказов. Заказ с позициями и остатками проводит OrderService."""
+
+    TABLE = 'orders'
+    ROW = Order
+    WRITABLE = ('status',)
+    ORDER_BY = {'id': 'id', 'newest': 'created_date DESC, id DESC'}
+
+    def __init__(self, pool, writes=None, audit=None):
+        super().__init__(pool, writes, audit)
+        self._page = f"{self._select} WHERE id > ? ORDER BY id LIMIT ?"
+        self._page_status = f"{self._select} WHERE id > ? AND status = ? ORDER BY id LIMIT ?"
+
+    def page(self, after=0, limit=50, status=None):
+        """Заказы с id больше after по возрастанию id, при необходимости только со статусом status."""
+        conn = self.pool.local()
+        if status:
+            rows = conn.execute(self._page_status, (after, status, limit)).fetchall()
+        else:
+            rows = conn.execute(self._page, (after, limit)).fetchall()
+        return list(map(self._make, rows))
+
+    def set_status(self, order_id, status):
+        return self.update(order_id, {'status': status})
+
+
+class DataAccess:
+    """База данных ERP: схема, пул соединений и репозитории сущностей."""
+
+    def __init__(self, db_name, profile=None, pool_size=POOL_SIZE, write_budget_ms=BUDGET_MS):
+        self.db_name = db_name
+        # Профиль соединения: объект, имя пресета или None (ERP_DB_PROFILE / desktop)
+        self.profile = profile if isinstance(profile, ConnectionProfile) else resolve_profile(profile)
+        # check_same_thread=False: закрепленные соединения закрываются в close() из любого потока
+        self.pool = ConnectionPool(lambda: self.open_connection(check_same_thread=False), pool_size)
+        # Поток-писатель берет закрепленное за ним соединение пула: его закроет pool.close()
+        self.writes = WriteQueue(self.pool.local, budget_ms=write_budget_ms, bind=self.pool.bind)
+        self.audit = AuditJournal(self.writes)
+        self.users = UserRepository(self.pool, self.writes, self.audit)
+        self.products = ProductRepository(self.pool, self.writes, self.audit)
+        self.customers = CustomerRepository(self.pool, self.writes, self.audit)
+        self.orders = OrderRepository(self.pool, self.writes, self.audit)
+        self.repositories = {repo.TABLE: repo for repo in (self.users, self.products, self.customers, self.orders)}
+        self.init_database()
+
+    def connect(self):
+        """Соединение текущего потока (см. ConnectionPool.local)."""
+        return self.pool.local()
+
+    def open_connection(self, **kwargs):
+        """Открывает новое независимое соединение с настройками профиля."""
+        return self.profile.connect(self.db_name, **kwargs)
+
+    def repository(self, table):
+        """Репозиторий таблицы; для таблиц вне справочников — ValueError."""
+        try:
+            return self.repositories[table]
+        except KeyError:
+            raise ValueError(f"Неизвестная таблица: {table}") from None
+
+    def init_database(self):
+        """Приводит схему базы к актуальной версии (см. migrations.py)."""
+        conn = self.connect()
+        # Схема актуальна — при старте не выполняется никакой DDL
+        if current_version(conn) >= LATEST_VERSION:
+            return
+        for version, description in migrate(conn):
+            print(f"🛠  Миграция схемы БД до версии {version}: {description}")
+
+    def close(self):
+        # Сначала журнал отдает остаток буфера, затем фиксируются записи, оставшиеся в очереди
+        self.audit.close()
+        self.writes.close()
+        self.pool.close()
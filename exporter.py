@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковый экспорт заказов и позиций заказов в CSV, CSV.GZ и Parquet.
+
+Курсор читается пачками фиксированного размера (cursor.arraysize), каждая
+пачка сразу пишется в файл, поэтому память не зависит от объема выгрузки.
+Фильтры по дате и статусу передаются в SQL и используют индексы orders.
+Parquet (колоночный сжатый формат) доступен, если установлены pandas и pyarrow.
+С --archive выгрузка включает заказы, перенесенные в архив (order_archive).
+
+Запуск из командной строки:
+    python exporter.py order_lines lines.csv.gz --from 2024-01-01 --to 2024-12-31 --status Новый
+    python exporter.py orders history.csv.gz --to 2020-12-31 --archive
+"""
+
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+import order_archive
+from connection_profiles import resolve_profile
+
+ARRAYSIZE = 5000            # строк за один fetchmany
+EXPORT_PROFILE = 'reporting'
+
+# Выгрузка -> (колонки с типами для Parquet, FROM-часть запроса с таблицами заказов в {})
+VIEWS = {
+    'orders': (
+        [('order_id', 'o.id', 'int64'), ('customer_id', 'o.customer_id', 'int64'),
+         ('total_amount', 'o.total_amount', 'float64'), ('status', 'o.status', 'string'),
+         ('created_date', 'o.created_date', 'string')],
+        "{orders} o",
+    ),
+    'order_items': (
+        [('item_id', 'oi.id', 'int64'), ('order_id', 'oi.order_id', 'int64'),
+         ('product_id', 'oi.product_id', 'int64'), ('quantity', 'oi.quantity', 'int64'),
+         ('price', 'oi.price', 'float64')],
+        "{orders} o JOIN {order_items} oi ON oi.order_id = o.id",
+    ),
+    'order_lines': (
+        [('order_id', 'o.id', 'int64'), ('created_date', 'o.created_date', 'string'),
+         ('status', 'o.status', 'string'), ('customer_id', 'c.id', 'int64'),
+         ('customer_name', 'c.name', 'string'), ('customer_email', 'c.email', 'string'),
+         ('product_id', 'p.id', 'int64'), ('product_name', 'p.name', 'string'),
+         ('category', 'p.category', 'string'), ('quantity', 'oi.quantity', 'int64'),
+         ('price', 'oi.price', 'float64'), ('line_total', 'oi.quantity * oi.price', 'float64')],
+        """{orders} o
+           JOIN {order_items} oi ON oi.order_id = o.id
+           JOIN customers c ON c.id = o.customer_id
+           JOIN products p ON p.id = oi.product_id""",
+    ),
+}
+FORMATS = ('csv', 'csv.gz', 'parquet')
+# Только оперативная база или она вместе с архивом (представления order_archive.attached)
+_TABLES = {
+    False: {'orders': 'orders', 'order_items': 'order_items'},
+    True: {'orders': 'all_orders', 'order_items': 'all_order_items'},
+}
+
+
+class ExportError(Exception):
+    """Выгрузка не может быть выполнена (формат, зависимости, параметры)."""
+
+
+class ExportCancelled(Exception):
+    """Выгрузка остановлена пользователем; недописанный файл удален."""
+
+
+def build_query(view, date_from=None, date_to=None, statuses=None, archive=False):
+    """Возвращает (sql, params) выгрузки с фильтрами, перенесенными в WHERE.
+
+    archive=True читает заказы через представления оперативной базы и архива.
+    """
+    if view not in VIEWS:
+        raise ExportError(f"Неизвестная выгрузка '{view}'. Доступны: {', '.join(VIEWS)}")
+    columns, source = VIEWS[view]
+    where, params = [], []
+    if date_from:
+        where.append("o.created_date >= ?")
+        params.append(date_from)
+    if date_to:
+        # Дата без времени включает весь день
+        where.append("o.created_date <= ?")
+        params.append(date_to if len(date_to) > 10 else date_to + " 23:59:59")
+    if statuses:
+        where.append(f"o.status IN ({', '.join('?' for _ in statuses)})")
+        params.extend(statuses)
+    sql = f"SELECT {', '.join(expr for _, expr, _ in columns)} FROM {source.format(**_TABLES[archive])}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # Без ORDER BY: сортировка во временном B-дереве материализовала бы всю
+    # выгрузку; строки идут в порядке обхода индекса (по дате при фильтре по дате)
+    return sql, params
+
+
+def format_for(path):
+    """Определяет формат по расширению файла."""
+    lower = path.lower()
+    if lower.endswith('.csv.gz'):
+        return 'csv.gz'
+    if lower.endswith('.parquet'):
+        return 'parquet'
+    if lower.endswith('.csv'):
+        return 'csv'
+    raise ExportError("Файл выгрузки должен иметь расширение .csv, .csv.gz или .parquet")
+
+
+class _CsvSink:
+    def __init__(self, path, columns, compressed):
+        if compressed:
+            self._file = gzip.open(path, 'wt', newline='', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _, _ in columns])
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetSink:
+    """Parquet через pandas/pyarrow: каждая пачка — отдельная группа строк."""
+
+    def __init__(self, path, columns):
+        try:
+            import pandas as pd
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportError("Для выгрузки в Parquet нужны пакеты pandas и pyarrow") from None
+        self._pd, self._pa = pd, pa
+        self._names = [name for name, _, _ in columns]
+        self._dtypes = {name: dtype for name, _, dtype in columns}
+        arrow_types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string()}
+        self._schema = pa.schema([(name, arrow_types[dtype]) for name, _, dtype in columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write(self, rows):
+        frame = self._pd.DataFrame.from_records(rows, columns=self._names)
+        # Целые колонки с NULL pandas приводит к float — явные типы держат схему стабильной
+        frame = frame.astype({name: ('Int64' if dtype == 'int64' else dtype)
+                              for name, dtype in self._dtypes.items()})
+        self._writer.write_table(self._pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+def export(conn, view, path, date_from=None, date_to=None, statuses=None,
+           progress=None, cancelled=None, arraysize=ARRAYSIZE, archive=False):
+    """Выгружает view в файл path; возвращает число записанных строк.
+
+    Файл пишется во временный path + '.part' и переименовывается после успеха.
+    archive=True подключает архив заказов на время выгрузки.
+    """
+    fmt = format_for(path)
+    sql, params = build_query(view, date_from, date_to, statuses, archive)
+    columns = VIEWS[view][0]
+    part_path = path + '.part'
+    sink = _ParquetSink(part_path, columns) if fmt == 'parquet' else _CsvSink(part_path, columns, fmt == 'csv.gz')
+    written = 0
+    try:
+        with order_archive.attached(conn) if archive else nullcontext():
+            cursor = conn.cursor()
+            cursor.arraysize = arraysize
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany()
+                    if not rows:
+                        break
+                    sink.write(rows)
+                    written += len(rows)
+                    if progress:
+                        progress(written)
+                    if cancelled and cancelled():
+                        raise ExportCancelled(f"Выгрузка остановлена после {written} строк")
+            finally:
+                # Незакрытый курсор не дал бы отключить архив
+                cursor.close()
+        sink.close()
+    except BaseException:
+        sink.close()
+        os.remove(part_path)
+        raise
+    os.replace(part_path, path)
+    return written
+
+
+def open_export_connection(db_name, profile=EXPORT_PROFILE):
+    """Соединение для выгрузки с профилем тяжелых отчетов."""
+    return resolve_profile(profile).connect(db_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка заказов в CSV/CSV.GZ/Parquet")
+    parser.add_argument('view', choices=sorted(VIEWS))
+    parser.add_argument('path', help="файл .csv, .csv.gz или .parquet")
+    parser.add_argument('--from', dest='date_from', help="начальная дата YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="конечная дата YYYY-MM-DD (включительно)")
+    parser.add_argument('--status', action='append', help="статус заказа (можно несколько раз)")
+    parser.add_argument('--archive', action='store_true', help="включить заказы из архива")
+    parser.add_argument('--db', default=os.environ.get('ERP_DB_PATH', 'erp_database.db'))
+    parser.add_argument('--profile', default=EXPORT_PROFILE)
+    args = parser.parse_args(argv)
+
+    conn = open_export_connection(args.db, args.profile)
+    started = time.perf_counter()
+    try:
+        written = export(conn, args.view, args.path, args.date_from, args.date_to, args.status,
+                         progress=lambda n: print(f"\r⏳ строк: {n}", end='', flush=True),
+                         archive=args.archive)
+    except ExportError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Выгружено строк: {written} за {elapsed:.1f} с → {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковый импорт товаров и клиентов из CSV/XLSX.
+
+Файл читается построчно, строки проверяются и нормализуются, а затем пишутся
+пачками через executemany — одна транзакция на пачку. Запись идет как upsert
+по естественному ключу: артикул (sku) для товаров, email для клиентов.
+Товар без артикула, заведенный формой или через API, сопоставляется по
+названию и получает артикул из файла; клиент без email — по имени и телефону.
+Строки с ошибками не прерывают импорт, а попадают в файл отклоненных строк.
+Кодировка CSV (UTF-8 или cp1251) определяется по началу файла.
+
+Запуск из командной строки:
+    python importer.py products catalog.csv [--db erp_database.db] [--profile bulk-load]
+"""
+
+import argparse
+import codecs
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+from connection_profiles import resolve_profile
+
+CHUNK_SIZE = 10000          # строк в одной транзакции
+SAMPLE_BYTES = 64 * 1024    # начало CSV, по которому определяются кодировка и разделитель
+IMPORT_PROFILE = 'bulk-load'
+
+
+class ImportFileError(Exception):
+    """Файл не может быть импортирован целиком (формат, заголовок, зависимости)."""
+
+
+class ImportCancelled(Exception):
+    """Импорт остановлен пользователем; уже записанные пачки сохранены."""
+
+    def __init__(self, result):
+        super().__init__("Импорт остановлен пользователем")
+        self.result = result
+
+
+# ------------------ НОРМАЛИЗАЦИЯ СТРОК ------------------
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _number(value, field, cast=float):
+    text = _text(value).replace('\u00a0', '').replace(' ', '').replace(',', '.')
+    if not text:
+        raise ValueError(f"не заполнено поле {field}")
+    try:
+        number = float(text)
+    except ValueError:
+        raise ValueError(f"поле {field} не число: {value!r}") from None
+    if cast is int:
+        # Дробный остаток — ошибка в файле, а не повод молча отбросить дробную часть
+        if not number.is_integer():
+            raise ValueError(f"поле {field} не целое: {value!r}")
+        number = int(number)
+    if number < 0:
+        raise ValueError(f"поле {field} отрицательное: {value!r}")
+    return number
+
+
+def _normalize_product(row, now):
+    name = _text(row.get('name'))
+    if not name:
+        raise ValueError("не заполнено название")
+    # Без артикула естественным ключом служит название товара
+    sku = _text(row.get('sku')) or name
+    price = _number(row.get('price'), 'price')
+    quantity = _number(row.get('quantity', 0) or 0, 'quantity', int)
+    category = _text(row.get('category')) or None
+    return (sku, name, price, quantity, category, now)
+
+
+def _normalize_customer(row, now):
+    name = _text(row.get('name'))
+    if not name:
+        raise ValueError("не заполнено имя клиента")
+    email = _text(row.get('email')).lower() or None
+    if email is not None and '@' not in email:
+        raise ValueError(f"некорректный email: {email!r}")
+    phone = _text(row.get('phone')) or None
+    address = _text(row.get('address')) or None
+    return (name, email, phone, address, now)
+
+
+# Товар без артикула (заведенный формой или через API) получает артикул из файла по названию,
+# если этот артикул еще не занят; дальше upsert по sku обновляет именно его.
+# Унарный плюс в «+sku IS NULL» (и «+email IS NULL» ниже) не дает SQLite искать по
+# уникальному индексу ключа — под NULL там все строки без ключа, — и поиск идет по индексу имени
+_CLAIM_PRODUCT_SKU = """
+    UPDATE products SET sku = ?
+    WHERE id = (SELECT MIN(id) FROM products WHERE name = ? AND +sku IS NULL)
+      AND NOT EXISTS (SELECT 1 FROM products WHERE sku = ?)
+"""
+
+_UPSERT_PRODUCT = """
+    INSERT INTO products (sku, name, price, quantity, category, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(sku) DO UPDATE SET
+        name = excluded.name, price = excluded.price,
+        quantity = excluded.quantity, category = excluded.category
+"""
+
+_UPSERT_CUSTOMER = """
+    INSERT INTO customers (name, email, phone, address, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(email) DO UPDATE SET
+        name = excluded.name, phone = excluded.phone, address = excluded.address
+"""
+
+# Клиент без email: ключ — имя и телефон (NULL совпадает с NULL). Сначала вставляются новые,
+# затем адрес обновляется у всех совпавших — повтор клиента в пачке оставляет последний адрес
+_INSERT_CUSTOMER_WITHOUT_EMAIL = """
+    INSERT INTO customers (name, email, phone, address, created_at)
+    SELECT ?, NULL, ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM customers WHERE name = ? AND phone IS ? AND +email IS NULL)
+"""
+
+_UPDATE_CUSTOMER_WITHOUT_EMAIL = """
+    UPDATE customers SET address = ? WHERE name = ? AND phone IS ? AND +email IS NULL
+"""
+
+
+def _write_products(conn, rows):
+    conn.executemany(_CLAIM_PRODUCT_SKU, [(sku, name, sku) for sku, name, *_ in rows])
+    conn.executemany(_UPSERT_PRODUCT, rows)
+
+
+def _write_customers(conn, rows):
+    conn.executemany(_UPSERT_CUSTOMER, [row for row in rows if row[1] is not None])
+    unkeyed = [row for row in rows if row[1] is None]
+    if unkeyed:
+        conn.executemany(_INSERT_CUSTOMER_WITHOUT_EMAIL,
+                         [(name, phone, address, now, name, phone) for name, _, phone, address, now in unkeyed])
+        conn.executemany(_UPDATE_CUSTOMER_WITHOUT_EMAIL,
+                         [(address, name, phone) for name, _, phone, address, _ in unkeyed])
+
+
+class ImportSpec:
+    """Описание импортируемой сущности: заголовки, нормализация и запись пачки."""
+
+    def __init__(self, table, aliases, required, normalize, write):
+        self.table = table
+        self.aliases = aliases        # вариант заголовка -> поле
+        self.required = required      # поля, без которых файл не импортируется
+        self.normalize = normalize
+        self.write = write            # write(conn, строки) — upsert пачки в открытой транзакции
+
+
+SPECS = {
+    'products': ImportSpec(
+        'products',
+        aliases={
+            'sku': 'sku', 'артикул': 'sku', 'код': 'sku',
+            'name': 'name', 'название': 'name', 'наименование': 'name', 'товар': 'name',
+            'price': 'price', 'цена': 'price',
+            'quantity': 'quantity', 'qty': 'quantity', 'остаток': 'quantity', 'количество': 'quantity',
+            'category': 'category', 'категория': 'category',
+        },
+        required=('name', 'price'),
+        normalize=_normalize_product,
+        write=_write_products),
+    'customers': ImportSpec(
+        'customers',
+        aliases={
+            'name': 'name', 'имя': 'name', 'компания': 'name', 'имя/компания': 'name', 'клиент': 'name',
+            'email': 'email', 'e-mail': 'email', 'почта': 'email',
+            'phone': 'phone', 'телефон': 'phone',
+            'address': 'address', 'адрес': 'address',
+        },
+        required=('name',),
+        normalize=_normalize_customer,
+        write=_write_customers),
+}
+
+
+# ------------------ ЧТЕНИЕ ФАЙЛОВ ------------------
+
+def _csv_encoding(path):
+    """Кодировка CSV: UTF-8 (с BOM или без), иначе cp1251 — так сохраняет CSV Excel в русской Windows."""
+    with open(path, 'rb') as f:
+        sample = f.read(SAMPLE_BYTES)
+    try:
+        # Неполный многобайтный символ в конце образца — не ошибка
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return 'cp1251'
+    return 'utf-8-sig'
+
+
+def _iter_csv(path):
+    """Строки CSV вместе с долей прочитанного файла (для индикатора прогресса)."""
+    size = os.path.getsize(path) or 1
+    encoding = _csv_encoding(path)
+    with open(path, newline='', encoding=encoding) as f:
+        try:
+            sample = f.read(SAMPLE_BYTES)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(f, dialect)
+            header = next(reader, None)
+            yield header, 0.0
+            for row in reader:
+                yield row, f.buffer.tell() / size
+        except UnicodeDecodeError as e:
+            # Начало файла было в UTF-8, а дальше встретились байты другой кодировки
+            raise ImportFileError(f"Файл не в кодировке {encoding}: {e.reason} "
+                                  f"(байт {f.buffer.tell()}); сохраните его в UTF-8") from None
+
+
+def _iter_xlsx(path):
+    """Строки первого листа XLSX в режиме read_only (без загрузки книги в память)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("Для импорта XLSX установите пакет openpyxl") from None
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = sheet.max_row or 0
+        for index, row in enumerate(sheet.iter_rows(values_only=True)):
+            yield list(row), (index / total if total else 0.0)
+    finally:
+        workbook.close()
+
+
+def _iter_file(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        return _iter_xlsx(path)
+    if ext in ('.csv', '.txt', '.tsv'):
+        return _iter_csv(path)
+    raise ImportFileError(f"Неподдерживаемый формат файла: {ext}")
+
+
+def _map_header(header, spec):
+    if not header:
+        raise ImportFileError("Файл пуст: нет строки заголовков")
+    fields = [spec.aliases.get(_text(name).lower()) for name in header]
+    missing = [field for field in spec.required if field not in fields]
+    if missing:
+        raise ImportFileError(f"В заголовке нет обязательных колонок: {', '.join(missing)}")
+    return fields
+
+
+# ------------------ ИМПОРТ ------------------
+
+class ImportResult:
+    """Итоги импорта."""
+
+    def __init__(self):
+        self.processed = 0
+        self.written = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.reject_path = None
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        text = (f"Обработано строк: {self.processed}, записано: {self.written}, "
+                f"отклонено: {self.rejected} за {self.elapsed:.1f} с "
+                f"({self.rows_per_second:,.0f} строк/с)")
+        if self.reject_path:
+            text += f"\nОтклоненные строки: {self.reject_path}"
+        return text
+
+
+class _RejectWriter:
+    """Файл отклоненных строк; создается только при первой ошибке."""
+
+    def __init__(self, source_path):
+        base, _ = os.path.splitext(source_path)
+        self.path = base + '.rejects.csv'
+        self._file = None
+        self._writer = None
+
+    def write(self, line_no, reason, header, row):
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8-sig')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['line', 'error'] + [_text(h) for h in header])
+        self._writer.writerow([line_no, reason] + ['' if v is None else v for v in row])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        return self.path if self._file is not None else None
+
+
+def import_file(conn, entity, path, progress=None, cancelled=None, chunk_size=CHUNK_SIZE):
+    """Импортирует файл path в таблицу entity ('products' или 'customers').
+
+    progress(processed, fraction) вызывается после каждой пачки;
+    cancelled() — если возвращает True, импорт останавливается после текущей пачки.
+    """
+    spec = SPECS[entity]
+    result = ImportResult()
+    started = time.perf_counter()
+    rows = _iter_file(path)
+    header, _ = next(rows, (None, 0.0))
+    fields = _map_header(header, spec)
+    rejects = _RejectWriter(path)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    batch = []
+    fraction = 0.0
+
+    def flush():
+        with conn:
+            spec.write(conn, batch)
+        result.written += len(batch)
+        batch.clear()
+        if progress:
+            progress(result.processed, fraction)
+
+    try:
+        for line_no, (row, fraction) in enumerate(rows, start=2):
+            if not any(_text(v) for v in row):
+                continue
+            result.processed += 1
+            record = {field: value for field, value in zip(fields, row) if field}
+            try:
+                batch.append(spec.normalize(record, now))
+            except ValueError as e:
+                result.rejected += 1
+                rejects.write(line_no, str(e), header, row)
+            if len(batch) >= chunk_size:
+                flush()
+                if cancelled and cancelled():
+                    raise ImportCancelled(result)
+        if batch:
+            flush()
+    finally:
+        result.reject_path = rejects.close()
+        result.elapsed = time.perf_counter() - started
+    if progress:
+        progress(result.processed, 1.0)
+    return result
+
+
+def open_import_connection(db_name, profile=IMPORT_PROFILE):
+    """Соединение для импорта с профилем массовой загрузки."""
+    return resolve_profile(profile).connect(db_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковый импорт товаров и клиентов из CSV/XLSX")
+    parser.add_argument('entity', choices=sorted(SPECS))
+    parser.add_argument('path')
+    parser.add_argument('--db', default=os.environ.get('ERP_DB_PATH', 'erp_database.db'))
+    parser.add_argument('--profile', default=IMPORT_PROFILE)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    # Схема должна быть актуальной (колонка sku появилась в миграции 4)
+    from main import Database
+    Database(args.db, args.profile)
+    conn = open_import_connection(args.db, args.profile)
+
+    def report(processed, fraction):
+        print(f"\r⏳ {fraction:6.1%}  строк: {processed}", end='', flush=True)
+    try:
+        result = import_file(conn, args.entity, args.path, progress=report, chunk_size=args.chunk_size)
+    except ImportFileError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"\n✅ {result}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
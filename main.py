@@ -5,111 +5,92 @@
 Реализованы CRUD-операции для пользователей, товаров, клиентов и заказов.
 """
 
+import argparse
+import json
+import os
+import queue
+import threading
+import time
 import tkinter as tk
-from tkinter import messagebox, ttk, simpledialog
+from tkinter import filedialog, messagebox, ttk, simpledialog
 import sqlite3
 from datetime import datetime
 
-DB_NAME = 'erp_database.db'
-
-
-class Database:
-    """Класс для работы с базой данных SQLite: инициализация и основные операции."""
-
-    def __init__(self, db_name=DB_NAME):
-        self.db_name = db_name
-        self.conn = None
-        self.init_database()
-
-    def connect(self):
-        if not self.conn:
-            self.conn = sqlite3.connect(self.db_name)
-        return self.conn
+import startup_timing  # первым из модулей приложения: от него отсчитывается фаза импорта
+import order_archive
+import query_trace
+import sales_analytics
+import segmentation
+import stock_reservations
+from connection_profiles import PROFILES, describe_connection, resolve_profile
+from data_access import DataAccess
+from exporter import ExportCancelled, ExportError, export, format_for, open_export_connection
+from importer import ImportCancelled, ImportFileError, import_file, open_import_connection
+from order_lines import OrderLinesCache, fetch_order_lines
+from order_service import OrderService, OrderError
+from query_executor import QueryExecutor
+from record_picker import RecordPicker
+from reference_cache import ReferenceCache
+from sales_charts import render_dashboard
+from search import lookup, search
+from stats_engine import StatisticsEngine
+from stats_summary import rebuild_summary
+from virtual_grid import KeysetQuery, VirtualTreeview
+
+DB_NAME = os.environ.get('ERP_DB_PATH', 'erp_database.db')
+SCREEN_SCOPE = 'screen'  # область фоновых загрузок текущего экрана
+SEARCH_SCOPE = 'search'  # область фоновых запросов глобального поиска
+SEARCH_DEBOUNCE_MS = 250  # пауза в наборе, после которой выполняется поиск
+STATS_TEXT_WIDTH = 380   # ширина колонки показателей на экране статистики, px
+CHART_MIN_SIZE = (420, 320)  # наименьший размер картинки графиков, px
+OPEN_FALLBACK_MS = 500   # мс: база открывается по таймеру, если окно так и не получило <Expose>
+# действие журнала изменений -> подпись на экране журнала
+AUDIT_ACTIONS = {'insert': 'Добавление', 'update': 'Изменение', 'delete': 'Удаление'}
+# таблица -> атрибут SimpleERP с ее виртуальной таблицей на экране
+GRIDS = {'users': 'users_grid', 'products': 'products_grid', 'customers': 'customers_grid', 'orders': 'orders_grid'}
+# Выборка экрана заказов (заказ с именем клиента); используется и в benchmarks
+ORDERS_QUERY = KeysetQuery(
+    select=['o.id', 'c.name', 'o.total_amount', 'o.status', 'o.created_date'],
+    source='orders o JOIN customers c ON o.customer_id = c.id',
+    sort_exprs={'id': 'o.id', 'customer': 'c.name', 'total_amount': 'o.total_amount',
+                'status': 'o.status', 'created_date': 'o.created_date'},
+    key='o.id'
+)
+
+
+class Database(DataAccess):
+    """База данных интерфейса: общий слой доступа (data_access) с уведомлениями об изменениях.
+
+    insert/update/delete/fetch_all принимают имя таблицы и проверяют колонки
+    по белому списку ее репозитория; ошибки показываются пользователю.
+    """
+
+    def __init__(self, db_name=DB_NAME, profile=None):
+        self.listeners = []   # подписчики на изменения через insert/update/delete
+        super().__init__(db_name, profile)
+
+    def add_listener(self, listener):
+        """Подписывает listener(table, action, record_id, values) на изменения через insert/update/delete."""
+        self.listeners.append(listener)
+
+    def notify(self, table, action, record_id, values=None):
+        for listener in self.listeners:
+            listener(table, action, record_id, values or {})
+
+    def describe_profile(self):
+        """Имя активного профиля и фактические значения PRAGMA основного соединения."""
+        return {'profile': self.profile.name, **describe_connection(self.connect())}
 
     def init_database(self):
-        """Создает соединение и таблицы, если они не существуют."""
         try:
-            conn = self.connect()
-            cursor = conn.cursor()
-            # Создание таблицы пользователей
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    full_name TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    email TEXT UNIQUE,
-                    password TEXT NOT NULL,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            # Создание таблицы продуктов
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    price REAL NOT NULL DEFAULT 0,
-                    quantity INTEGER NOT NULL DEFAULT 0,
-                    category TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            # Создание таблицы клиентов
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS customers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    email TEXT UNIQUE,
-                    phone TEXT,
-                    address TEXT,
-                    created_at TEXT NOT NULL
-                )
-            """)
-            # Создание таблицы заказов
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    customer_id INTEGER NOT NULL,
-                    total_amount REAL NOT NULL DEFAULT 0,
-                    status TEXT NOT NULL,
-                    created_date TEXT NOT NULL,
-                    FOREIGN KEY(customer_id) REFERENCES customers(id)
-                )
-            """)
-            # Создание таблицы пунктов заказа (OrderItems)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS order_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    order_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL DEFAULT 1,
-                    price REAL NOT NULL DEFAULT 0,
-                    FOREIGN KEY(order_id) REFERENCES orders(id),
-                    FOREIGN KEY(product_id) REFERENCES products(id)
-                )
-            """)
-            conn.commit()
-            # Если база пуста - создадим администратора по умолчанию
-            cursor.execute("SELECT COUNT(*) FROM users")
-            if cursor.fetchone()[0] == 0:
-                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                cursor.execute("""
-                    INSERT INTO users (username, full_name, role, email, password, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, ("admin", "Администратор Системы", "Администратор", "admin@example.com", "admin123", now))
-                conn.commit()
+            super().init_database()
         except Exception as e:
             print(f"❌ Ошибка инициализации БД: {e}")
 
-    def fetch_all(self, table, order_by=None):
-        """Возвращает все записи из таблицы."""
+    def fetch_all(self, table, order_by='id'):
+        """Возвращает все записи таблицы в порядке order_by (имя сортировки репозитория)."""
         try:
-            cursor = self.connect().cursor()
-            query = f"SELECT * FROM {table}"
-            if order_by:
-                query += f" ORDER BY {order_by}"
-            cursor.execute(query)
-            return cursor.fetchall()
+            return self.repository(table).all(order_by)
         except Exception as e:
             messagebox.showerror("Ошибка БД", f"Не удалось получить данные из {table}: {e}")
             return []
@@ -117,66 +98,130 @@ class Database:
     def insert(self, table, columns, values):
         """Вставляет запись в таблицу. columns и values — списки одинаковой длины."""
         try:
-            cursor = self.connect().cursor()
-            cols = ", ".join(columns)
-            placeholders = ", ".join("?" for _ in values)
-            query = f"INSERT INTO {table} ({cols}) VALUES ({placeholders})"
-            cursor.execute(query, values)
-            self.conn.commit()
-            return cursor.lastrowid
+            values = dict(zip(columns, values))
+            record_id = self.repository(table).insert(values)
+            self.notify(table, 'insert', record_id, values)
+            return record_id
         except Exception as e:
             messagebox.showerror("Ошибка БД", f"Не удалось добавить запись в {table}: {e}")
             return None
 
-    def update(self, table, record_id, columns, values):
-        """Обновляет запись по id. columns и values — списки одинаковой длины."""
+    def update(self, table, record_id, columns, values, version=None):
+        """Обновляет запись по id. columns и values — списки одинаковой длины.
+
+        version — версия строки, прочитанная вместе с данными формы: если запись
+        с тех пор изменил другой оператор, она не перезаписывается и возвращается False.
+        """
         try:
-            cursor = self.connect().cursor()
-            set_clause = ", ".join(f"{col}=?" for col in columns)
-            query = f"UPDATE {table} SET {set_clause} WHERE id=?"
-            cursor.execute(query, values + [record_id])
-            self.conn.commit()
+            values = dict(zip(columns, values))
+            updated = self.repository(table).update(record_id, values, version=version)
+            if version is not None:
+                if not updated:
+                    messagebox.showwarning("Конфликт изменений",
+                                           "Запись изменил другой пользователь. Откройте ее заново и повторите.")
+                    return False
+                values['version'] = version + 1
+            self.notify(table, 'update', record_id, values)
+            return True
         except Exception as e:
             messagebox.showerror("Ошибка БД", f"Не удалось обновить запись в {table}: {e}")
+            return False
 
     def delete(self, table, record_id):
         """Удаляет запись по id."""
         try:
-            cursor = self.connect().cursor()
-            query = f"DELETE FROM {table} WHERE id=?"
-            cursor.execute(query, (record_id,))
-            self.conn.commit()
+            self.repository(table).delete(record_id)
+            self.notify(table, 'delete', record_id)
         except Exception as e:
             messagebox.showerror("Ошибка БД", f"Не удалось удалить запись из {table}: {e}")
 
 
 class SimpleERP:
-    """Основной класс ERP приложения: создает интерфейс и связывает его с БД."""
+    """Основной класс ERP приложения: создает интерфейс и связывает его с БД.
+
+    Окно с оболочкой интерфейса рисуется до открытия базы: первая отрисовка
+    не зависит ни от размера базы, ни от миграции схемы. База открывается
+    сразу после нее (open_database), а кнопки модулей включаются, когда она готова.
+    Если окно не получает <Expose> (запущено свернутым, на другом рабочем
+    столе), база открывается по таймеру OPEN_FALLBACK_MS.
+    """
 
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db_name=DB_NAME, profile=None, startup=None, startup_report=False):
+        self.db_name = db_name
+        self.profile_name = profile
+        self.startup = startup or startup_timing.StartupTimer()
+        self.startup_report = startup_report
+        self.db = None
+        self.database_requested = False
         self.root = tk.Tk()
         self.root.title("💼 ERP Система v3.0")
         self.root.geometry("900x650")
         self.root.configure(bg='#f0f0f0')
 
-        # Текущий пользователь (по умолчанию admin)
-        self.current_user = self.get_default_user()
-
         # Создаем интерфейс
         self.create_interface()
+        # Закрытие окна крестиком — тот же выход, что и кнопкой: база закрывается, журнал дописывается
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
+        self.startup.mark("окно и оболочка интерфейса")
+        self.paint_binding = self.root.bind('<Expose>', self.on_first_paint)
+        self.open_after_id = self.root.after(OPEN_FALLBACK_MS, self.open_database)
+
+    def on_first_paint(self, event):
+        """Окно показано: виджеты дорисовываются в ближайшем простое, за ними открывается база."""
+        self.unbind_first_paint()
+        self.root.after_idle(self.open_database)
+
+    def unbind_first_paint(self):
+        if self.paint_binding is not None:
+            self.root.unbind('<Expose>', self.paint_binding)
+            self.paint_binding = None
+
+    def open_database(self):
+        """Открывает базу (проверка версии схемы — один PRAGMA) и показывает главный экран.
+
+        Вызывается после первой отрисовки и по резервному таймеру; выполняется один раз.
+        """
+        if self.database_requested:
+            return
+        self.database_requested = True
+        self.root.after_cancel(self.open_after_id)
+        self.startup.mark("первая отрисовка" if self.paint_binding is None else "ожидание отрисовки (таймер)")
+        self.unbind_first_paint()
+        try:
+            self.db = Database(self.db_name, self.profile_name)
+        except Exception as e:
+            messagebox.showerror("Ошибка БД", f"Не удалось открыть базу данных {self.db_name}: {e}")
+            self.root.destroy()
+            return
+        self.order_service = OrderService(self.db)
+        self.stats = StatisticsEngine(self.db)
+        self.refs = ReferenceCache(self.db)
+        self.order_lines = OrderLinesCache()
+        self.db.add_listener(self.on_db_change)
+        self.executor = QueryExecutor(self.root, self.db.open_connection,
+                                      on_busy=self.set_busy, on_error=self.show_db_error)
+        self.startup.mark("открытие базы данных")
+
+        # Текущий пользователь (по умолчанию admin)
+        self.current_user = self.get_default_user()
+        # Изменения из интерфейса записываются в журнал от имени текущего пользователя
+        self.db.audit.user = self.current_user['username']
+        self.update_user_info()
+        for widget in self.module_buttons + [self.search_entry]:
+            widget.config(state='normal')
+        self.show_welcome()
+        self.startup.mark("пользователь и главный экран")
 
     def get_default_user(self):
         """Загружает первую запись пользователя (admin) при старте."""
-        users = self.db.fetch_all('users', order_by="id LIMIT 1")
-        if users:
-            uid, username, full_name, role, email, _, _ = users[0]
+        user = self.db.users.first()
+        if user:
             return {
-                'id': uid,
-                'username': username,
-                'full_name': full_name,
-                'role': role,
-                'email': email
+                'id': user.id,
+                'username': user.username,
+                'full_name': user.full_name,
+                'role': user.role,
+                'email': user.email
             }
         return {
             'id': None, 'username': 'guest', 'full_name': 'Гость', 'role': 'Гость', 'email': ''
@@ -210,7 +255,17 @@ class SimpleERP:
             fg='white'
         )
         self.user_info_label.pack(pady=8)
-        self.update_user_info()
+        self.busy_bar = ttk.Progressbar(user_frame, mode='indeterminate', length=120)
+
+        # Глобальный поиск: запрос уходит после паузы в наборе
+        self.search_var = tk.StringVar()
+        self.search_after_id = None
+        self.search_entry = tk.Entry(user_frame, textvariable=self.search_var, width=28, font=('Arial', 10),
+                                     state='disabled')
+        self.search_entry.place(relx=0.0, rely=0.5, x=10, anchor='w')
+        self.search_entry.bind('<Escape>', lambda e: self.search_var.set(''))
+        self.search_var.trace_add('write', lambda *args: self.schedule_search())
+        self.search_tree = None
 
         # Панель кнопок модулей
         buttons_frame = tk.Frame(self.root, bg='#f0f0f0')
@@ -221,8 +276,11 @@ class SimpleERP:
             ("👤 Клиенты", self.show_customers, '#e67e22'),
             ("📋 Заказы", self.show_orders, '#9b59b6'),
             ("📊 Статистика", self.show_stats, '#34495e'),
+            ("📜 Журнал", self.show_audit, '#16a085'),
             ("❌ Выход", self.exit_app, '#e74c3c')
         ]
+        # Модули доступны, когда база открыта; выход — сразу
+        self.module_buttons = []
         for i, (text, command, color) in enumerate(modules):
             btn = tk.Button(
                 buttons_frame,
@@ -233,28 +291,67 @@ class SimpleERP:
                 fg='white',
                 relief='flat',
                 width=14,
-                height=2
+                height=2,
+                state='normal' if command == self.exit_app else 'disabled'
             )
-            row = i // 3
-            col = i % 3
+            if command != self.exit_app:
+                self.module_buttons.append(btn)
+            row = i // 4
+            col = i % 4
             btn.grid(row=row, column=col, padx=8, pady=5, sticky='ew')
             buttons_frame.grid_columnconfigure(col, weight=1)
 
         # Основная область для отображения модулей
         self.content_frame = tk.Frame(self.root, bg='white', relief='sunken', bd=2)
         self.content_frame.pack(fill='both', expand=True, padx=20, pady=(0, 20))
-        self.show_welcome()
+        tk.Label(self.content_frame, text="⏳ Подключение к базе данных...", font=('Arial', 13),
+                 bg='white', fg='#34495e').pack(pady=40)
 
     def update_user_info(self):
         """Обновление информации о пользователе и текущего времени."""
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        text = f"👤 {self.current_user['full_name']} | {self.current_user['role']} | Время: {now}"
+        text = (f"👤 {self.current_user['full_name']} | {self.current_user['role']} | "
+                f"БД: {os.path.basename(self.db.db_name)} [{self.db.profile.name}] | Время: {now}")
         self.user_info_label.config(text=text)
         # Обновляем каждые 1 секунду
         self.root.after(1000, self.update_user_info)
 
+    def on_db_change(self, table, action, record_id, values):
+        """Изменение через Database: точечно обновляет строку на экране и сбрасывает зависимые кэши."""
+        if table == 'products':
+            # Название товара в кэшированных позициях заказов устаревает
+            self.order_lines.clear()
+        if table in GRIDS:
+            self.refresh_visible_rows(GRIDS[table], [record_id])
+
+    def set_busy(self, busy):
+        """Показывает или скрывает индикатор фоновой работы с базой."""
+        if busy:
+            self.busy_bar.place(relx=1.0, rely=0.5, x=-10, anchor='e')
+            self.busy_bar.start(15)
+        else:
+            self.busy_bar.stop()
+            self.busy_bar.place_forget()
+
+    def show_db_error(self, error):
+        """Сообщает об ошибке фонового задания."""
+        if isinstance(error, OrderError):
+            messagebox.showerror("Ошибка заказа", str(error))
+        else:
+            messagebox.showerror("Ошибка БД", f"Не удалось выполнить операцию с базой данных: {error}")
+
+    def fetch_async(self, sql, params, callback):
+        """Выборка для таблиц текущего экрана через фоновый исполнитель."""
+        self.executor.query(sql, params, on_done=callback, scope=SCREEN_SCOPE)
+
+    @staticmethod
+    def is_alive(widget):
+        """Проверяет, что виджет экрана еще не уничтожен переключением модуля."""
+        return widget is not None and bool(widget.winfo_exists())
+
     def clear_content(self):
-        """Удаляет все виджеты из content_frame."""
+        """Отменяет фоновые загрузки экрана и удаляет все виджеты из content_frame."""
+        self.executor.cancel(SCREEN_SCOPE)
         for widget in self.content_frame.winfo_children():
             widget.destroy()
 
@@ -270,34 +367,86 @@ class SimpleERP:
         )
         welcome_label.pack(pady=40)
 
-        # Быстрая статистика
-        stats = {}
-        stats['users'] = len(self.db.fetch_all('users'))
-        stats['products'] = len(self.db.fetch_all('products'))
-        stats['customers'] = len(self.db.fetch_all('customers'))
-        stats['orders'] = len(self.db.fetch_all('orders'))
-        cursor = self.db.connect().cursor()
-        cursor.execute("SELECT SUM(total_amount) FROM orders")
-        stats['total_sales'] = cursor.fetchone()[0] or 0
-
-        stats_text = (
-            f"📊 СОСТОЯНИЕ СИСТЕМЫ:\n\n"
-            f"👥 Пользователей: {stats['users']}\n"
-            f"📦 Товаров: {stats['products']}\n"
-            f"👤 Клиентов: {stats['customers']}\n"
-            f"📋 Заказов: {stats['orders']}\n"
-            f"💰 Общая сумма продаж: {stats['total_sales']:.2f} ₽\n\n"
-            "🎯 Система готова к работе!"
-        )
+        # Быстрая статистика читается в фоне из сводной строки stats_summary
         stats_label = tk.Label(
             self.content_frame,
-            text=stats_text,
+            text="⏳ Загрузка статистики...",
             font=('Arial', 13),
             bg='white',
             fg='#34495e',
             justify='left'
         )
         stats_label.pack(pady=20)
+        self.executor.submit(lambda conn: self.stats.welcome(),
+                             on_done=lambda stats: self.render_welcome_stats(stats_label, stats),
+                             scope=SCREEN_SCOPE)
+
+    def render_welcome_stats(self, stats_label, stats):
+        """Выводит быструю статистику на приветственный экран."""
+        stats_text = (
+            f"📊 СОСТОЯНИЕ СИСТЕМЫ:\n\n"
+            f"👥 Пользователей: {stats['users']}\n"
+            f"📦 Товаров: {stats['products']}\n"
+            f"👤 Клиентов: {stats['customers']}\n"
+            f"📋 Заказов: {stats['orders']}\n"
+            f"💰 Общая сумма продаж: {stats['total_sales']:.2f} ₽\n"
+        )
+        if stats['by_status']:
+            stats_text += "\n📌 Заказы по статусам:\n" + "".join(
+                f"   • {status}: {count}\n" for status, count in stats['by_status'].items())
+        stats_text += "\n🎯 Система готова к работе!"
+        stats_label.config(text=stats_text)
+        if self.startup is not None:
+            # Первый показ главного экрана завершает запуск
+            self.startup.mark("данные главного экрана")
+            if self.startup_report:
+                print(self.startup.report())
+            self.startup = None
+
+    # ------------------ ГЛОБАЛЬНЫЙ ПОИСК ------------------
+
+    def schedule_search(self):
+        """Откладывает поиск до паузы в наборе; предыдущий запрос отменяется."""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.run_search)
+
+    def run_search(self):
+        """Выполняет поиск по введенной строке в рабочем потоке."""
+        self.search_after_id = None
+        text = self.search_var.get().strip()
+        self.executor.cancel(SEARCH_SCOPE)
+        if not text:
+            return
+        self.executor.submit(lambda conn: search(conn, text),
+                             on_done=lambda hits: self.show_search_results(text, hits),
+                             scope=SEARCH_SCOPE)
+
+    def show_search_results(self, text, hits):
+        """Показывает результаты поиска; открывает экран результатов при первом запросе."""
+        if text != self.search_var.get().strip():
+            return  # пока шел запрос, строку уже изменили
+        if not self.is_alive(self.search_tree):
+            self.clear_content()
+            tk.Label(self.content_frame, text="🔎 РЕЗУЛЬТАТЫ ПОИСКА", font=('Arial', 16, 'bold'),
+                     bg='white', fg='#2c3e50').pack(pady=15)
+            self.search_label = tk.Label(self.content_frame, text="", font=('Arial', 10), bg='white', fg='#7f8c8d')
+            self.search_label.pack()
+            columns = ('kind', 'id', 'title', 'details')
+            headings = {'kind': 'Раздел', 'id': 'ID', 'title': 'Название / имя', 'details': 'Подробности'}
+            self.search_tree = ttk.Treeview(self.content_frame, columns=columns, show='headings')
+            for col in columns:
+                self.search_tree.heading(col, text=headings[col])
+                self.search_tree.column(col, width=100, anchor='center')
+            self.search_tree.column('title', width=220, anchor='w')
+            self.search_tree.column('details', width=360, anchor='w')
+            self.search_tree.pack(fill='both', expand=True, padx=20, pady=10)
+        kinds = {'orders': 'Заказы', 'customers': 'Клиенты', 'products': 'Товары', 'users': 'Пользователи'}
+        self.search_tree.delete(*self.search_tree.get_children())
+        for kind, record_id, title, details in hits:
+            number = f"#{record_id:04d}" if kind == 'orders' else record_id
+            self.search_tree.insert('', 'end', values=(kinds[kind], number, title, details))
+        self.search_label.config(text=f"«{text}»: найдено {len(hits)}" if hits else f"«{text}»: ничего не найдено")
 
     # ------------------ МОДУЛЬ: УПРАВЛЕНИЕ ПОЛЬЗОВАТЕЛЯМИ ------------------
 
@@ -325,28 +474,31 @@ class SimpleERP:
 
         # Таблица пользователей
         columns = ('id', 'username', 'full_name', 'role', 'email', 'created_at')
-        self.users_tree = ttk.Treeview(self.content_frame, columns=columns, show='headings', selectmode='browse')
         headings = {
             'id': 'ID', 'username': 'Логин', 'full_name': 'Полное имя',
             'role': 'Роль', 'email': 'Email', 'created_at': 'Дата создания'
         }
+        query = KeysetQuery(
+            select=list(columns),
+            source='users',
+            sort_exprs={'id': 'id', 'username': 'username', 'full_name': 'full_name', 'role': 'role',
+                        'email': "IFNULL(email, '')", 'created_at': 'created_at'}
+        )
+        self.users_grid = VirtualTreeview(self.content_frame, self.db, query, columns, headings,
+                                          sort=('id', False), fetch=self.fetch_async)
+        self.users_tree = self.users_grid.tree
         for col in columns:
-            self.users_tree.heading(col, text=headings[col])
             self.users_tree.column(col, width=100, anchor='center')
         self.users_tree.column('username', width=120)
         self.users_tree.column('full_name', width=180)
         self.users_tree.column('email', width=180)
-        self.users_tree.pack(fill='both', expand=True, padx=20, pady=10)
+        self.users_grid.pack(fill='both', expand=True, padx=20, pady=10)
 
         self.load_users()
 
     def load_users(self):
-        """Загружает список пользователей в таблицу."""
-        for row in self.users_tree.get_children():
-            self.users_tree.delete(row)
-        users = self.db.fetch_all('users', order_by='id')
-        for user in users:
-            self.users_tree.insert('', 'end', values=user)
+        """Загружает первую страницу пользователей в таблицу."""
+        self.users_grid.reload()
 
     def add_user(self):
         """Окно для добавления нового пользователя."""
@@ -357,7 +509,6 @@ class SimpleERP:
             self.db.insert('users',
                            ['username', 'full_name', 'role', 'email', 'password', 'created_at'],
                            [username, full_name, role, email, password, now])
-            self.load_users()
 
     def edit_user(self):
         """Редактирует выбранного пользователя."""
@@ -365,15 +516,19 @@ class SimpleERP:
         if not selected:
             messagebox.showwarning("Выбор пользователя", "Пожалуйста, выберите пользователя для редактирования.")
             return
-        values = self.users_tree.item(selected[0], 'values')
-        user_id = values[0]
-        dialog = UserForm(self.root, "Редактировать пользователя", initial=values[1:])
+        user_id = self.users_tree.item(selected[0], 'values')[0]
+        user = self.refs.get('users', user_id)
+        if user is None:
+            messagebox.showwarning("Выбор пользователя", "Пользователь уже удален.")
+            self.users_grid.refresh_rows([user_id])
+            return
+        initial = (user['username'], user['full_name'], user['role'], user['email'] or "", user['password'])
+        dialog = UserForm(self.root, "Редактировать пользователя", initial=initial)
         if dialog.result:
             username, full_name, role, email, password = dialog.result
             self.db.update('users', user_id,
                            ['username', 'full_name', 'role', 'email', 'password'],
                            [username, full_name, role, email, password])
-            self.load_users()
 
     def delete_user(self):
         """Удаляет выбранного пользователя после подтверждения."""
@@ -385,7 +540,6 @@ class SimpleERP:
         user_id, username = values[0], values[1]
         if messagebox.askyesno("Удалить пользователя", f"Удалить пользователя '{username}'?"):
             self.db.delete('users', user_id)
-            self.load_users()
 
     # ------------------ МОДУЛЬ: УПРАВЛЕНИЕ ТОВАРАМИ ------------------
 
@@ -410,31 +564,48 @@ class SimpleERP:
                   font=('Arial', 11, 'bold')).pack(side='left', padx=5)
         tk.Button(btn_frame, text="Удалить", command=self.delete_product, bg='#e74c3c', fg='white',
                   font=('Arial', 11, 'bold')).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="Импорт", command=lambda: self.import_data('products'), bg='#3498db', fg='white',
+                  font=('Arial', 11, 'bold')).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="ABC/XYZ", command=self.recompute_segments, bg='#34495e', fg='white',
+                  font=('Arial', 11, 'bold')).pack(side='left', padx=5)
 
-        # Таблица товаров
-        columns = ('id', 'name', 'price', 'quantity', 'category', 'created_at')
-        self.products_tree = ttk.Treeview(self.content_frame, columns=columns, show='headings', selectmode='browse')
+        # Таблица товаров; класс ABC/XYZ — из последнего расчета segmentation.py
+        columns = ('id', 'name', 'price', 'quantity', 'category', 'created_at', 'abc_xyz')
         headings = {
             'id': 'ID', 'name': 'Название', 'price': 'Цена (₽)',
-            'quantity': 'Остаток', 'category': 'Категория', 'created_at': 'Дата создания'
+            'quantity': 'Остаток', 'category': 'Категория', 'created_at': 'Дата создания', 'abc_xyz': 'ABC/XYZ'
         }
+        query = KeysetQuery(
+            select=['p.id', 'p.name', 'p.price', 'p.quantity', 'p.category', 'p.created_at',
+                    "IFNULL(s.abc || s.xyz, '')"],
+            source='products p LEFT JOIN product_segments s ON s.product_id = p.id',
+            sort_exprs={'id': 'p.id', 'name': 'p.name', 'price': 'p.price', 'quantity': 'p.quantity',
+                        'category': "IFNULL(p.category, '')", 'created_at': 'p.created_at',
+                        'abc_xyz': "IFNULL(s.abc || s.xyz, '')"},
+            key='p.id'
+        )
+        self.products_grid = VirtualTreeview(self.content_frame, self.db, query, columns, headings,
+                                             sort=('name', False), formatter=self.format_product,
+                                             fetch=self.fetch_async)
+        self.products_tree = self.products_grid.tree
         for col in columns:
-            self.products_tree.heading(col, text=headings[col])
             self.products_tree.column(col, width=100, anchor='center')
         self.products_tree.column('name', width=180)
         self.products_tree.column('category', width=120)
-        self.products_tree.pack(fill='both', expand=True, padx=20, pady=10)
+        self.products_tree.column('abc_xyz', width=70)
+        self.products_grid.pack(fill='both', expand=True, padx=20, pady=10)
 
         self.load_products()
 
+    @staticmethod
+    def format_product(prod):
+        """Готовит строку товара для отображения в таблице."""
+        pid, name, price, qty, category, created, segment = prod
+        return (pid, name, f"{price:.2f}", qty, category, created, segment)
+
     def load_products(self):
-        """Загружает список товаров в таблицу."""
-        for row in self.products_tree.get_children():
-            self.products_tree.delete(row)
-        products = self.db.fetch_all('products', order_by='name')
-        for prod in products:
-            pid, name, price, qty, category, created = prod
-            self.products_tree.insert('', 'end', values=(pid, name, f"{price:.2f}", qty, category, created))
+        """Загружает первую страницу товаров в таблицу."""
+        self.products_grid.reload()
 
     def add_product(self):
         """Окно для добавления нового товара."""
@@ -445,7 +616,6 @@ class SimpleERP:
             self.db.insert('products',
                            ['name', 'price', 'quantity', 'category', 'created_at'],
                            [name, price, quantity, category, now])
-            self.load_products()
 
     def edit_product(self):
         """Редактирует выбранный товар."""
@@ -453,17 +623,20 @@ class SimpleERP:
         if not selected:
             messagebox.showwarning("Выбор товара", "Пожалуйста, выберите товар для редактирования.")
             return
-        values = self.products_tree.item(selected[0], 'values')
-        product_id = values[0]
-        # Приводим price к float, quantity к int
-        initial = (values[1], float(values[2]), int(values[3]), values[4])
+        product_id = self.products_tree.item(selected[0], 'values')[0]
+        product = self.refs.get('products', product_id)
+        if product is None:
+            messagebox.showwarning("Выбор товара", "Товар уже удален.")
+            self.products_grid.refresh_rows([product_id])
+            return
+        initial = (product['name'], product['price'], product['quantity'], product['category'] or "")
         dialog = ProductForm(self.root, "Редактировать товар", initial=initial)
         if dialog.result:
             name, price, quantity, category = dialog.result
-            self.db.update('products', product_id,
-                           ['name', 'price', 'quantity', 'category'],
-                           [name, price, quantity, category])
-            self.load_products()
+            # Остаток мог измениться, пока форма была открыта: запись — только при той же версии
+            if not self.db.update('products', product_id, ['name', 'price', 'quantity', 'category'],
+                                  [name, price, quantity, category], version=product['version']):
+                self.products_grid.refresh_rows([product_id])
 
     def delete_product(self):
         """Удаляет выбранный товар после подтверждения."""
@@ -475,7 +648,18 @@ class SimpleERP:
         product_id, name = values[0], values[1]
         if messagebox.askyesno("Удалить товар", f"Удалить товар '{name}'?"):
             self.db.delete('products', product_id)
-            self.load_products()
+
+    def import_data(self, entity):
+        """Импортирует товары или клиентов из CSV/XLSX с индикатором прогресса."""
+        path = filedialog.askopenfilename(
+            parent=self.root,
+            title="Файл для импорта",
+            filetypes=[("CSV и Excel", "*.csv *.xlsx"), ("CSV", "*.csv"), ("Excel", "*.xlsx")]
+        )
+        if not path:
+            return
+        ImportDialog(self.root, self.db, entity, path)
+        self.reload_visible_grids(f"{entity}_grid")
 
     # ------------------ МОДУЛЬ: УПРАВЛЕНИЕ КЛИЕНТАМИ ------------------
 
@@ -500,31 +684,44 @@ class SimpleERP:
                   font=('Arial', 11, 'bold')).pack(side='left', padx=5)
         tk.Button(btn_frame, text="Удалить", command=self.delete_customer, bg='#e74c3c', fg='white',
                   font=('Arial', 11, 'bold')).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="Импорт", command=lambda: self.import_data('customers'), bg='#3498db', fg='white',
+                  font=('Arial', 11, 'bold')).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="RFM", command=self.recompute_segments, bg='#34495e', fg='white',
+                  font=('Arial', 11, 'bold')).pack(side='left', padx=5)
 
-        # Таблица клиентов
-        columns = ('id', 'name', 'email', 'phone', 'address', 'created_at')
-        self.customers_tree = ttk.Treeview(self.content_frame, columns=columns, show='headings', selectmode='browse')
+        # Таблица клиентов; баллы и сегмент RFM — из последнего расчета segmentation.py
+        columns = ('id', 'name', 'email', 'phone', 'address', 'created_at', 'rfm', 'segment')
         headings = {
             'id': 'ID', 'name': 'Имя/Компания', 'email': 'Email',
-            'phone': 'Телефон', 'address': 'Адрес', 'created_at': 'Дата создания'
+            'phone': 'Телефон', 'address': 'Адрес', 'created_at': 'Дата создания',
+            'rfm': 'RFM', 'segment': 'Сегмент'
         }
+        query = KeysetQuery(
+            select=['c.id', 'c.name', 'c.email', 'c.phone', 'c.address', 'c.created_at',
+                    "IFNULL(s.r || s.f || s.m, '')", "IFNULL(s.segment, '')"],
+            source='customers c LEFT JOIN customer_segments s ON s.customer_id = c.id',
+            sort_exprs={'id': 'c.id', 'name': 'c.name', 'email': "IFNULL(c.email, '')",
+                        'phone': "IFNULL(c.phone, '')", 'address': "IFNULL(c.address, '')",
+                        'created_at': 'c.created_at', 'rfm': "IFNULL(s.r || s.f || s.m, '')",
+                        'segment': "IFNULL(s.segment, '')"},
+            key='c.id'
+        )
+        self.customers_grid = VirtualTreeview(self.content_frame, self.db, query, columns, headings,
+                                              sort=('name', False), fetch=self.fetch_async)
+        self.customers_tree = self.customers_grid.tree
         for col in columns:
-            self.customers_tree.heading(col, text=headings[col])
             self.customers_tree.column(col, width=100, anchor='center')
         self.customers_tree.column('name', width=180)
         self.customers_tree.column('email', width=180)
-        self.customers_tree.pack(fill='both', expand=True, padx=20, pady=10)
+        self.customers_tree.column('rfm', width=50)
+        self.customers_tree.column('segment', width=130)
+        self.customers_grid.pack(fill='both', expand=True, padx=20, pady=10)
 
         self.load_customers()
 
     def load_customers(self):
-        """Загружает список клиентов в таблицу."""
-        for row in self.customers_tree.get_children():
-            self.customers_tree.delete(row)
-        customers = self.db.fetch_all('customers', order_by='name')
-        for cust in customers:
-            cid, name, email, phone, address, created = cust
-            self.customers_tree.insert('', 'end', values=(cid, name, email, phone, address, created))
+        """Загружает первую страницу клиентов в таблицу."""
+        self.customers_grid.reload()
 
     def add_customer(self):
         """Окно для добавления нового клиента."""
@@ -535,7 +732,6 @@ class SimpleERP:
             self.db.insert('customers',
                            ['name', 'email', 'phone', 'address', 'created_at'],
                            [name, email, phone, address, now])
-            self.load_customers()
 
     def edit_customer(self):
         """Редактирует выбранного клиента."""
@@ -543,16 +739,19 @@ class SimpleERP:
         if not selected:
             messagebox.showwarning("Выбор клиента", "Пожалуйста, выберите клиента для редактирования.")
             return
-        values = self.customers_tree.item(selected[0], 'values')
-        cust_id = values[0]
-        initial = (values[1], values[2], values[3], values[4])
+        cust_id = self.customers_tree.item(selected[0], 'values')[0]
+        customer = self.refs.get('customers', cust_id)
+        if customer is None:
+            messagebox.showwarning("Выбор клиента", "Клиент уже удален.")
+            self.customers_grid.refresh_rows([cust_id])
+            return
+        initial = tuple(customer[col] or "" for col in ('name', 'email', 'phone', 'address'))
         dialog = CustomerForm(self.root, "Редактировать клиента", initial=initial)
         if dialog.result:
             name, email, phone, address = dialog.result
             self.db.update('customers', cust_id,
                            ['name', 'email', 'phone', 'address'],
                            [name, email, phone, address])
-            self.load_customers()
 
     def delete_customer(self):
         """Удаляет выбранного клиента после подтверждения."""
@@ -564,7 +763,18 @@ class SimpleERP:
         cust_id, name = values[0], values[1]
         if messagebox.askyesno("Удалить клиента", f"Удалить клиента '{name}'?"):
             self.db.delete('customers', cust_id)
-            self.load_customers()
+
+    def recompute_segments(self):
+        """Пересчитывает ABC/XYZ товаров и RFM клиентов в фоне и обновляет открытые таблицы."""
+        def done(summary):
+            self.reload_visible_grids('products_grid', 'customers_grid')
+            messagebox.showinfo("Сегментация", (
+                f"Период: {segmentation.DEFAULT_MONTHS} мес., позиций: {summary['lines']}, "
+                f"заказов: {summary['orders']}\n"
+                f"Товары: {summary['products']}, ABC {summary['abc']}, XYZ {summary['xyz']}\n"
+                f"Клиенты: {summary['customers']}\n"
+                f"Расчет: {sum(summary['ms'].values()) / 1000:.1f} с"))
+        self.executor.submit(lambda conn: segmentation.run(conn, writes=self.db.writes), on_done=done)
 
     # ------------------ МОДУЛЬ: УПРАВЛЕНИЕ ЗАКАЗАМИ ------------------
 
@@ -589,106 +799,151 @@ class SimpleERP:
                   font=('Arial', 11, 'bold')).pack(side='left', padx=5)
         tk.Button(btn_frame, text="Удалить заказ", command=self.delete_order, bg='#e74c3c', fg='white',
                   font=('Arial', 11, 'bold')).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="Экспорт", command=self.export_orders, bg='#3498db', fg='white',
+                  font=('Arial', 11, 'bold')).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="В архив", command=self.archive_orders, bg='#7f8c8d', fg='white',
+                  font=('Arial', 11, 'bold')).pack(side='left', padx=5)
 
         # Таблица заказов
         columns = ('id', 'customer', 'total_amount', 'status', 'created_date')
-        self.orders_tree = ttk.Treeview(self.content_frame, columns=columns, show='headings', selectmode='browse')
         headings = {
             'id': '№ заказа', 'customer': 'Клиент', 'total_amount': 'Сумма (₽)',
             'status': 'Статус', 'created_date': 'Дата создания'
         }
+        self.orders_grid = VirtualTreeview(self.content_frame, self.db, ORDERS_QUERY, columns, headings,
+                                           sort=('created_date', True), formatter=self.format_order,
+                                           fetch=self.fetch_async, children=self.load_order_lines)
+        self.orders_tree = self.orders_grid.tree
         for col in columns:
-            self.orders_tree.heading(col, text=headings[col])
             self.orders_tree.column(col, width=100, anchor='center')
         self.orders_tree.column('customer', width=180)
-        self.orders_tree.pack(fill='both', expand=True, padx=20, pady=10)
+        self.orders_grid.pack(fill='both', expand=True, padx=20, pady=10)
 
         self.load_orders()
 
+    @staticmethod
+    def format_order(order):
+        """Готовит строку заказа для отображения в таблице."""
+        oid, cust_name, total, status, created = order
+        return (f"#{oid:04d}", cust_name, f"{total:.2f}", status, created)
+
     def load_orders(self):
-        """Загружает список заказов в таблицу."""
-        for row in self.orders_tree.get_children():
-            self.orders_tree.delete(row)
-        cursor = self.db.connect().cursor()
-        cursor.execute("""
-            SELECT o.id, c.name, o.total_amount, o.status, o.created_date
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.id
-            ORDER BY o.created_date DESC
-        """)
-        for order in cursor.fetchall():
-            oid, cust_name, total, status, created = order
-            self.orders_tree.insert('', 'end', values=(f"#{oid:04d}", cust_name, f"{total:.2f}", status, created))
+        """Загружает первую страницу заказов в таблицу."""
+        self.orders_grid.reload()
+
+    def load_order_lines(self, key, callback):
+        """Позиции раскрытого заказа: из LRU или фоновым запросом по индексу order_id."""
+        order_id = int(key)
+
+        def deliver(lines):
+            callback([('', f"{name} (#{product_id})", f"{quantity * price:.2f}",
+                       f"{quantity} × {price:.2f} ₽", '')
+                      for product_id, name, quantity, price in lines])
+        lines = self.order_lines.get(order_id)
+        if lines is not None:
+            deliver(lines)
+            return
+
+        def store(lines):
+            self.order_lines.put(order_id, lines)
+            deliver(lines)
+        self.executor.submit(lambda conn: fetch_order_lines(conn, order_id), on_done=store, scope=SCREEN_SCOPE)
+
+    def selected_order(self):
+        """(id, номер вида '#0001') выбранного заказа; для выбранной позиции — ее заказа."""
+        key = self.orders_grid.selected_key()
+        if key is None:
+            return None, None
+        return int(key), self.orders_tree.item(key, 'values')[0]
 
     def add_order(self):
         """Окно для создания нового заказа с добавлением позиций."""
-        dialog = OrderForm(self.root, self.db)
+        dialog = OrderForm(self.root, self.db, self.executor, self.refs)
         if dialog.result:
-            customer_id, items = dialog.result
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            total_amount = sum(item['quantity'] * item['price'] for item in items)
-            status = "Новый"
-            order_id = self.db.insert('orders',
-                                      ['customer_id', 'total_amount', 'status', 'created_date'],
-                                      [customer_id, total_amount, status, now])
-            # Добавляем позиции в order_items
-            for item in items:
-                self.db.insert('order_items',
-                               ['order_id', 'product_id', 'quantity', 'price'],
-                               [order_id, item['product_id'], item['quantity'], item['price']])
-                # Уменьшаем количество товара на складе
-                cursor = self.db.connect().cursor()
-                cursor.execute("SELECT quantity FROM products WHERE id=?", (item['product_id'],))
-                current_qty = cursor.fetchone()[0]
-                new_qty = current_qty - item['quantity']
-                self.db.update('products', item['product_id'], ['quantity'], [new_qty])
-            self.load_orders()
-            self.load_products()  # чтобы отобразить обновленный остаток
+            customer_id, items, token = dialog.result
+            # Заказ проводится в рабочем потоке; на экране меняются только новая строка и остатки
+            def create(_):
+                try:
+                    return self.order_service.create_order(customer_id, items, reservation=token)
+                except Exception:
+                    # Транзакция заказа откатилась вместе со снятием резервов — снимаем их отдельно
+                    self.db.writes.call(lambda conn: stock_reservations.release(conn, token))
+                    raise
+
+            def done(order_id):
+                product_ids = {item['product_id'] for item in items}
+                # Остаток и версию товаров изменило проведение заказа, а не Database.update
+                self.refs.discard('products', product_ids)
+                self.refresh_visible_rows('orders_grid', [order_id])
+                self.refresh_visible_rows('products_grid', product_ids)
+            self.executor.submit(create, on_done=done)
 
     def change_order_status(self):
         """Изменяет статус выбранного заказа."""
-        selected = self.orders_tree.selection()
-        if not selected:
+        order_id, _ = self.selected_order()
+        if order_id is None:
             messagebox.showwarning("Выбор заказа", "Пожалуйста, выберите заказ для изменения статуса.")
             return
-        values = self.orders_tree.item(selected[0], 'values')
-        order_number = values[0]  # вида "#0001"
-        order_id = int(order_number.strip('#'))
         # Диалог выбора нового статуса
         new_status = simpledialog.askstring("Статус заказа", "Введите новый статус:", parent=self.root)
         if new_status:
-            cursor = self.db.connect().cursor()
-            cursor.execute("UPDATE orders SET status=? WHERE id=?", (new_status, order_id))
-            self.db.conn.commit()
-            self.load_orders()
+            # Запись уходит в очередь записи; рабочий поток ждет ее фиксации, а не главный
+            self.executor.submit(lambda conn: self.db.orders.set_status(order_id, new_status),
+                                 on_done=lambda _: self.refresh_visible_rows('orders_grid', [order_id]))
 
     def delete_order(self):
         """Удаляет выбранный заказ после подтверждения и восстанавливает остаток товаров."""
-        selected = self.orders_tree.selection()
-        if not selected:
+        order_id, order_number = self.selected_order()
+        if order_id is None:
             messagebox.showwarning("Выбор заказа", "Пожалуйста, выберите заказ для удаления.")
             return
-        values = self.orders_tree.item(selected[0], 'values')
-        order_number = values[0]
-        order_id = int(order_number.strip('#'))
         if messagebox.askyesno("Удалить заказ", f"Удалить заказ {order_number}?"):
-            # Перед удалением восстанавливаем остаток товаров
-            cursor = self.db.connect().cursor()
-            cursor.execute("SELECT product_id, quantity FROM order_items WHERE order_id=?", (order_id,))
-            items = cursor.fetchall()
-            for prod_id, qty in items:
-                cursor.execute("SELECT quantity FROM products WHERE id=?", (prod_id,))
-                current_qty = cursor.fetchone()[0]
-                new_qty = current_qty + qty
-                self.db.update('products', prod_id, ['quantity'], [new_qty])
-            # Удаляем позиции заказа
-            self.db.delete('order_items', order_id)  # удалим все order_items (чтобы заработал ON DELETE CASCADE, но не во всех SQLite версиях)
-            cursor.execute("DELETE FROM order_items WHERE order_id=?", (order_id,))
-            self.db.conn.commit()
-            # Удаляем сам заказ
-            self.db.delete('orders', order_id)
-            self.load_orders()
-            self.load_products()
+            # Позиции, возврат остатков и сам заказ удаляются одной транзакцией
+            def delete(conn):
+                # Товары заказа, на которые вернутся остатки (позиции после создания не меняются)
+                product_ids = {line[0] for line in fetch_order_lines(conn, order_id)}
+                self.order_service.delete_order(order_id)
+                return product_ids
+
+            def done(product_ids):
+                self.order_lines.discard(order_id)
+                self.refs.discard('products', product_ids)
+                self.refresh_visible_rows('orders_grid', [order_id])
+                self.refresh_visible_rows('products_grid', product_ids)
+            self.executor.submit(delete, on_done=done)
+
+    def export_orders(self):
+        """Выгружает заказы или их позиции в CSV/CSV.GZ/Parquet с индикатором прогресса."""
+        # Список статусов берется из сводной таблицы — это несколько строк, а не проход по orders
+        statuses = [row[0] for row in self.db.connect().execute(
+            "SELECT status FROM stats_order_status WHERE orders_count > 0 ORDER BY status")]
+        form = ExportForm(self.root, statuses)
+        if form.result:
+            view, path, date_from, date_to, statuses, archive = form.result
+            ExportDialog(self.root, self.db, view, path, date_from, date_to, statuses, archive)
+
+    def archive_orders(self):
+        """Переносит закрытые заказы старше срока архивации в файл архива с индикатором прогресса."""
+        if not messagebox.askyesno("Архив заказов", (
+                f"Перенести в архив закрытые заказы старше {order_archive.ARCHIVE_AGE_DAYS} дней?\n"
+                "Они пропадут из списка заказов, но останутся в статистике и в выгрузке «включая архив».")):
+            return
+        dialog = ArchiveDialog(self.root, self.db)
+        if dialog.result:
+            self.reload_visible_grids('orders_grid')
+
+    def refresh_visible_rows(self, name, keys):
+        """Точечно обновляет строки keys в таблице name, если ее экран все еще открыт."""
+        grid = getattr(self, name, None)
+        if self.is_alive(grid):
+            grid.refresh_rows(list(keys))
+
+    def reload_visible_grids(self, *names):
+        """Перезагружает перечисленные таблицы, если их экран все еще открыт."""
+        for name in names:
+            grid = getattr(self, name, None)
+            if self.is_alive(grid):
+                grid.reload()
 
     # ------------------ МОДУЛЬ: СТАТИСТИКА И АНАЛИТИКА ------------------
 
@@ -704,68 +959,172 @@ class SimpleERP:
         )
         title.pack(pady=15)
 
-        cursor = self.db.connect().cursor()
-        stats = {}
-
-        # Пользователи
-        cursor.execute("SELECT COUNT(*) FROM users")
-        stats['users'] = cursor.fetchone()[0]
-
-        # Товары и остаток
-        cursor.execute("SELECT COUNT(*) FROM products")
-        stats['products'] = cursor.fetchone()[0]
-        cursor.execute("SELECT SUM(quantity) FROM products")
-        stats['total_products_qty'] = cursor.fetchone()[0] or 0
-
-        # Клиенты
-        cursor.execute("SELECT COUNT(*) FROM customers")
-        stats['customers'] = cursor.fetchone()[0]
-
-        # Заказы и суммы
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        stats['orders'] = cursor.fetchone()[0]
-        cursor.execute("SELECT SUM(total_amount) FROM orders")
-        stats['total_sales'] = cursor.fetchone()[0] or 0
-        cursor.execute("SELECT AVG(total_amount) FROM orders")
-        stats['avg_order'] = cursor.fetchone()[0] or 0
-
-        # Средние показатели
-        stats['orders_per_customer'] = stats['orders'] / max(stats['customers'], 1)
-        stats['sales_per_product'] = stats['total_sales'] / max(stats['products'], 1)
-
+        # Слева — показатели, справа — графики продаж по дневным сводкам
+        body = tk.Frame(self.content_frame, bg='white')
+        body.pack(fill='both', expand=True, padx=10)
+        stats_label = tk.Label(
+            body,
+            text="⏳ Подсчет статистики...",
+            font=('Arial', 10),
+            bg='white',
+            fg='#2c3e50',
+            justify='left',
+            anchor='nw'
+        )
+        stats_label.pack(side='left', fill='y', pady=10)
+        chart_label = tk.Label(body, text="⏳ Построение графиков...", font=('Arial', 10), bg='white', fg='#7f8c8d')
+        chart_label.pack(side='right', fill='both', expand=True, pady=10)
+
+        # Трассировка SQL включается здесь же; под кнопкой — самые затратные запросы
+        trace_frame = tk.Frame(self.content_frame, bg='white')
+        trace_frame.pack(fill='x', padx=20)
+        self.trace_button = tk.Button(trace_frame, command=self.toggle_sql_trace, fg='white',
+                                      font=('Arial', 10, 'bold'))
+        self.trace_button.pack(anchor='w')
+        self.trace_label = tk.Label(trace_frame, font=('Courier', 9), bg='white', fg='#2c3e50',
+                                    justify='left', anchor='w')
+        self.trace_label.pack(fill='x', pady=5)
+        self.update_trace_panel()
+        self.executor.submit(lambda conn: (self.stats.detailed(), self.stats.group_timings()),
+                             on_done=lambda result: self.render_stats(stats_label, *result),
+                             scope=SCREEN_SCOPE)
+        self.content_frame.update_idletasks()
+        width = max(CHART_MIN_SIZE[0], self.content_frame.winfo_width() - STATS_TEXT_WIDTH)
+        height = max(CHART_MIN_SIZE[1], self.content_frame.winfo_height() - 120)
+        self.executor.submit(lambda conn: self.build_sales_charts(conn, self.db.writes, width, height),
+                             on_done=lambda result: self.render_sales_charts(chart_label, *result),
+                             on_error=lambda error: chart_label.config(text=f"⚠️ Графики недоступны: {error}"),
+                             scope=SCREEN_SCOPE)
+
+    @staticmethod
+    def build_sales_charts(conn, writes, width, height):
+        """Рабочий поток: догоняет дневные сводки продаж (записи — через очередь writes) и рисует по ним графики в PNG."""
+        refreshed = sales_analytics.refresh(conn, writes=writes)
+        data = sales_analytics.dashboard(conn)
+        started = time.perf_counter()
+        png = render_dashboard(data, width, height)
+        return png, refreshed, data['ms'], (time.perf_counter() - started) * 1000
+
+    def render_sales_charts(self, chart_label, png, refreshed, query_ms, render_ms):
+        """Показывает готовую картинку графиков; декодирование PNG — единственная работа главного потока."""
+        image = tk.PhotoImage(data=png)
+        chart_label.config(image=image, text=(
+            f"Сводки: +{refreshed['orders']} заказов, {refreshed['days']} дн. пересчитано, {refreshed['ms']:.0f} мс; "
+            f"чтение {query_ms:.1f} мс, рисование {render_ms:.0f} мс"), compound='top', font=('Arial', 8))
+        chart_label.image = image   # ссылка на картинку, иначе ее удалит сборщик мусора
+
+    def render_stats(self, stats_label, stats, timings):
+        """Выводит подробную статистику и время расчета групп метрик."""
         stats_text = (
             f"📈 ПОДРОБНАЯ СТАТИСТИКА СИСТЕМЫ:\n\n"
             f"👥 ПОЛЬЗОВАТЕЛИ:\n"
             f"   • Всего пользователей: {stats['users']}\n\n"
             f"📦 ТОВАРЫ:\n"
             f"   • Наименований в каталоге: {stats['products']}\n"
-            f"   • Общий остаток: {stats['total_products_qty']} шт.\n\n"
+            f"   • Общий остаток: {stats['total_products_qty']} шт.\n"
+            f"   • Стоимость склада: {stats['stock_value']:.2f} ₽\n"
+            f"   • Нет в наличии: {stats['out_of_stock']}\n\n"
             f"👤 КЛИЕНТЫ:\n"
-            f"   • Всего клиентов: {stats['customers']}\n\n"
+            f"   • Всего клиентов: {stats['customers']}\n"
+            f"   • С заказами: {stats['active_customers']}\n\n"
             f"📋 ЗАКАЗЫ:\n"
             f"   • Всего заказов: {stats['orders']}\n"
             f"   • Общая сумма продаж: {stats['total_sales']:.2f} ₽\n"
-            f"   • Средний чек: {stats['avg_order']:.2f} ₽\n\n"
+            f"   • Средний чек: {stats['avg_order']:.2f} ₽\n"
+            f"   • Крупнейший заказ: {stats['max_order']:.2f} ₽\n\n"
             f"🎯 ЭФФЕКТИВНОСТЬ:\n"
             f"   • Заказов на клиента: {stats['orders_per_customer']:.2f}\n"
             f"   • Продаж на товар: {stats['sales_per_product']:.2f} ₽\n\n"
-            "✅ Система работает стабильно!"
+            "✅ Система работает стабильно!\n\n"
+            "⏱ Расчет по группам метрик (мс): " + ", ".join(f"{group} {ms:.1f}" for group, ms in timings.items())
         )
-        stats_label = tk.Label(
+        refs = self.refs.stats()
+        stats_text += (f"\n🗂 Кэш справочников: {refs['rows']} из {refs['max_rows']} записей, "
+                       f"попаданий {refs['hits']}, промахов {refs['misses']}, сбросов {refs['invalidations']}")
+        stats_label.config(text=stats_text)
+        self.update_trace_panel()
+
+    def toggle_sql_trace(self):
+        """Включает или выключает трассировку SQL для всех соединений (порог и журнал — из настроек запуска)."""
+        if query_trace.active():
+            query_trace.disable()
+        else:
+            query_trace.enable()
+        self.update_trace_panel()
+
+    def update_trace_panel(self):
+        """Обновляет кнопку и сводку трассировки SQL на экране статистики."""
+        tracer = query_trace.active()
+        if tracer is None:
+            self.trace_button.config(text="🔍 Трассировка SQL: выключена", bg='#95a5a6')
+            self.trace_label.config(text="")
+            return
+        self.trace_button.config(text="🔍 Трассировка SQL: включена", bg='#27ae60')
+        self.trace_label.config(
+            text=f"Медленные (≥ {tracer.slow_ms:.0f} мс) с планом — в {tracer.log_path}\n\n{tracer.report(8)}")
+
+    # ------------------ МОДУЛЬ: ЖУРНАЛ ИЗМЕНЕНИЙ ------------------
+
+    def show_audit(self):
+        """Отображает журнал изменений данных, новые записи сверху."""
+        self.clear_content()
+        title = tk.Label(
             self.content_frame,
-            text=stats_text,
-            font=('Arial', 12),
+            text="📜 ЖУРНАЛ ИЗМЕНЕНИЙ",
+            font=('Arial', 16, 'bold'),
             bg='white',
-            fg='#2c3e50',
-            justify='left'
+            fg='#16a085'
         )
-        stats_label.pack(pady=20)
+        title.pack(pady=15)
+
+        columns = ('id', 'ts', 'user_name', 'action', 'table_name', 'record_id', 'changes')
+        headings = {
+            'id': '№', 'ts': 'Время', 'user_name': 'Пользователь', 'action': 'Действие',
+            'table_name': 'Таблица', 'record_id': 'ID записи', 'changes': 'Изменения'
+        }
+        # Сортировки — только по индексированным колонкам журнала
+        query = KeysetQuery(
+            select=list(columns),
+            source='audit_log',
+            sort_exprs={'id': 'id', 'ts': 'ts', 'user_name': "IFNULL(user_name, '')"}
+        )
+        self.audit_grid = VirtualTreeview(self.content_frame, self.db, query, columns, headings,
+                                          sort=('id', True), formatter=self.format_audit, fetch=self.fetch_async)
+        tree = self.audit_grid.tree
+        for col in columns:
+            tree.column(col, width=90, anchor='center')
+        tree.column('id', width=60)
+        tree.column('ts', width=130)
+        tree.column('changes', width=360, anchor='w')
+        self.audit_grid.pack(fill='both', expand=True, padx=20, pady=10)
+
+        # Последние изменения могут еще лежать в буфере журнала — переносим их перед загрузкой
+        def loaded(_):
+            if self.is_alive(self.audit_grid):
+                self.audit_grid.reload()
+        self.executor.submit(lambda conn: self.db.audit.flush(), on_done=loaded, scope=SCREEN_SCOPE)
+
+    @staticmethod
+    def format_audit(entry):
+        """Готовит строку журнала: действие по-русски и изменения «колонка: было → стало»."""
+        entry_id, ts, user, action, table, record_id, changes = entry
+        parts = []
+        for column, (before, after) in (json.loads(changes) if changes else {}).items():
+            if action == 'insert':
+                parts.append(f"{column}: {after}")
+            elif action == 'delete':
+                parts.append(f"{column}: {before}")
+            else:
+                parts.append(f"{column}: {before} → {after}")
+        return (entry_id, ts, user or '—', AUDIT_ACTIONS.get(action, action), table, record_id, "; ".join(parts))
 
     def exit_app(self):
         """Закрывает приложение после подтверждения."""
         if messagebox.askyesno("Выход", "Вы уверены, что хотите выйти из ERP системы?"):
-            if self.db.conn:
-                self.db.conn.close()
+            if self.db is not None:
+                self.executor.shutdown()
+                self.stats.close()
+                self.db.close()
             self.root.destroy()
 
     def run(self):
@@ -934,27 +1293,285 @@ class CustomerForm(tk.Toplevel):
         self.destroy()
 
 
+class ProgressDialog(tk.Toplevel):
+    """Окно фоновой операции: работа идет в отдельном потоке, окно показывает прогресс.
+
+    work — работа наследника, выполняется в отдельном потоке; из потока она
+    сообщает о ходе работы через report() и завершается событием
+    ('done' | 'cancelled' | 'error', текст).
+    """
+
+    def __init__(self, parent, title, caption, work, determinate=True):
+        super().__init__(parent)
+        self.title(title)
+        self.geometry("460x200")
+        self.resizable(False, False)
+        self.result = None
+        self.cancel_requested = False
+        self.events = queue.Queue()
+
+        tk.Label(self, text=caption, anchor='w').pack(fill='x', padx=20, pady=(20, 5))
+        self.progress = ttk.Progressbar(self, mode='determinate' if determinate else 'indeterminate', maximum=100)
+        self.progress.pack(fill='x', padx=20)
+        if not determinate:
+            self.progress.start(50)
+        self.status_label = tk.Label(self, text="Подготовка...", anchor='w', justify='left', wraplength=420)
+        self.status_label.pack(fill='x', padx=20, pady=10)
+        self.button = tk.Button(self, text="Остановить", width=12, command=self.on_button, bg='#e74c3c', fg='white')
+        self.button.pack(pady=5)
+        self.protocol("WM_DELETE_WINDOW", self.on_button)
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        self.after(100, self.poll)
+
+        self.transient(parent)
+        self.grab_set()
+        parent.wait_window(self)
+
+    def report(self, text, fraction=None):
+        """Вызывается из фонового потока: текст и доля выполненной работы."""
+        self.events.put(('progress', text, fraction))
+
+    def poll(self):
+        """Переносит события фонового потока в окно."""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == 'progress':
+                _, text, fraction = event
+                if fraction is not None:
+                    self.progress['value'] = fraction * 100
+                self.status_label.config(text=text)
+            else:
+                self.finish(*event)
+                return
+        self.after(100, self.poll)
+
+    def finish(self, kind, text, result=None):
+        """Показывает итог операции и превращает кнопку в «Закрыть»."""
+        self.result = result
+        if kind == 'done':
+            self.progress.stop()
+            self.progress.config(mode='determinate')
+            self.progress['value'] = 100
+        else:
+            self.progress.stop()
+        self.status_label.config(text=text)
+        self.button.config(text="Закрыть", bg='#27ae60', command=self.destroy)
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+    def on_button(self):
+        """Просит фоновую операцию остановиться после текущей пачки."""
+        self.cancel_requested = True
+        self.status_label.config(text="Останавливаем после текущей пачки...")
+
+
+class ImportDialog(ProgressDialog):
+    """Окно импорта: файл пишется в фоновом потоке, окно показывает прогресс."""
+
+    def __init__(self, parent, db, entity, path):
+        self.db_name = db.db_name
+        self.entity = entity
+        self.path = path
+        super().__init__(parent, "Импорт данных", f"Файл: {os.path.basename(path)}", self.work)
+
+    def work(self):
+        """Импорт с отдельным соединением bulk-load."""
+        conn = None
+        try:
+            conn = open_import_connection(self.db_name)
+            result = import_file(conn, self.entity, self.path,
+                                 progress=lambda processed, fraction: self.report(
+                                     f"Обработано строк: {processed}", fraction),
+                                 cancelled=lambda: self.cancel_requested)
+            self.events.put(('done', f"✅ {result}", result))
+        except ImportCancelled as e:
+            self.events.put(('cancelled', f"⏹ Импорт остановлен.\n{e.result}", e.result))
+        except (ImportFileError, sqlite3.Error, OSError) as e:
+            self.events.put(('error', f"❌ Ошибка импорта: {e}"))
+        except Exception as e:
+            # Поток не должен завершиться молча: окно ждет итога и держит захват ввода
+            self.events.put(('error', f"❌ Непредвиденная ошибка импорта: {e!r}"))
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+class ExportDialog(ProgressDialog):
+    """Окно выгрузки: строки читаются и пишутся в файл в фоновом потоке."""
+
+    def __init__(self, parent, db, view, path, date_from, date_to, statuses, archive=False):
+        self.db_name = db.db_name
+        self.params = (view, path, date_from, date_to, statuses, archive)
+        # Общее число строк заранее не считаем — это был бы лишний проход по таблицам
+        super().__init__(parent, "Экспорт заказов", f"Файл: {os.path.basename(path)}", self.work,
+                         determinate=False)
+
+    def work(self):
+        """Выгрузка с отдельным соединением профиля reporting."""
+        view, path, date_from, date_to, statuses, archive = self.params
+        conn = None
+        started = time.perf_counter()
+        try:
+            conn = open_export_connection(self.db_name)
+            written = export(conn, view, path, date_from, date_to, statuses,
+                             progress=lambda n: self.report(f"Выгружено строк: {n}"),
+                             cancelled=lambda: self.cancel_requested, archive=archive)
+            elapsed = time.perf_counter() - started
+            self.events.put(('done', f"✅ Выгружено строк: {written} за {elapsed:.1f} с\n{path}", written))
+        except ExportCancelled as e:
+            self.events.put(('cancelled', f"⏹ {e}. Файл не создан."))
+        except (ExportError, sqlite3.Error, OSError) as e:
+            self.events.put(('error', f"❌ Ошибка экспорта: {e}"))
+        except Exception as e:
+            # Поток не должен завершиться молча: окно ждет итога и держит захват ввода
+            self.events.put(('error', f"❌ Непредвиденная ошибка экспорта: {e!r}"))
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+class ArchiveDialog(ProgressDialog):
+    """Окно переноса заказов в архив: пачки переносятся в фоновом потоке."""
+
+    def __init__(self, parent, db):
+        self.db = db
+        path = order_archive.archive_path(db.db_name)
+        super().__init__(parent, "Архив заказов", f"Файл архива: {os.path.basename(path)}", self.work)
+
+    def work(self):
+        """Перенос с отдельным соединением: ATTACH архива не мешает соединениям экранов."""
+        conn = None
+        try:
+            conn = self.db.open_connection()
+            summary = order_archive.archive(
+                conn, progress=lambda done, total: self.report(f"Перенесено заказов: {done} из {total}", done / total),
+                cancelled=lambda: self.cancel_requested)
+            text = (f"Перенесено заказов: {summary['orders']}, позиций: {summary['lines']}\n"
+                    f"Закрытые дни до {summary['cutoff']}, {summary['ms'] / 1000:.1f} с")
+            if summary['cancelled']:
+                self.events.put(('cancelled', f"⏹ Перенос остановлен.\n{text}", summary))
+            else:
+                self.events.put(('done', f"✅ {text}", summary))
+        except (order_archive.ArchiveError, sqlite3.Error, OSError) as e:
+            self.events.put(('error', f"❌ Ошибка переноса в архив: {e}"))
+        except Exception as e:
+            # Поток не должен завершиться молча: окно ждет итога и держит захват ввода
+            self.events.put(('error', f"❌ Непредвиденная ошибка переноса в архив: {e!r}"))
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+class ExportForm(tk.Toplevel):
+    """Параметры выгрузки заказов: набор данных, период, статусы и файл."""
+
+    VIEW_LABELS = {
+        'orders': "Заказы",
+        'order_items': "Позиции заказов",
+        'order_lines': "Позиции с клиентом и товаром",
+    }
+
+    def __init__(self, parent, statuses):
+        super().__init__(parent)
+        self.title("Экспорт заказов")
+        self.geometry("420x450")
+        self.resizable(False, False)
+        self.result = None
+
+        tk.Label(self, text="Данные:", anchor='w').pack(fill='x', padx=20, pady=(20, 0))
+        self.view_var = tk.StringVar(value=self.VIEW_LABELS['order_lines'])
+        ttk.Combobox(self, textvariable=self.view_var, values=list(self.VIEW_LABELS.values()),
+                     state='readonly').pack(fill='x', padx=20)
+
+        period = tk.Frame(self)
+        period.pack(fill='x', padx=20, pady=(10, 0))
+        tk.Label(period, text="С (ГГГГ-ММ-ДД):").grid(row=0, column=0, sticky='w')
+        self.from_var = tk.StringVar()
+        tk.Entry(period, textvariable=self.from_var, width=12).grid(row=0, column=1, padx=(5, 15))
+        tk.Label(period, text="По:").grid(row=0, column=2, sticky='w')
+        self.to_var = tk.StringVar()
+        tk.Entry(period, textvariable=self.to_var, width=12).grid(row=0, column=3, padx=5)
+
+        tk.Label(self, text="Статусы (ничего не отмечено — все):", anchor='w').pack(fill='x', padx=20, pady=(10, 0))
+        status_frame = tk.Frame(self)
+        status_frame.pack(fill='x', padx=20)
+        self.status_vars = {}
+        for status in statuses:
+            var = tk.BooleanVar()
+            tk.Checkbutton(status_frame, text=status, variable=var, anchor='w').pack(fill='x')
+            self.status_vars[status] = var
+        self.archive_var = tk.BooleanVar()
+        tk.Checkbutton(self, text="Включая архив (заказы прошлых лет)", variable=self.archive_var,
+                       anchor='w').pack(fill='x', padx=20, pady=(10, 0))
+
+        btn_frame = tk.Frame(self)
+        btn_frame.pack(side='bottom', pady=15)
+        tk.Button(btn_frame, text="Выгрузить", width=12, command=self.on_save, bg='#27ae60', fg='white').pack(side='left', padx=10)
+        tk.Button(btn_frame, text="Отмена", width=12, command=self.destroy, bg='#e74c3c', fg='white').pack(side='left')
+
+        self.transient(parent)
+        self.grab_set()
+        parent.wait_window(self)
+
+    def on_save(self):
+        date_from = self.from_var.get().strip() or None
+        date_to = self.to_var.get().strip() or None
+        for value in (date_from, date_to):
+            if value is None:
+                continue
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Ошибка", f"Дата '{value}' должна быть в формате ГГГГ-ММ-ДД.", parent=self)
+                return
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="Файл выгрузки",
+            defaultextension='.csv',
+            filetypes=[("CSV", "*.csv"), ("CSV, сжатый gzip", "*.csv.gz"), ("Parquet", "*.parquet")]
+        )
+        if not path:
+            return
+        try:
+            format_for(path)
+        except ExportError as e:
+            messagebox.showerror("Ошибка", str(e), parent=self)
+            return
+        view = next(key for key, label in self.VIEW_LABELS.items() if label == self.view_var.get())
+        statuses = [status for status, var in self.status_vars.items() if var.get()]
+        self.result = (view, path, date_from, date_to, statuses, self.archive_var.get())
+        self.destroy()
+
+
 class OrderForm(tk.Toplevel):
     """Диалоговое окно для создания заказа с выбором клиента и добавлением товаров."""
 
-    def __init__(self, parent, db: Database):
+    def __init__(self, parent, db: Database, executor, refs):
         super().__init__(parent)
         self.title("Добавить заказ")
-        self.geometry("600x500")
+        self.geometry("640x500")
         self.resizable(False, False)
         self.db = db
+        self.executor = executor
+        self.refs = refs
         self.result = None
         self.items = []
-
-        # Выбор клиента
-        tk.Label(self, text="Выберите клиента:", anchor='w').pack(fill='x', padx=20, pady=(20, 0))
-        self.customers = self.db.fetch_all('customers', order_by='name')
-        cust_names = [c[1] for c in self.customers]
-        self.cust_var = tk.StringVar()
-        self.cust_combobox = ttk.Combobox(self, textvariable=self.cust_var, values=cust_names, state='readonly')
-        self.cust_combobox.pack(fill='x', padx=20)
-        if cust_names:
-            self.cust_combobox.current(0)
+        # Позиции резервируются в базе сразу при добавлении; резервы формы продлеваются, пока она открыта
+        self.token = stock_reservations.new_token()
+        self.reserving = 0
+        self.renew_after_id = self.after(stock_reservations.RENEW_INTERVAL * 1000, self.renew_reservations)
+        self.protocol('WM_DELETE_WINDOW', self.on_cancel)
+
+        # Выбор клиента: варианты подбираются по имени, email, телефону или номеру
+        tk.Label(self, text="Клиент (начните вводить имя, email или номер):", anchor='w') \
+            .pack(fill='x', padx=20, pady=(20, 0))
+        self.cust_picker = RecordPicker(self, fetch=self.lookup_fetcher('customers'), label=self.customer_label)
+        self.cust_picker.pack(fill='x', padx=20)
 
         # Таблица для позиций заказа
         columns = ('product', 'quantity', 'price', 'subtotal')
@@ -969,13 +1586,9 @@ class OrderForm(tk.Toplevel):
         add_frame = tk.Frame(self)
         add_frame.pack(fill='x', padx=20, pady=10)
         tk.Label(add_frame, text="Товар:", anchor='w').grid(row=0, column=0, padx=(0, 5), pady=5)
-        self.products = self.db.fetch_all('products', order_by='name')
-        prod_names = [p[1] for p in self.products]
-        self.prod_var = tk.StringVar()
-        self.prod_combobox = ttk.Combobox(add_frame, textvariable=self.prod_var, values=prod_names, state='readonly', width=25)
-        self.prod_combobox.grid(row=0, column=1, padx=(0, 10), pady=5)
-        if prod_names:
-            self.prod_combobox.current(0)
+        self.prod_picker = RecordPicker(add_frame, fetch=self.lookup_fetcher('products'),
+                                        label=self.product_label, width=34)
+        self.prod_picker.grid(row=0, column=1, padx=(0, 10), pady=5)
 
         tk.Label(add_frame, text="Кол-во:", anchor='w').grid(row=0, column=2, padx=(0, 5), pady=5)
         self.item_qty_var = tk.IntVar(value=1)
@@ -992,38 +1605,82 @@ class OrderForm(tk.Toplevel):
         btn_frame = tk.Frame(self)
         btn_frame.pack(pady=15)
         tk.Button(btn_frame, text="Сохранить заказ", width=15, command=self.on_save_order, bg='#27ae60', fg='white').pack(side='left', padx=10)
-        tk.Button(btn_frame, text="Отмена", width=15, command=self.destroy, bg='#e74c3c', fg='white').pack(side='left')
+        tk.Button(btn_frame, text="Отмена", width=15, command=self.on_cancel, bg='#e74c3c', fg='white').pack(side='left')
 
         self.transient(parent)
         self.grab_set()
         parent.wait_window(self)
 
+    def lookup_fetcher(self, table):
+        """Функция подбора вариантов для RecordPicker: запрос top-N в рабочем потоке."""
+        def fetch(text, callback):
+            self.executor.submit(lambda conn: lookup(conn, table, text), on_done=callback)
+        return fetch
+
+    @staticmethod
+    def customer_label(row):
+        cust_id, name, email = row
+        return f"{name} <{email}> (#{cust_id})" if email else f"{name} (#{cust_id})"
+
+    @staticmethod
+    def product_label(row):
+        prod_id, name, price, quantity = row
+        return f"{name} — {price:.2f} ₽, свободно {quantity} (#{prod_id})"
+
     def add_item_to_order(self):
         """Добавляет выбранную товарную позицию в таблицу заказа."""
-        prod_name = self.prod_var.get()
-        qty = self.item_qty_var.get()
-        if not prod_name or qty <= 0:
-            messagebox.showwarning("Валидация", "Выберите товар и введите корректное количество.")
-            return
-        # Находим объект продукта
-        prod = next((p for p in self.products if p[1] == prod_name), None)
-        if not prod:
-            return
-        prod_id, _, price, stock_qty, _, _ = prod
-        if qty > stock_qty:
-            messagebox.showwarning("Недостаточно товара", f"На складе доступно только {stock_qty} шт.")
+        prod = self.prod_picker.selected()
+        try:
+            qty = self.item_qty_var.get()
+        except tk.TclError:
+            qty = 0
+        if not prod or qty <= 0:
+            messagebox.showwarning("Валидация", "Выберите товар из списка и введите корректное количество.")
             return
-        subtotal = qty * price
-        # Сохраняем в списке позиций
-        self.items.append({
-            'product_id': prod_id,
-            'product_name': prod_name,
-            'quantity': qty,
-            'price': price,
-            'subtotal': subtotal
-        })
-        # Обновляем таблицу и итоговую сумму
-        self.refresh_items_table()
+        prod_id, prod_name, price, _ = prod
+        # Остаток проверяет база: позиция резервируется условным UPDATE, и две формы
+        # не могут занять один и тот же товар; при нехватке отказ приходит сразу
+        def reserved(available):
+            self.reserving -= 1
+            if not self.winfo_exists():
+                # Форму закрыли раньше, чем пришел резерв: снимаем его вслед за остальными
+                self.db.writes.submit(lambda conn: stock_reservations.release(conn, self.token))
+                return
+            # Сохраняем в списке позиций
+            self.items.append({
+                'product_id': prod_id,
+                'product_name': prod_name,
+                'quantity': qty,
+                'price': price,
+                'subtotal': qty * price
+            })
+            # Обновляем таблицу и итоговую сумму
+            self.refresh_items_table()
+
+        def failed(error):
+            self.reserving -= 1
+            if self.winfo_exists():
+                messagebox.showwarning("Резерв не выполнен", str(error), parent=self)
+        self.reserving += 1
+        self.executor.submit(
+            lambda _: self.db.writes.call(lambda conn: stock_reservations.reserve(conn, self.token, prod_id, qty)),
+            on_done=reserved, on_error=failed)
+
+    def renew_reservations(self):
+        """Продлевает резервы формы, пока она открыта."""
+        if self.items:
+            self.db.writes.submit(lambda conn: stock_reservations.renew(conn, self.token))
+        self.renew_after_id = self.after(stock_reservations.RENEW_INTERVAL * 1000, self.renew_reservations)
+
+    def close(self):
+        self.after_cancel(self.renew_after_id)
+        self.destroy()
+
+    def on_cancel(self):
+        """Закрывает форму без заказа и снимает ее резервы."""
+        token = self.token
+        self.db.writes.submit(lambda conn: stock_reservations.release(conn, token))
+        self.close()
 
     def refresh_items_table(self):
         """Обновляет содержимое таблицы позиций и итоговую сумму."""
@@ -1039,26 +1696,86 @@ class OrderForm(tk.Toplevel):
 
     def on_save_order(self):
         """Сохраняет заказ и закрывает окно."""
-        cust_name = self.cust_var.get()
-        if not cust_name:
-            messagebox.showwarning("Валидация", "Пожалуйста, выберите клиента.")
+        customer = self.cust_picker.selected()
+        if not customer:
+            messagebox.showwarning("Валидация", "Пожалуйста, выберите клиента из списка.")
+            return
+        if self.reserving:
+            messagebox.showwarning("Валидация", "Дождитесь резервирования добавленных позиций.")
             return
         if not self.items:
             messagebox.showwarning("Валидация", "Добавьте хотя бы одну товарную позицию.")
             return
-        # Находим ID клиента
-        customer = next((c for c in self.customers if c[1] == cust_name), None)
-        if not customer:
-            return
         customer_id = customer[0]
-        self.result = (customer_id, self.items)
-        self.destroy()
+        # Резервы формы снимет и превратит в списание транзакция заказа
+        self.result = (customer_id, self.items, self.token)
+        self.close()
+
+
+def parse_args(argv=None):
+    """Разбирает параметры командной строки."""
+    parser = argparse.ArgumentParser(description="ERP система v3.0")
+    parser.add_argument('--db', default=DB_NAME, help="путь к файлу базы данных (или ERP_DB_PATH)")
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        help="профиль соединения с SQLite (или ERP_DB_PROFILE), по умолчанию desktop")
+    parser.add_argument('--show-profile', action='store_true',
+                        help="вывести действующие настройки соединения и выйти")
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help="пересчитать сводные счетчики дашборда по данным и выйти")
+    parser.add_argument('--serve', action='store_true',
+                        help="запустить HTTP/JSON API без графического интерфейса")
+    # Значения по умолчанию — в api_server: он импортируется только с --serve
+    parser.add_argument('--host', help="адрес API (с --serve), по умолчанию 127.0.0.1")
+    parser.add_argument('--port', type=int, help="порт API (с --serve), по умолчанию 8080")
+    parser.add_argument('--quiet', action='store_true', help="не писать журнал запросов API (с --serve)")
+    parser.add_argument('--trace-sql', action='store_true',
+                        help="включить трассировку SQL с журналом медленных запросов (или ERP_SQL_TRACE=1)")
+    parser.add_argument('--slow-ms', type=float,
+                        help=f"порог медленного запроса, мс (или ERP_SQL_SLOW_MS), по умолчанию {query_trace.SLOW_MS:g}")
+    parser.add_argument('--slow-log',
+                        help=f"файл журнала медленных запросов (или ERP_SQL_SLOW_LOG), по умолчанию {query_trace.SLOW_LOG}")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="вывести длительность фаз запуска (или ERP_STARTUP_REPORT=1)")
+    return parser.parse_args(argv)
 
 
 def main():
+    args = parse_args()
+    # Порог и файл запоминаются и для включения кнопкой на экране статистики; ключи важнее переменных
+    tracing = query_trace.configure_from_env()
+    query_trace.configure(args.slow_ms, args.slow_log)
+    if args.trace_sql or tracing:
+        query_trace.enable()
+    if args.show_profile:
+        db = Database(args.db, args.profile)
+        try:
+            for key, value in db.describe_profile().items():
+                print(f"{key}: {value}")
+        finally:
+            db.close()
+        return
+    if args.rebuild_stats:
+        db = Database(args.db, args.profile)
+        try:
+            drift = rebuild_summary(db.connect())
+        finally:
+            db.close()
+        for metric, (before, after) in drift.items():
+            print(f"{metric}: {before} -> {after}")
+        print("✅ Сводные счетчики пересчитаны" + ("" if drift else ", расхождений нет"))
+        return
+    if args.serve:
+        # HTTP-сервер (http.server, email, ssl) нужен только здесь и заметно удлиняет импорт
+        import api_server
+        api_server.serve(Database(args.db, args.profile), args.host or api_server.DEFAULT_HOST,
+                         args.port or api_server.DEFAULT_PORT, quiet=args.quiet)
+        return
     print("🚀 Запуск ERP системы v3.0...")
+    startup = startup_timing.StartupTimer()
+    startup.mark("импорт модулей")
     try:
-        app = SimpleERP()
+        app = SimpleERP(args.db, args.profile, startup, startup_timing.enabled(args.startup_report))
+        print(f"🗄  База данных: {args.db}, профиль соединения: {resolve_profile(args.profile).name}")
         print("✅ Интерфейс создан успешно! Система готова к работе.")
         app.run()
     except Exception as e:
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Версионные миграции схемы базы данных ERP системы.
+
+Номер версии схемы хранится в PRAGMA user_version. Каждая миграция
+применяется один раз в своей транзакции; если схема уже актуальна, при
+старте выполняется только чтение user_version, без какого-либо DDL.
+
+Чтобы изменить схему, добавьте в конец MIGRATIONS новую запись со
+следующим номером — существующие миграции не редактируются.
+"""
+
+from datetime import datetime
+
+import audit_log
+import order_archive
+import sales_analytics
+import search
+import segmentation
+import stats_summary
+import stock_reservations
+
+
+def _seed_admin(conn):
+    """Создает администратора по умолчанию в пустой базе.
+
+    В файле старого database.py дата создания еще называется created_date —
+    переименование делает миграция 6, поэтому колонка берется по факту.
+    """
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        created = 'created_at' if 'created_at' in columns else 'created_date'
+        conn.execute(f"""
+            INSERT INTO users (username, full_name, role, email, password, {created})
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, ("admin", "Администратор Системы", "Администратор", "admin@example.com", "admin123", now))
+
+
+def _unify_legacy_schema(conn):
+    """Приводит базу, созданную старым database.py, к общей схеме.
+
+    Старая схема хранила дату создания в created_date у users/products/customers
+    и описание товара в products.description; новая — created_at и без описания.
+    Колонки переименовываются, а описание товара появляется в обеих схемах.
+    """
+    for table in ('users', 'products', 'customers'):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if 'created_date' in columns and 'created_at' not in columns:
+            conn.execute(f"ALTER TABLE {table} RENAME COLUMN created_date TO created_at")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+    if 'description' not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN description TEXT")
+
+
+# (версия, описание, шаги) — шаг это SQL-строка или функция от соединения
+MIGRATIONS = [
+    (1, "Базовые таблицы", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            full_name TEXT NOT NULL,
+            role TEXT NOT NULL,
+            email TEXT UNIQUE,
+            password TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price REAL NOT NULL DEFAULT 0,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            category TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE,
+            phone TEXT,
+            address TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            created_date TEXT NOT NULL,
+            FOREIGN KEY(customer_id) REFERENCES customers(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 1,
+            price REAL NOT NULL DEFAULT 0,
+            FOREIGN KEY(order_id) REFERENCES orders(id),
+            FOREIGN KEY(product_id) REFERENCES products(id)
+        )
+        """,
+        _seed_admin,
+    ]),
+    (2, "Индексы для списков, JOIN заказов и позиций", [
+        # Список заказов: сортировка по дате без temp B-tree; индекс покрывает
+        # все колонки orders, которые читает экран; id задает порядок при равных датах
+        "CREATE INDEX IF NOT EXISTS idx_orders_list ON orders(created_date, id, customer_id, total_amount, status)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
+        # Позиции заказа: WHERE order_id=? читается целиком из индекса
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, product_id, quantity, price)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id)",
+        # ORDER BY name на экранах товаров и клиентов
+        "CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)",
+    ]),
+    (3, "Сводные счетчики дашборда на триггерах", stats_summary.SCHEMA + [stats_summary.recompute]),
+    (4, "Артикул товара — естественный ключ для импорта", [
+        "ALTER TABLE products ADD COLUMN sku TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products(sku)",
+    ]),
+    (5, "Полнотекстовый поиск FTS5 по товарам, клиентам и пользователям",
+     search.SCHEMA + [search.rebuild]),
+    (6, "Общая схема со старым database.py: created_at и описание товара", [_unify_legacy_schema]),
+    # Сводки заполняет первый sales_analytics.refresh() — пачками и не при старте
+    (7, "Дневные сводки продаж для графиков", sales_analytics.SCHEMA),
+    (8, "Результаты ABC/XYZ товаров и RFM-сегментов клиентов", segmentation.SCHEMA),
+    (9, "Резервы остатков и версия строки товара", stock_reservations.SCHEMA),
+    (10, "Журнал изменений данных", audit_log.SCHEMA),
+    (11, "Итоги заказов, перенесенных в архив", order_archive.SCHEMA),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Текущая версия схемы файла базы данных."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Применяет недостающие миграции и возвращает список примененных версий."""
+    applied = []
+    if current_version(conn) >= LATEST_VERSION:
+        return applied
+    for version, description, steps in MIGRATIONS:
+        # BEGIN IMMEDIATE до проверки версии: другой экземпляр мог успеть мигрировать
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied.append((version, description))
+    return applied
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Архив закрытых заказов в отдельном файле SQLite.
+
+Оперативная база хранит только живую часть истории: заказы старше
+ARCHIVE_AGE_DAYS дней переносятся с позициями в файл архива (по умолчанию
+рядом с базой: erp_database_archive.db). Переносятся целые дни, в которых
+все заказы закрыты (CLOSED_STATUSES) и уже учтены в сводках продаж: такой
+день больше не меняется, поэтому его строки в сводках и счетчиках остаются
+верными без исходных заказов. Перенос идет пачками примерно по BATCH_ORDERS
+заказов. Фиксация в двух файлах WAL не атомарна, поэтому каждая пачка —
+две короткие транзакции: сначала копия в архиве, затем удаление из
+оперативной базы. Сбой между ними оставляет заказы в обоих файлах (их не
+удваивают представления all_orders/all_order_items), а следующий перенос
+убирает такие копии из архива и переносит заказы заново.
+
+Счетчики дашборда (stats_summary) и сводки продаж (sales_analytics)
+продолжают учитывать архив: триггеры на удаление вычитают перенесенные
+заказы, а транзакция удаления пачки возвращает их обратно. Перенесенные дни
+с итогами по статусам записываются в archived_days — по ним пересчет
+счетчиков и сводок не теряет архивную часть.
+
+Для исторических отчетов архив подключается по требованию (ATTACH) через
+attached(): на время блока появляются временные представления all_orders и
+all_order_items — оперативные данные плюс архив (UNION ALL).
+
+Запуск из командной строки:
+    python order_archive.py [--age-days 730] [--dry-run] [--vacuum]
+"""
+
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import sales_analytics
+from order_service import write_transaction
+
+ARCHIVE_AGE_DAYS = 730
+# Сегментация клиентов и товаров читает заказы за последние 12 месяцев из оперативной базы
+MIN_AGE_DAYS = 400
+CLOSED_STATUSES = ("Доставлен", "Отменен")
+BATCH_ORDERS = 20000    # заказов в одной транзакции переноса
+ARCHIVE = 'archive'     # имя подключенного архива в соединении
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS archived_days (
+        day TEXT NOT NULL,
+        status TEXT NOT NULL,
+        orders_count INTEGER NOT NULL,
+        total_sales REAL NOT NULL,
+        PRIMARY KEY (day, status)
+    ) WITHOUT ROWID
+    """,
+]
+
+# Таблицы файла архива: те же колонки, без внешних ключей и триггеров
+ARCHIVE_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {ARCHIVE}.orders (
+        id INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        total_amount REAL NOT NULL,
+        status TEXT NOT NULL,
+        created_date TEXT NOT NULL
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {ARCHIVE}.order_items (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS {ARCHIVE}.idx_orders_date ON orders(created_date, id)",
+    f"CREATE INDEX IF NOT EXISTS {ARCHIVE}.idx_orders_customer ON orders(customer_id)",
+    f"CREATE INDEX IF NOT EXISTS {ARCHIVE}.idx_order_items_order ON order_items(order_id, product_id, quantity, price)",
+]
+
+# Сбой между транзакциями копирования и удаления пачки оставит заказ в обоих
+# файлах до следующего переноса — представления его не удваивают
+_VIEWS = [
+    f"""
+    CREATE TEMP VIEW IF NOT EXISTS all_orders AS
+    SELECT id, customer_id, total_amount, status, created_date FROM main.orders
+    UNION ALL
+    SELECT id, customer_id, total_amount, status, created_date FROM {ARCHIVE}.orders a
+    WHERE NOT EXISTS (SELECT 1 FROM main.orders o WHERE o.id = a.id)
+    """,
+    f"""
+    CREATE TEMP VIEW IF NOT EXISTS all_order_items AS
+    SELECT id, order_id, product_id, quantity, price FROM main.order_items
+    UNION ALL
+    SELECT id, order_id, product_id, quantity, price FROM {ARCHIVE}.order_items a
+    WHERE NOT EXISTS (SELECT 1 FROM main.order_items i WHERE i.id = a.id)
+    """,
+]
+
+
+class ArchiveError(Exception):
+    """Перенос в архив невозможен (параметры, недоступный файл архива)."""
+
+
+def archive_path(db_path):
+    """Файл архива рядом с базой: erp_database.db -> erp_database_archive.db."""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def _main_path(conn):
+    return next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+
+
+@contextmanager
+def attached(conn, path=None, create=False):
+    """Подключает архив к conn на время блока; в блоке доступны all_orders и all_order_items.
+
+    Соединение не должно быть в транзакции: ATTACH и DETACH вне транзакций.
+    Если файла архива нет, а create не задан, подключается пустой архив в памяти.
+    """
+    path = path or archive_path(_main_path(conn))
+    if not create and not os.path.exists(path):
+        path = ':memory:'
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE}", (path,))
+    try:
+        for sql in ARCHIVE_SCHEMA + _VIEWS:
+            conn.execute(sql)
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("DROP VIEW IF EXISTS temp.all_orders")
+        conn.execute("DROP VIEW IF EXISTS temp.all_order_items")
+        conn.execute(f"DETACH DATABASE {ARCHIVE}")
+
+
+def _candidate_days(conn, cutoff, statuses):
+    """Дни до cutoff, целиком из закрытых и учтенных в сводках заказов: [(день, заказов)]."""
+    placeholders = ', '.join('?' for _ in statuses)
+    return conn.execute(f"""
+        SELECT substr(created_date, 1, 10) AS day, COUNT(*)
+        FROM orders
+        WHERE created_date < ?
+        GROUP BY day
+        HAVING SUM(status NOT IN ({placeholders})) = 0
+           AND MAX(id) <= (SELECT watermark FROM sales_rollup_state WHERE id = 1)
+           AND day NOT IN (SELECT day FROM sales_dirty_days)
+        ORDER BY day
+    """, (cutoff, *statuses)).fetchall()
+
+
+def _batches(days, batch_orders):
+    """Группирует дни в пачки примерно по batch_orders заказов."""
+    batch, size = [], 0
+    for day, count in days:
+        batch.append(day)
+        size += count
+        if size >= batch_orders:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def _copy(conn, days):
+    """Первая транзакция пачки: копирует заказы дней days с позициями в архив (пишет только архив)."""
+    conn.execute("DELETE FROM temp.archive_days")
+    conn.executemany("INSERT INTO temp.archive_days (day) VALUES (?)", [(day,) for day in days])
+    conn.execute("DELETE FROM temp.archive_ids")
+    # Диапазон дат идет по индексу orders(created_date, ...), список дней отсекает пропуски
+    conn.execute("""
+        INSERT INTO temp.archive_ids (id)
+        SELECT id FROM main.orders
+        WHERE created_date >= ? AND created_date < ?
+          AND substr(created_date, 1, 10) IN (SELECT day FROM temp.archive_days)
+    """, (days[0], (date.fromisoformat(days[-1]) + timedelta(days=1)).isoformat()))
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {ARCHIVE}.orders (id, customer_id, total_amount, status, created_date)
+        SELECT id, customer_id, total_amount, status, created_date
+        FROM main.orders WHERE id IN (SELECT id FROM temp.archive_ids)
+    """)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {ARCHIVE}.order_items (id, order_id, product_id, quantity, price)
+        SELECT id, order_id, product_id, quantity, price
+        FROM main.order_items WHERE order_id IN (SELECT id FROM temp.archive_ids)
+    """)
+
+
+def _delete(conn):
+    """Вторая транзакция пачки: удаляет скопированные заказы из оперативной базы; возвращает (заказов, позиций).
+
+    Удаляются только заказы, совпадающие со своей копией в архиве: заказ,
+    измененный между транзакциями, остается в оперативной базе, а его
+    устаревшую копию убирает _drop_stale_copies.
+    """
+    conn.execute(f"""
+        DELETE FROM temp.archive_ids WHERE NOT EXISTS (
+            SELECT 1 FROM main.orders o JOIN {ARCHIVE}.orders a ON a.id = o.id
+            WHERE o.id = archive_ids.id AND a.customer_id = o.customer_id AND a.total_amount = o.total_amount
+              AND a.status = o.status AND a.created_date = o.created_date)
+        OR EXISTS (
+            SELECT 1 FROM main.order_items i WHERE i.order_id = archive_ids.id AND NOT EXISTS (
+                SELECT 1 FROM {ARCHIVE}.order_items a
+                WHERE a.id = i.id AND a.order_id = i.order_id AND a.product_id = i.product_id
+                  AND a.quantity = i.quantity AND a.price = i.price))
+        OR EXISTS (
+            SELECT 1 FROM {ARCHIVE}.order_items a WHERE a.order_id = archive_ids.id
+              AND NOT EXISTS (SELECT 1 FROM main.order_items i WHERE i.id = a.id))
+    """)
+    totals = conn.execute("""
+        SELECT substr(created_date, 1, 10), status, COUNT(*), SUM(total_amount)
+        FROM main.orders WHERE id IN (SELECT id FROM temp.archive_ids)
+        GROUP BY 1, 2
+    """).fetchall()
+    lines = conn.execute("DELETE FROM main.order_items WHERE order_id IN (SELECT id FROM temp.archive_ids)").rowcount
+    orders = conn.execute("DELETE FROM main.orders WHERE id IN (SELECT id FROM temp.archive_ids)").rowcount
+    # Триггеры удаления вычли заказы из счетчиков и отметили дни к пересчету сводок —
+    # для архива это не удаление: возвращаем счетчики и снимаем отметки
+    conn.executemany("""
+        INSERT INTO archived_days (day, status, orders_count, total_sales) VALUES (?, ?, ?, ?)
+        ON CONFLICT(day, status) DO UPDATE SET
+            orders_count = orders_count + excluded.orders_count,
+            total_sales = total_sales + excluded.total_sales
+    """, totals)
+    by_status = {}
+    for _, status, count, amount in totals:
+        by_status[status] = by_status.get(status, 0) + count
+    conn.execute("UPDATE stats_summary SET orders_count = orders_count + ?, total_sales = total_sales + ? "
+                 "WHERE id = 1", (sum(row[2] for row in totals), sum(row[3] for row in totals)))
+    conn.executemany("UPDATE stats_order_status SET orders_count = orders_count + ? WHERE status = ?",
+                     [(count, status) for status, count in by_status.items()])
+    conn.execute("DELETE FROM sales_dirty_days WHERE day IN (SELECT day FROM temp.archive_days)")
+    return orders, lines
+
+
+def _drop_stale_copies(conn):
+    """Удаляет из архива копии заказов, оставшихся в оперативной базе (пишет только архив).
+
+    Такие копии остаются после сбоя между транзакциями пачки или если заказ
+    изменился между ними; оперативная база для них главная.
+    """
+    with write_transaction(conn):
+        conn.execute(f"DELETE FROM {ARCHIVE}.order_items "
+                     f"WHERE order_id IN (SELECT id FROM main.orders) OR id IN (SELECT id FROM main.order_items)")
+        conn.execute(f"DELETE FROM {ARCHIVE}.orders WHERE id IN (SELECT id FROM main.orders)")
+
+
+def archive(conn, age_days=ARCHIVE_AGE_DAYS, path=None, statuses=CLOSED_STATUSES,
+            batch_orders=BATCH_ORDERS, dry_run=False, progress=None, cancelled=None, today=None):
+    """Переносит закрытые дни старше age_days в архив; возвращает сводку переноса.
+
+    conn — отдельное соединение с оперативной базой вне транзакции. Перед
+    переносом сводки продаж доводятся до текущего состояния: переносятся только
+    учтенные в них заказы. progress(перенесено заказов, всего) — после каждой пачки;
+    cancelled() == True останавливает перенос после зафиксированной пачки.
+    """
+    if age_days < MIN_AGE_DAYS:
+        raise ArchiveError(f"Срок архивации меньше {MIN_AGE_DAYS} дней: "
+                           "сегментация читает заказы последних 12 месяцев из оперативной базы")
+    started = time.perf_counter()
+    cutoff = ((today or date.today()) - timedelta(days=age_days)).isoformat()
+    sales_analytics.refresh(conn)
+    days = _candidate_days(conn, cutoff, statuses)
+    total = sum(count for _, count in days)
+    summary = {'cutoff': cutoff, 'days': len(days), 'orders': 0, 'lines': 0, 'total': total, 'cancelled': False,
+               'path': path or archive_path(_main_path(conn))}
+    if dry_run or not days:
+        summary['ms'] = (time.perf_counter() - started) * 1000
+        return summary
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_days (day TEXT PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)")
+    try:
+        with attached(conn, summary['path'], create=True):
+            _drop_stale_copies(conn)
+            for batch in _batches(days, batch_orders):
+                # Фиксация в двух файлах WAL не атомарна, поэтому пачка фиксируется дважды:
+                # копия в архиве, затем удаление из оперативной базы
+                with write_transaction(conn):
+                    _copy(conn, batch)
+                with write_transaction(conn):
+                    orders, lines = _delete(conn)
+                summary['orders'] += orders
+                summary['lines'] += lines
+                if progress:
+                    progress(summary['orders'], total)
+                if cancelled and cancelled():
+                    summary['cancelled'] = True
+                    break
+            _drop_stale_copies(conn)
+    except OSError as e:
+        raise ArchiveError(f"Файл архива недоступен: {e}") from None
+    summary['ms'] = (time.perf_counter() - started) * 1000
+    return summary
+
+
+def archived_totals(conn):
+    """Итоги перенесенных в архив заказов: (заказов, сумма, {статус: заказов})."""
+    rows = conn.execute("SELECT status, SUM(orders_count), SUM(total_sales) FROM archived_days GROUP BY status")
+    by_status, orders, sales = {}, 0, 0.0
+    for status, count, amount in rows:
+        by_status[status] = count
+        orders += count
+        sales += amount
+    return orders, sales, by_status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перенос закрытых заказов в файл архива")
+    parser.add_argument('--age-days', type=int, default=ARCHIVE_AGE_DAYS, help="переносить заказы старше, дней")
+    parser.add_argument('--archive', help="файл архива (по умолчанию <база>_archive.db)")
+    parser.add_argument('--batch-orders', type=int, default=BATCH_ORDERS)
+    parser.add_argument('--dry-run', action='store_true', help="только посчитать, что будет перенесено")
+    parser.add_argument('--vacuum', action='store_true', help="после переноса сжать файл оперативной базы")
+    parser.add_argument('--db', default=os.environ.get('ERP_DB_PATH', 'erp_database.db'))
+    parser.add_argument('--profile')
+    args = parser.parse_args(argv)
+
+    # Таблица archived_days появилась в миграции схемы
+    from data_access import DataAccess
+    data = DataAccess(args.db, args.profile)
+    conn = data.open_connection()
+    try:
+        summary = archive(conn, args.age_days, args.archive, batch_orders=args.batch_orders,
+                          dry_run=args.dry_run,
+                          progress=lambda done, total: print(f"\r⏳ {done}/{total}", end='', flush=True))
+        if summary['orders']:
+            print()
+        if args.vacuum and summary['orders']:
+            print("🗜  Сжатие оперативной базы...")
+            conn.execute("VACUUM")
+    except ArchiveError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        conn.close()
+        data.close()
+    if args.dry_run:
+        print(f"ℹ️  К переносу: {summary['total']} заказов за {summary['days']} дн. до {summary['cutoff']}")
+    else:
+        print(f"✅ В архив {summary['path']}: {summary['orders']} заказов, {summary['lines']} позиций "
+              f"за {summary['days']} дн. до {summary['cutoff']} — {summary['ms'] / 1000:.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Позиции заказа для раскрытия строки в таблице заказов.
+
+Позиции читаются по одному заказу через покрывающий индекс
+idx_order_items_order(order_id, product_id, quantity, price) и кэшируются
+в ограниченном LRU: повторное раскрытие того же заказа не обращается к базе.
+Позиции заказа после создания не редактируются, поэтому запись кэша
+устаревает только при удалении заказа или переименовании товара.
+"""
+
+from collections import OrderedDict
+
+CACHE_SIZE = 256   # заказов в кэше позиций
+
+LINES_SQL = """
+    SELECT oi.product_id, IFNULL(p.name, 'Товар #' || oi.product_id || ' удален'), oi.quantity, oi.price
+    FROM order_items oi
+    LEFT JOIN products p ON p.id = oi.product_id
+    WHERE oi.order_id = ?
+"""
+
+
+def fetch_order_lines(conn, order_id):
+    """Позиции заказа: список (product_id, название товара, количество, цена).
+
+    Порядок — порядок индекса (по товару): без ORDER BY чтение идет только по индексу.
+    """
+    return conn.execute(LINES_SQL, (order_id,)).fetchall()
+
+
+class OrderLinesCache:
+    """LRU позиций заказов: order_id -> список позиций."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lines = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, order_id):
+        """Позиции заказа из кэша или None."""
+        lines = self._lines.get(order_id)
+        if lines is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._lines.move_to_end(order_id)
+        return lines
+
+    def put(self, order_id, lines):
+        self._lines[order_id] = lines
+        self._lines.move_to_end(order_id)
+        while len(self._lines) > self.maxsize:
+            self._lines.popitem(last=False)
+
+    def discard(self, order_id):
+        self._lines.pop(order_id, None)
+
+    def clear(self):
+        self._lines.clear()
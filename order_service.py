@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Сервис проведения заказов ERP системы.
+
+Шапка заказа, все позиции и движение остатков записываются одной транзакцией:
+либо заказ проведен целиком, либо в базе не остается ничего.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+
+# Статусы заказа в порядке жизненного цикла
+ORDER_STATUSES = ("Новый", "В обработке", "Отправлен", "Доставлен", "Отменен")
+ORDER_ATTEMPTS = 2      # попыток провести заказ, если остатки менялись другим соединением во время списания
+
+
+class OrderError(Exception):
+    """Ошибка при проведении или удалении заказа."""
+
+
+class InsufficientStockError(OrderError):
+    """Недостаточно товара на складе для проведения заказа."""
+
+    def __init__(self, shortages):
+        # shortages — список кортежей (product_id, name, requested, available)
+        self.shortages = shortages
+        lines = [f"{name}: запрошено {requested}, доступно {available}"
+                 for _, name, requested, available in shortages]
+        super().__init__("Недостаточно товара на складе:\n" + "\n".join(lines))
+
+
+@contextmanager
+def write_transaction(conn):
+    """Открывает транзакцию записи (BEGIN IMMEDIATE) и фиксирует или откатывает ее.
+
+    Внутри уже открытой транзакции (задание очереди записи write_queue) блок
+    становится точкой сохранения: ошибка откатывает только его изменения.
+    """
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT write_transaction")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO write_transaction")
+            conn.execute("RELEASE write_transaction")
+            raise
+        conn.execute("RELEASE write_transaction")
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def run_write(conn, writes, fn):
+    """Выполняет fn(соединение) одной записью и возвращает ее результат.
+
+    С очередью записи writes (write_queue.WriteQueue) fn выполняется заданием
+    очереди на соединении записи; без нее — в транзакции write_transaction на conn.
+    """
+    if writes is not None:
+        return writes.call(fn)
+    with write_transaction(conn):
+        return fn(conn)
+
+
+class OrderService:
+    """Создание и удаление заказов с атомарным списанием и возвратом остатков."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def create_order(self, customer_id, items, status="Новый", conn=None, reservation=None):
+        """Проводит заказ целиком и возвращает его id.
+
+        items — список словарей с ключами product_id, quantity, price.
+        conn — соединение для записи; без него заказ проводится через очередь записи базы.
+        reservation — token резервов формы заказа (stock_reservations): в той же
+        транзакции они снимаются и превращаются в списание.
+        """
+        if not items:
+            raise OrderError("Заказ не содержит позиций.")
+        if conn is None:
+            return self.db.writes.call(
+                lambda conn: self.create_order(customer_id, items, status, conn=conn, reservation=reservation))
+        for _ in range(ORDER_ATTEMPTS):
+            try:
+                with write_transaction(conn):
+                    if reservation is not None:
+                        from stock_reservations import release_for_order
+                        release_for_order(conn, reservation, self._demand(items))
+                    return self._create_order(conn, customer_id, items, status)
+            except InsufficientStockError:
+                # Транзакция уже откатена — описываем нехватку по актуальным остаткам
+                shortages = self._find_shortages(conn, self._demand(items))
+                if shortages:
+                    raise InsufficientStockError(shortages) from None
+                # Остатков уже хватает: их вернуло другое соединение после списания — пробуем снова
+        raise OrderError("Остатки товаров менялись во время проведения заказа. Повторите попытку.")
+
+    def delete_order(self, order_id, conn=None):
+        """Удаляет заказ с позициями и возвращает товар на склад (без conn — через очередь записи)."""
+        if conn is None:
+            return self.db.writes.call(lambda conn: self.delete_order(order_id, conn=conn))
+        with write_transaction(conn):
+            self._delete_order(conn, order_id)
+
+    @staticmethod
+    def _demand(items):
+        """Суммирует количество по товарам: одна строка UPDATE на товар."""
+        demand = {}
+        for item in items:
+            demand[item['product_id']] = demand.get(item['product_id'], 0) + item['quantity']
+        return demand
+
+    def _create_order(self, conn, customer_id, items, status):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        total_amount = sum(item['quantity'] * item['price'] for item in items)
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO orders (customer_id, total_amount, status, created_date) VALUES (?, ?, ?, ?)",
+            (customer_id, total_amount, status, now))
+        order_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+            [(order_id, item['product_id'], item['quantity'], item['price']) for item in items])
+        # Списание остатков с проверкой прямо в базе: строка без достаточного
+        # свободного (не зарезервированного другими формами) остатка не обновится,
+        # и количество измененных строк не сойдется
+        demand = self._demand(items)
+        cursor.executemany(
+            "UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity - reserved >= ?",
+            [(qty, product_id, qty) for product_id, qty in demand.items()])
+        if cursor.rowcount != len(demand):
+            raise InsufficientStockError([])
+        # В журнал аудита — после фиксации задания очереди записи, если она состоится
+        self.db.audit.record('insert', 'orders', order_id, None, {
+            'customer_id': customer_id, 'total_amount': total_amount, 'status': status, 'created_date': now,
+            'items': [[item['product_id'], item['quantity'], item['price']] for item in items]})
+        return order_id
+
+    def _delete_order(self, conn, order_id):
+        cursor = conn.cursor()
+        # Заказ с позициями до удаления — для журнала аудита
+        header = cursor.execute(
+            "SELECT customer_id, total_amount, status, created_date FROM orders WHERE id = ?", (order_id,)).fetchone()
+        lines = cursor.execute(
+            "SELECT product_id, quantity, price FROM order_items WHERE order_id = ?", (order_id,)).fetchall()
+        cursor.execute("""
+            UPDATE products
+            SET quantity = quantity + (
+                SELECT SUM(oi.quantity) FROM order_items oi
+                WHERE oi.order_id = ? AND oi.product_id = products.id
+            )
+            WHERE id IN (SELECT product_id FROM order_items WHERE order_id = ?)
+        """, (order_id, order_id))
+        cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+        cursor.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+        if cursor.rowcount == 0:
+            raise OrderError(f"Заказ #{order_id:04d} не найден.")
+        self.db.audit.record('delete', 'orders', order_id, {
+            **dict(zip(('customer_id', 'total_amount', 'status', 'created_date'), header)),
+            'items': [list(line) for line in lines]}, None)
+
+    @staticmethod
+    def _find_shortages(conn, demand):
+        placeholders = ", ".join("?" for _ in demand)
+        cursor = conn.execute(
+            f"SELECT id, name, quantity - reserved FROM products WHERE id IN ({placeholders})",
+            list(demand))
+        found = {pid: (name, max(qty, 0)) for pid, name, qty in cursor.fetchall()}
+        shortages = []
+        for product_id, requested in demand.items():
+            name, available = found.get(product_id, (f"товар #{product_id}", 0))
+            if available < requested:
+                shortages.append((product_id, name, requested, available))
+        return shortages
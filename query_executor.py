@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновый исполнитель запросов к SQLite для Tkinter-интерфейса.
+
+Запросы выполняются в рабочих потоках, у каждого из которых свое соединение
+с базой. Результаты возвращаются в главный поток Tk через root.after, поэтому
+виджеты обновляются только из главного цикла, а сам цикл никогда не ждет базу.
+"""
+
+import queue
+import sys
+import threading
+
+WORKERS = 2      # число рабочих потоков
+POLL_MS = 20     # период опроса готовых результатов, пока есть задания
+
+
+class Job:
+    """Задание исполнителя: функция от соединения и обработчики результата."""
+
+    __slots__ = ('fn', 'on_done', 'on_error', 'scope', 'cancelled')
+
+    def __init__(self, fn, on_done, on_error, scope):
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.scope = scope
+        self.cancelled = False
+
+
+class QueryExecutor:
+    """Пул рабочих потоков со своими соединениями SQLite.
+
+    connect — фабрика соединений (вызывается один раз в каждом рабочем потоке).
+    on_busy(bool) — вызывается, когда появляются первые или завершаются последние задания.
+    on_error(exc) — обработчик ошибок для заданий без собственного on_error.
+    """
+
+    def __init__(self, root, connect, workers=WORKERS, poll_ms=POLL_MS, on_busy=None, on_error=None):
+        self.root = root
+        self.connect = connect
+        self.poll_ms = poll_ms
+        self.on_busy = on_busy
+        self.on_error = on_error
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._pending = {}      # область -> множество незавершенных заданий
+        self._count = 0
+        self._polling = False
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"erp-query-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # ------------------ ГЛАВНЫЙ ПОТОК ------------------
+
+    def submit(self, fn, on_done=None, on_error=None, scope=None):
+        """Ставит в очередь fn(conn); on_done(result) будет вызван в главном потоке.
+
+        Задания с одинаковым scope можно отменить разом через cancel(scope).
+        """
+        job = Job(fn, on_done, on_error, scope)
+        self._pending.setdefault(scope, set()).add(job)
+        self._count += 1
+        if self._count == 1 and self.on_busy:
+            self.on_busy(True)
+        self._jobs.put(job)
+        self._schedule_poll()
+        return job
+
+    def query(self, sql, params=(), on_done=None, on_error=None, scope=None):
+        """Выполняет SELECT в фоне и передает on_done список строк."""
+        return self.submit(lambda conn: conn.execute(sql, params).fetchall(), on_done, on_error, scope)
+
+    def cancel(self, scope):
+        """Отменяет незавершенные задания области: они не выполнятся или их результат будет отброшен."""
+        jobs = self._pending.pop(scope, ())
+        for job in jobs:
+            job.cancelled = True
+        self._count -= len(jobs)
+        if jobs and self._count == 0 and self.on_busy:
+            self.on_busy(False)
+
+    @property
+    def pending(self):
+        """Число заданий, результат которых еще не доставлен."""
+        return self._count
+
+    def shutdown(self):
+        """Останавливает рабочие потоки после завершения уже начатых заданий."""
+        for _ in self._threads:
+            self._jobs.put(None)
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        """Доставляет готовые результаты обработчикам (выполняется в главном потоке)."""
+        self._polling = False
+        while True:
+            try:
+                job, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if job.cancelled:
+                continue
+            self._pending.get(job.scope, set()).discard(job)
+            self._count -= 1
+            try:
+                if error is not None:
+                    handler = job.on_error or self.on_error
+                    if handler is None:
+                        raise error
+                    handler(error)
+                elif job.on_done:
+                    job.on_done(result)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        if self._count > 0:
+            self._schedule_poll()
+        elif self.on_busy:
+            self.on_busy(False)
+
+    # ------------------ РАБОЧИЕ ПОТОКИ ------------------
+
+    def _worker(self):
+        conn = None
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if job.cancelled:
+                continue
+            try:
+                if conn is None:
+                    conn = self.connect()
+                result, error = job.fn(conn), None
+            except Exception as e:
+                result, error = None, e
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+            self._results.put((job, result, error))
+        if conn is not None:
+            conn.close()
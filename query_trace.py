@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Трассировка SQL-запросов: сводка по запросам, журнал медленных запросов и их планы.
+
+Все соединения открываются через ConnectionProfile.connect с фабрикой
+TracedConnection, поэтому трассируется любой execute/executemany — и через
+conn.execute, и через cursor(). Пока трассировка выключена, соединение отдает
+обычные курсоры sqlite3 и не делает ничего, кроме одной проверки флага.
+
+Включенная трассировка (enable) группирует запросы по нормализованному тексту
+(литералы и списки IN заменены на ?) и копит для каждого число выполнений,
+строки, суммарное и максимальное время и гистограмму задержек. Время запроса
+включает выборку строк: запрос считается завершенным, когда курсор прочитан
+до конца, закрыт или выполнен заново. Запросы дольше порога пишутся в
+ротируемый журнал вместе с EXPLAIN QUERY PLAN; полный проход таблицы и
+временное B-дерево для сортировки отмечаются в плане.
+
+Включение без правки кода: ERP_SQL_TRACE=1, порог — ERP_SQL_SLOW_MS,
+файл журнала — ERP_SQL_SLOW_LOG; в интерфейсе — кнопка на экране статистики.
+"""
+
+import bisect
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SLOW_MS = 50.0                      # порог медленного запроса, мс
+SLOW_LOG = 'slow_queries.log'
+LOG_MAX_BYTES = 1024 ** 2           # размер файла журнала до ротации
+LOG_BACKUPS = 3                     # сколько старых файлов журнала хранить
+# верхние границы корзин гистограммы, мс; последняя корзина — все, что дольше
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+MAX_STATEMENTS = 2000               # нормализованных запросов в сводке и в кэше нормализации
+
+_SPACES = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+_normalized = {}      # исходный текст -> нормализованный: тексты запросов в коде повторяются
+_tracer = None        # активный QueryTracer или None, если трассировка выключена
+_settings = (SLOW_MS, SLOW_LOG)     # порог и файл журнала для enable() без аргументов
+
+
+def normalize(sql):
+    """Текст запроса без литералов и лишних пробелов: одинаков для всех значений параметров."""
+    text = _normalized.get(sql)
+    if text is None:
+        text = _SPACES.sub(' ', sql).strip()
+        text = _IN_LIST.sub('(?, ...)', _LITERALS.sub('?', text))
+        if len(_normalized) >= MAX_STATEMENTS:
+            _normalized.clear()
+        _normalized[sql] = text
+    return text
+
+
+def param_shape(parameters):
+    """Типы параметров без значений: (int, str) или {id: int}."""
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+
+def _many_shape(seq):
+    if isinstance(seq, (list, tuple)):
+        return f"{len(seq)} × {param_shape(seq[0])}" if seq else "0 строк"
+    return "поток строк"
+
+
+def explain(conn, sql, parameters=()):
+    """Строки EXPLAIN QUERY PLAN запроса или пустой список, если план получить нельзя."""
+    try:
+        # Обычный курсор sqlite3: сам EXPLAIN не должен попадать в трассировку
+        cursor = sqlite3.Cursor(conn)
+        try:
+            return [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        finally:
+            cursor.close()
+    except sqlite3.Error:
+        # Другой поток, закрытое соединение или executemany без параметров — без плана
+        return []
+
+
+def plan_warnings(plan):
+    """Пометки к строкам плана: полный проход таблицы и сортировка во временном B-дереве."""
+    warnings = []
+    for line in plan:
+        if line.startswith('SCAN ') and ' USING ' not in line:
+            warnings.append(f"полный проход: {line}")
+        elif line.startswith('USE TEMP B-TREE'):
+            warnings.append(f"сортировка без индекса: {line}")
+    return warnings
+
+
+class StatementStats:
+    """Накопленная статистика одного нормализованного запроса."""
+
+    __slots__ = ('sql', 'count', 'rows', 'total_ms', 'max_ms', 'buckets', 'shapes', 'slow', 'plan')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.shapes = {}    # форма параметров -> число выполнений
+        self.slow = 0
+        self.plan = None    # план снимается при первом медленном выполнении
+
+    def as_dict(self):
+        return {
+            'sql': self.sql, 'count': self.count, 'rows': self.rows,
+            'total_ms': self.total_ms, 'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'max_ms': self.max_ms, 'slow': self.slow, 'shapes': dict(self.shapes),
+            'histogram': dict(zip([f"≤{bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], self.buckets)),
+            'plan': self.plan, 'warnings': plan_warnings(self.plan or []),
+        }
+
+
+class QueryTracer:
+    """Сводка по запросам и журнал медленных запросов."""
+
+    def __init__(self, slow_ms=SLOW_MS, log_path=SLOW_LOG, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.started = datetime.now()
+        # RLock: __del__ курсора может сработать при сборке мусора внутри record в том же потоке
+        self._lock = threading.RLock()
+        self._statements = {}     # нормализованный текст -> StatementStats
+        self._logger = None
+        if log_path:
+            self._logger = logging.getLogger(f"{__name__}.slow.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._logger.addHandler(handler)
+
+    def record(self, conn, sql, parameters, shape, elapsed, rows):
+        """Учитывает завершенный запрос; медленный пишет в журнал вместе с планом."""
+        elapsed_ms = elapsed * 1000
+        slow = elapsed_ms >= self.slow_ms
+        with self._lock:
+            key = normalize(sql)
+            stats = self._statements.get(key)
+            if stats is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    return
+                stats = self._statements[key] = StatementStats(key)
+            stats.count += 1
+            stats.rows += max(rows, 0)
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+            stats.shapes[shape] = stats.shapes.get(shape, 0) + 1
+            if not slow:
+                return
+            stats.slow += 1
+            need_plan = stats.plan is None
+        # План снимается вне блокировки: EXPLAIN обращается к базе
+        if need_plan:
+            stats.plan = explain(conn, sql, parameters)
+        if self._logger:
+            lines = [f"{elapsed_ms:.1f} мс | строк {rows} | {threading.current_thread().name} | {key}",
+                     f"    параметры: {shape}"]
+            lines += [f"    план: {line}" for line in stats.plan or []]
+            lines += [f"    ⚠ {warning}" for warning in plan_warnings(stats.plan or [])]
+            self._logger.info("\n".join(lines))
+
+    def snapshot(self, order_by='total_ms', limit=None):
+        """Статистика запросов (словари), самые затратные первыми."""
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._statements.values()]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def report(self, limit=10):
+        """Короткий текстовый отчет: самые затратные запросы по суммарному времени."""
+        rows = self.snapshot(limit=limit)
+        if not rows:
+            return "Запросов пока не было"
+        lines = []
+        for row in rows:
+            sql = row['sql'] if len(row['sql']) <= 90 else row['sql'][:87] + '...'
+            mark = " ⚠" if row['warnings'] else ""
+            lines.append(f"{row['total_ms']:9.1f} мс  ×{row['count']:<6} ср. {row['avg_ms']:7.2f}  "
+                         f"макс. {row['max_ms']:7.1f}  медленных {row['slow']}{mark}  {sql}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    def close(self):
+        if self._logger:
+            for handler in list(self._logger.handlers):
+                handler.close()
+                self._logger.removeHandler(handler)
+
+
+# ------------------ ВКЛЮЧЕНИЕ ------------------
+
+def configure(slow_ms=None, log_path=None):
+    """Запоминает порог и файл журнала для следующих включений; None — оставить прежнее значение.
+
+    Возвращает действующие (порог, файл журнала).
+    """
+    global _settings
+    _settings = (_settings[0] if slow_ms is None else slow_ms, _settings[1] if log_path is None else log_path)
+    return _settings
+
+
+def enable(slow_ms=None, log_path=None):
+    """Включает трассировку для всех соединений и возвращает трассировщик.
+
+    Порог и файл журнала, не заданные здесь, берутся из configure() —
+    повторное включение (кнопка интерфейса) сохраняет настройки запуска.
+    """
+    global _tracer
+    disable()
+    _tracer = QueryTracer(*configure(slow_ms, log_path))
+    return _tracer
+
+
+def disable():
+    """Выключает трассировку; накопленная сводка остается у возвращенного трассировщика."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def active():
+    """Активный трассировщик или None."""
+    return _tracer
+
+
+def configure_from_env(environ=None):
+    """Берет порог и файл из ERP_SQL_SLOW_MS/ERP_SQL_SLOW_LOG; True — задано ERP_SQL_TRACE=1."""
+    environ = os.environ if environ is None else environ
+    slow_ms = environ.get('ERP_SQL_SLOW_MS')
+    configure(float(slow_ms) if slow_ms else None, environ.get('ERP_SQL_SLOW_LOG') or None)
+    return environ.get('ERP_SQL_TRACE', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def enable_from_env(environ=None):
+    """Включает трассировку, если задано ERP_SQL_TRACE=1 (порог и файл — ERP_SQL_SLOW_MS/ERP_SQL_SLOW_LOG)."""
+    return enable() if configure_from_env(environ) else None
+
+
+# ------------------ СОЕДИНЕНИЕ И КУРСОР ------------------
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор, который измеряет запрос от execute до последней прочитанной строки."""
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        tracer = _tracer
+        if tracer is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._trace = [tracer, sql, parameters, param_shape(parameters), time.perf_counter() - started, 0]
+        if self.description is None:
+            # INSERT/UPDATE/DELETE/DDL: строк для выборки нет, запрос уже завершен
+            self._finish(self.rowcount)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        tracer = _tracer
+        if tracer is None:
+            return super().executemany(sql, seq_of_parameters)
+        shape = _many_shape(seq_of_parameters)
+        # План executemany снимается с параметрами первой строки, если они известны заранее
+        first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else ()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._trace = [tracer, sql, first, shape, time.perf_counter() - started, 0]
+        self._finish(self.rowcount)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), len(rows) < (self.arraysize if size is None else size))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Курсор бросили, не дочитав (например, execute(...).fetchone()) — запрос завершен здесь
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _fetched(self, started, rows, exhausted):
+        trace = getattr(self, '_trace', None)
+        if trace is None:
+            return
+        trace[4] += time.perf_counter() - started
+        trace[5] += rows
+        if exhausted:
+            self._finish()
+
+    def _finish(self, rows=None):
+        trace = getattr(self, '_trace', None)
+        if trace is None:
+            return
+        self._trace = None
+        tracer, sql, parameters, shape, elapsed, fetched = trace
+        tracer.record(self.connection, sql, parameters, shape, elapsed, fetched if rows is None else rows)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Соединение, курсоры которого трассируются, пока трассировка включена."""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TracedCursor if _tracer is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
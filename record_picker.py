@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Поле выбора записи (товара, клиента) с подбором вариантов при наборе.
+
+Вместо загрузки всей таблицы в выпадающий список поле держит только
+несколько лучших совпадений с введенным текстом. Варианты запрашиваются
+асинхронно после паузы в наборе, а выбранная запись определяется по id —
+одинаковые названия у разных записей не путаются.
+"""
+
+from tkinter import ttk
+
+DEBOUNCE_MS = 200  # пауза в наборе, после которой запрашиваются варианты
+
+# Клавиши навигации не меняют текст и не должны вызывать новый запрос
+_NAVIGATION_KEYS = {'Up', 'Down', 'Left', 'Right', 'Return', 'KP_Enter', 'Escape', 'Tab',
+                    'Home', 'End', 'Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R'}
+
+
+class RecordPicker(ttk.Combobox):
+    """Редактируемый Combobox, варианты которого подбираются по введенному тексту.
+
+    fetch(text, callback) асинхронно получает строки вариантов (id — первый
+    элемент) и передает их в callback; label(row) — текст варианта.
+    """
+
+    def __init__(self, parent, fetch, label, debounce_ms=DEBOUNCE_MS, **kwargs):
+        super().__init__(parent, **kwargs)
+        self._fetch = fetch
+        self._label = label
+        self._debounce_ms = debounce_ms
+        self._variants = {}     # текст варианта -> строка записи
+        self._selected = None   # строка выбранной записи
+        self._after_id = None
+        self._request = 0       # номер последнего запроса: ответы на старые отбрасываются
+        self.bind('<KeyRelease>', self._on_key)
+        self.bind('<<ComboboxSelected>>', self._on_selected)
+        self.refresh()
+
+    def refresh(self):
+        """Запрашивает варианты для текущего текста поля."""
+        self._after_id = None
+        self._request += 1
+        request = self._request
+        self._fetch(self.get(), lambda rows: self._show(request, rows))
+
+    def selected(self):
+        """Строка выбранной записи или None, если текст не совпадает ни с одним вариантом."""
+        if self._selected is not None:
+            return self._selected
+        return self._variants.get(self.get())
+
+    def _on_key(self, event):
+        if event.keysym in _NAVIGATION_KEYS:
+            return
+        self._selected = None
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self._after_id = self.after(self._debounce_ms, self.refresh)
+
+    def _on_selected(self, event):
+        self._selected = self._variants.get(self.get())
+
+    def _show(self, request, rows):
+        if request != self._request or not self.winfo_exists():
+            return
+        self._variants = {self._label(row): row for row in rows}
+        self['values'] = list(self._variants)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Общий кэш справочных записей: товары, клиенты и пользователи по id.
+
+Записи читаются из базы по первичному ключу при первом обращении и дальше
+отдаются из памяти. Изменения, сделанные через Database.insert/update/delete,
+применяются к кэшу сразу (Database уведомляет подписчиков). Запись в файл
+из другого соединения или процесса обнаруживается по PRAGMA data_version
+основного соединения — тогда кэш очищается целиком. Фиксации очереди записи
+самого приложения data_version тоже меняют, но кэш не сбрасывают: они
+отличаются по WriteQueue.generation(), а их изменения уже пришли через
+уведомления (или discard() — для записей, которые меняет проведение заказа).
+
+Кэш используется из главного потока (вместе с основным соединением Database).
+Объем ограничен числом строк: при переполнении вытесняются давно не
+запрошенные записи.
+"""
+
+from collections import OrderedDict
+
+TABLES = ('products', 'customers', 'users')
+MAX_ROWS = 50000        # строк во всех таблицах вместе
+IN_CHUNK = 500          # id в одном запросе WHERE id IN (...)
+
+
+class ReferenceCache:
+    """Записи справочных таблиц по id с вытеснением давно не использованных."""
+
+    def __init__(self, db, tables=TABLES, max_rows=MAX_ROWS):
+        self.db = db
+        self.tables = tables
+        self.max_rows = max_rows
+        self._rows = OrderedDict()   # (таблица, id) -> словарь колонка -> значение
+        self._data_version = None
+        self._generation = None     # WriteQueue.generation() на момент чтения _data_version
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        db.add_listener(self.on_change)
+
+    def get(self, table, record_id):
+        """Запись по id (словарь колонка -> значение) или None, если ее нет."""
+        return self.get_many(table, [record_id]).get(int(record_id))
+
+    def get_many(self, table, ids):
+        """Записи по списку id: {id: словарь}; недостающие читаются одним запросом на пачку."""
+        self._check_version()
+        found, missing = {}, []
+        for record_id in ids:
+            record_id = int(record_id)
+            row = self._rows.get((table, record_id))
+            if row is None:
+                missing.append(record_id)
+            else:
+                self._rows.move_to_end((table, record_id))
+                found[record_id] = row
+        self.hits += len(found)
+        self.misses += len(missing)
+        for start in range(0, len(missing), IN_CHUNK):
+            chunk = missing[start:start + IN_CHUNK]
+            for row in self._load(table, chunk):
+                self._store(table, row)
+                found[row['id']] = row
+        return found
+
+    def on_change(self, table, action, record_id, values):
+        """Применяет изменение, сделанное через Database, к закэшированной записи."""
+        if table not in self.tables or record_id is None:
+            return
+        key = (table, int(record_id))
+        if action == 'delete':
+            self._rows.pop(key, None)
+        elif action == 'update':
+            row = self._rows.get(key)
+            if row is not None and 'version' in row and 'version' not in values:
+                # Версию строки увеличил триггер — ее новое значение знает только база
+                self._rows.pop(key)
+            elif row is not None:
+                row.update(values)
+        elif action == 'insert':
+            # Значения по умолчанию знает только база — новая запись читается целиком
+            for row in self._load(table, [int(record_id)]):
+                self._store(table, row)
+
+    def discard(self, table, ids):
+        """Забывает записи ids: их изменили в обход Database (например, остатки при проведении заказа)."""
+        for record_id in ids:
+            self._rows.pop((table, int(record_id)), None)
+
+    def invalidate(self):
+        """Очищает кэш целиком."""
+        self._rows.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        """Счетчики кэша для отображения и диагностики."""
+        return {'rows': len(self._rows), 'max_rows': self.max_rows, 'hits': self.hits,
+                'misses': self.misses, 'invalidations': self.invalidations, 'evictions': self.evictions}
+
+    def _check_version(self):
+        # data_version меняется, только когда коммит сделан другим соединением
+        version = self.db.connect().execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        generation = self.db.writes.generation()
+        if self._data_version is not None and self._rows:
+            commits, external = generation
+            # Очередь ничего не фиксировала или заметила чужую фиксацию — изменение не наше
+            if commits == self._generation[0] or external != self._generation[1]:
+                self.invalidate()
+        self._data_version = version
+        self._generation = generation
+
+    def _load(self, table, ids):
+        cursor = self.db.connect().execute(
+            f"SELECT * FROM {table} WHERE id IN ({', '.join('?' for _ in ids)})", ids)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def _store(self, table, row):
+        key = (table, row['id'])
+        self._rows[key] = row
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_rows:
+            self._rows.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Дневные сводки продаж для графиков экрана статистики.
+
+Сводки хранятся в трех таблицах с ключом по дню:
+
+    sales_daily          — день, товар, клиент: заказы, количество, выручка
+                           (категория товара — на момент расчета);
+    sales_daily_category — день, категория: количество и выручка;
+    sales_daily_status   — день, статус: число заказов и их сумма.
+
+Сводки догоняют orders/order_items по водяному знаку — id последнего
+учтенного заказа: refresh() добавляет только заказы после него, пачками по
+отдельной транзакции. Изменения уже учтенных заказов (удаление, смена
+статуса или суммы, правка позиций, смена категории товара) триггеры
+отмечают в sales_dirty_days, и refresh() пересчитывает эти дни целиком.
+Дни, перенесенные в архив (order_archive, таблица archived_days), больше не
+пересчитываются: их заказов в базе нет, а сводки дня уже окончательные.
+Графики за год читают несколько сотен строк сводок вместо всех позиций
+заказов; помесячные ряды получаются группировкой дневных строк.
+"""
+
+import time
+from datetime import date, timedelta
+
+from order_service import run_write
+
+REFRESH_BATCH = 50000       # заказов в одной транзакции догоняющего расчета
+# Через очередь записи пачка не должна задерживать записи интерфейса дольше бюджета очереди (~20 мс)
+QUEUE_BATCH = 1000          # заказов в одном задании очереди записи
+QUEUE_DAYS = 1              # отмеченных дней в одном задании очереди записи
+# Порядок статусов в воронке; прочие статусы идут следом по числу заказов
+FUNNEL = ("Новый", "В обработке", "Отправлен", "Доставлен", "Отменен")
+
+_WATERMARK = "(SELECT watermark FROM sales_rollup_state WHERE id = 1)"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        category TEXT NOT NULL DEFAULT '',
+        orders_count INTEGER NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, customer_id)
+    ) WITHOUT ROWID
+    """,
+    # Дни, в которых продавался товар: нужны при смене его категории
+    "CREATE INDEX IF NOT EXISTS idx_sales_daily_product ON sales_daily(product_id, day)",
+    """
+    CREATE TABLE IF NOT EXISTS sales_daily_category (
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_daily_status (
+        day TEXT NOT NULL,
+        status TEXT NOT NULL,
+        orders_count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, status)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_rollup_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        watermark INTEGER NOT NULL DEFAULT 0,
+        refreshed_at TEXT
+    )
+    """,
+    "INSERT OR IGNORE INTO sales_rollup_state (id) VALUES (1)",
+    "CREATE TABLE IF NOT EXISTS sales_dirty_days (day TEXT PRIMARY KEY) WITHOUT ROWID",
+    # Заказы после водяного знака триггеры не трогают: их учтет следующий refresh()
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sales_orders_delete AFTER DELETE ON orders
+    WHEN OLD.id <= {_WATERMARK} BEGIN
+        INSERT OR IGNORE INTO sales_dirty_days (day) VALUES (substr(OLD.created_date, 1, 10));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sales_orders_update
+    AFTER UPDATE OF customer_id, total_amount, status, created_date ON orders
+    WHEN OLD.id <= {_WATERMARK} AND (OLD.customer_id IS NOT NEW.customer_id OR OLD.status IS NOT NEW.status
+        OR OLD.total_amount IS NOT NEW.total_amount OR OLD.created_date IS NOT NEW.created_date) BEGIN
+        INSERT OR IGNORE INTO sales_dirty_days (day)
+        VALUES (substr(OLD.created_date, 1, 10)), (substr(NEW.created_date, 1, 10));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sales_items_insert AFTER INSERT ON order_items
+    WHEN NEW.order_id <= {_WATERMARK} BEGIN
+        INSERT OR IGNORE INTO sales_dirty_days (day)
+        SELECT substr(created_date, 1, 10) FROM orders WHERE id = NEW.order_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sales_items_update AFTER UPDATE ON order_items
+    WHEN OLD.order_id <= {_WATERMARK} OR NEW.order_id <= {_WATERMARK} BEGIN
+        INSERT OR IGNORE INTO sales_dirty_days (day)
+        SELECT substr(created_date, 1, 10) FROM orders WHERE id IN (OLD.order_id, NEW.order_id);
+    END
+    """,
+    # Позиции удаляются раньше заказа; если заказа уже нет, день отметил триггер на orders
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_sales_items_delete AFTER DELETE ON order_items
+    WHEN OLD.order_id <= {_WATERMARK} BEGIN
+        INSERT OR IGNORE INTO sales_dirty_days (day)
+        SELECT substr(created_date, 1, 10) FROM orders WHERE id = OLD.order_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_sales_products_category AFTER UPDATE OF category ON products
+    WHEN OLD.category IS NOT NEW.category BEGIN
+        INSERT OR IGNORE INTO sales_dirty_days (day)
+        SELECT DISTINCT day FROM sales_daily WHERE product_id = NEW.id;
+    END
+    """,
+]
+
+# Позиции заказов, сгруппированные до строк sales_daily; {where} — условие на o
+_ITEMS_ROLLUP = """
+    INSERT INTO temp.sales_batch (day, product_id, customer_id, category, orders_count, quantity, revenue)
+    SELECT substr(o.created_date, 1, 10), oi.product_id, o.customer_id, IFNULL(p.category, ''),
+           COUNT(DISTINCT o.id), SUM(oi.quantity), SUM(oi.quantity * oi.price)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    LEFT JOIN products p ON p.id = oi.product_id
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+"""
+_STATUS_ROLLUP = """
+    INSERT INTO sales_daily_status (day, status, orders_count, revenue)
+    SELECT substr(created_date, 1, 10), status, COUNT(*), SUM(total_amount)
+    FROM orders o
+    WHERE {where}
+    GROUP BY 1, 2
+    ON CONFLICT(day, status) DO UPDATE SET
+        orders_count = orders_count + excluded.orders_count,
+        revenue = revenue + excluded.revenue
+"""
+# Пачки заказов не пересекаются, поэтому строки с тем же ключом складываются
+_MERGE_BATCH = [
+    """
+    INSERT INTO sales_daily (day, product_id, customer_id, category, orders_count, quantity, revenue)
+    SELECT day, product_id, customer_id, category, orders_count, quantity, revenue
+    FROM temp.sales_batch WHERE true
+    ON CONFLICT(day, product_id, customer_id) DO UPDATE SET
+        orders_count = orders_count + excluded.orders_count,
+        quantity = quantity + excluded.quantity,
+        revenue = revenue + excluded.revenue
+    """,
+    """
+    INSERT INTO sales_daily_category (day, category, quantity, revenue)
+    SELECT day, category, SUM(quantity), SUM(revenue)
+    FROM temp.sales_batch
+    GROUP BY day, category
+    ON CONFLICT(day, category) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        revenue = revenue + excluded.revenue
+    """,
+    "DELETE FROM temp.sales_batch",
+]
+_BY_ID_RANGE = "o.id > ? AND o.id <= ?"
+_BY_DAY = "o.created_date >= ? AND o.created_date < ? AND o.id <= ?"
+
+
+def _prepare(conn):
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS sales_batch (
+            day TEXT, product_id INTEGER, customer_id INTEGER, category TEXT,
+            orders_count INTEGER, quantity INTEGER, revenue REAL
+        )
+    """)
+
+
+def _roll_up(conn, where, params):
+    """Добавляет к сводкам заказы, отобранные условием where."""
+    conn.execute(_ITEMS_ROLLUP.format(where=where), params)
+    conn.execute(_STATUS_ROLLUP.format(where=where), params)
+    for sql in _MERGE_BATCH:
+        conn.execute(sql)
+
+
+def _rebuild_day(conn, day, watermark):
+    """Пересчитывает сводки дня day по уже учтенным заказам."""
+    for table in ('sales_daily', 'sales_daily_category', 'sales_daily_status'):
+        conn.execute(f"DELETE FROM {table} WHERE day = ?", (day,))
+    next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+    _roll_up(conn, _BY_DAY, (day, next_day, watermark))
+
+
+def _watermark(conn):
+    return conn.execute("SELECT watermark FROM sales_rollup_state WHERE id = 1").fetchone()[0]
+
+
+def _refresh_dirty(conn, limit=-1):
+    """Пересчитывает до limit отмеченных дней (-1 — все); возвращает их число."""
+    _prepare(conn)
+    watermark = _watermark(conn)
+    # Архивный день отмечается только сменой категории товара — его сводки не меняются
+    conn.execute("DELETE FROM sales_dirty_days WHERE day IN (SELECT day FROM archived_days)")
+    days = [row[0] for row in conn.execute("SELECT day FROM sales_dirty_days ORDER BY day LIMIT ?", (limit,))]
+    for day in days:
+        _rebuild_day(conn, day, watermark)
+        conn.execute("DELETE FROM sales_dirty_days WHERE day = ?", (day,))
+    return len(days)
+
+
+def _refresh_batch(conn, batch, count=False):
+    """Добавляет к сводкам до batch заказов после водяного знака.
+
+    Возвращает (добавлено заказов или None, если добавлять нечего; заказов
+    после знака до пачки — только при count, иначе None).
+    """
+    _prepare(conn)
+    watermark = _watermark(conn)
+    pending = None
+    if count:
+        pending = conn.execute("SELECT COUNT(*) FROM orders WHERE id > ?", (watermark,)).fetchone()[0]
+    # Граница пачки — id batch-го заказа после водяного знака (или последний заказ)
+    upper = conn.execute("SELECT id FROM orders WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+                         (watermark, batch - 1)).fetchone()
+    upper = upper[0] if upper else conn.execute("SELECT MAX(id) FROM orders").fetchone()[0]
+    if upper is None or upper <= watermark:
+        return None, pending
+    _roll_up(conn, _BY_ID_RANGE, (watermark, upper))
+    added = conn.execute("SELECT COUNT(*) FROM orders WHERE id > ? AND id <= ?",
+                         (watermark, upper)).fetchone()[0]
+    conn.execute("UPDATE sales_rollup_state SET watermark = ?, refreshed_at = datetime('now', 'localtime') "
+                 "WHERE id = 1", (upper,))
+    return added, pending
+
+
+def refresh(conn, batch=None, progress=None, writes=None):
+    """Доводит сводки до текущего состояния заказов.
+
+    Сначала пересчитываются отмеченные дни, затем добавляются новые заказы
+    пачками по batch, каждая в своей транзакции: долгий первый расчет на
+    большой базе не держит блокировку записи целиком. С очередью записи
+    writes (write_queue) каждая пачка — отдельное задание очереди, и пачки
+    мельче (QUEUE_BATCH заказов, QUEUE_DAYS дней), чтобы сохранение формы не
+    ждало за пачкой; без очереди — транзакция на conn по REFRESH_BATCH
+    заказов. progress(учтено, всего) вызывается после каждой пачки.
+    Возвращает {'days': пересчитано дней, 'orders': добавлено заказов, 'ms': время}.
+    """
+    started = time.perf_counter()
+    queued = writes is not None
+    if batch is None:
+        batch = QUEUE_BATCH if queued else REFRESH_BATCH
+    day_limit = QUEUE_DAYS if queued else -1
+    days = 0
+    while True:
+        rebuilt = run_write(conn, writes, lambda conn: _refresh_dirty(conn, day_limit))
+        days += rebuilt
+        if rebuilt < day_limit or day_limit < 0:
+            break
+    added = 0
+    total = None
+    while True:
+        batch_added, pending = run_write(conn, writes, lambda conn: _refresh_batch(conn, batch, total is None))
+        if total is None:
+            total = pending
+        if batch_added is None:
+            break
+        added += batch_added
+        if progress:
+            progress(added, total)
+    return {'days': days, 'orders': added, 'ms': (time.perf_counter() - started) * 1000}
+
+
+def _reset(conn):
+    for table in ('sales_daily', 'sales_daily_category', 'sales_daily_status'):
+        conn.execute(f"DELETE FROM {table} WHERE day NOT IN (SELECT day FROM archived_days)")
+    conn.execute("DELETE FROM sales_dirty_days")
+    conn.execute("UPDATE sales_rollup_state SET watermark = 0, refreshed_at = NULL WHERE id = 1")
+
+
+def rebuild(conn, writes=None):
+    """Пересчитывает сводки с нуля (например, после ручной правки данных в обход триггеров).
+
+    Сводки архивных дней сохраняются: заказов этих дней в базе уже нет.
+    """
+    run_write(conn, writes, _reset)
+    return refresh(conn, writes=writes)
+
+
+# ------------------ ЧТЕНИЕ СВОДОК ------------------
+
+def last_year(today=None):
+    """Период графиков по умолчанию: 365 дней по сегодняшний включительно."""
+    today = today or date.today()
+    return (today - timedelta(days=364)).isoformat(), today.isoformat()
+
+
+def revenue_trend(conn, date_from, date_to, grain='month'):
+    """Выручка по дням или месяцам: [(период, заказов, выручка)] по возрастанию периода."""
+    period = {'day': "day", 'month': "substr(day, 1, 7)"}[grain]
+    return conn.execute(f"""
+        SELECT {period}, SUM(orders_count), SUM(revenue)
+        FROM sales_daily_status
+        WHERE day BETWEEN ? AND ?
+        GROUP BY 1 ORDER BY 1
+    """, (date_from, date_to)).fetchall()
+
+
+def top_categories(conn, date_from, date_to, limit=8):
+    """Категории с наибольшей выручкой за период: [(категория, количество, выручка)]."""
+    return conn.execute("""
+        SELECT category, SUM(quantity), SUM(revenue)
+        FROM sales_daily_category
+        WHERE day BETWEEN ? AND ?
+        GROUP BY category ORDER BY 3 DESC LIMIT ?
+    """, (date_from, date_to, limit)).fetchall()
+
+
+def status_funnel(conn, date_from, date_to):
+    """Заказы периода по статусам в порядке FUNNEL: [(статус, заказов, сумма)]."""
+    rows = conn.execute("""
+        SELECT status, SUM(orders_count), SUM(revenue)
+        FROM sales_daily_status
+        WHERE day BETWEEN ? AND ?
+        GROUP BY status
+    """, (date_from, date_to)).fetchall()
+    rank = {status: i for i, status in enumerate(FUNNEL)}
+    return sorted(rows, key=lambda row: (rank.get(row[0], len(FUNNEL)), -row[1]))
+
+
+def dashboard(conn, date_from=None, date_to=None, grain='month'):
+    """Данные графиков экрана статистики за период (по умолчанию — последний год)."""
+    if date_from is None or date_to is None:
+        date_from, date_to = last_year()
+    started = time.perf_counter()
+    data = {
+        'date_from': date_from,
+        'date_to': date_to,
+        'grain': grain,
+        'trend': revenue_trend(conn, date_from, date_to, grain),
+        'categories': top_categories(conn, date_from, date_to),
+        'funnel': status_funnel(conn, date_from, date_to),
+    }
+    data['ms'] = (time.perf_counter() - started) * 1000
+    return data
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Графики продаж для экрана статистики.
+
+Графики строятся по данным sales_analytics.dashboard() и отрисовываются
+в PNG без участия Tk: Figure с холстом Agg не использует pyplot и его
+глобальное состояние, поэтому рендер выполняется в рабочем потоке, а
+главный поток только показывает готовую картинку через tk.PhotoImage.
+"""
+
+import io
+
+DPI = 100
+_BAR = '#3498db'
+_LINE = '#e67e22'
+_FUNNEL = '#27ae60'
+
+
+class ChartError(Exception):
+    """Графики недоступны (например, не установлен matplotlib)."""
+
+
+def _money(value):
+    """Короткая запись суммы для подписей осей: 1.2 млн, 350 тыс."""
+    if abs(value) >= 1e6:
+        return f"{value / 1e6:.1f} млн"
+    if abs(value) >= 1e3:
+        return f"{value / 1e3:.0f} тыс"
+    return f"{value:.0f}"
+
+
+def _trend(ax, data):
+    periods = [row[0] for row in data['trend']]
+    revenue = [row[2] for row in data['trend']]
+    title = "Выручка по месяцам" if data['grain'] == 'month' else "Выручка по дням"
+    ax.set_title(f"{title}, {data['date_from']} — {data['date_to']}", fontsize=9)
+    if not periods:
+        ax.text(0.5, 0.5, "Нет продаж за период", ha='center', va='center', transform=ax.transAxes)
+        return
+    positions = range(len(periods))
+    ax.bar(positions, revenue, color=_BAR)
+    orders = ax.twinx()
+    orders.plot(positions, [row[1] for row in data['trend']], color=_LINE, marker='o', markersize=3)
+    orders.set_ylabel("заказов", fontsize=8, color=_LINE)
+    orders.tick_params(labelsize=7)
+    step = max(1, len(periods) // 12)
+    ax.set_xticks(list(positions)[::step])
+    ax.set_xticklabels(periods[::step], rotation=45, ha='right')
+    ax.yaxis.set_major_formatter(lambda value, _pos: _money(value))
+
+
+def _categories(ax, data):
+    ax.set_title("Топ категорий по выручке", fontsize=9)
+    rows = data['categories'][::-1]
+    ax.barh([row[0] or "Без категории" for row in rows], [row[2] for row in rows], color=_BAR)
+    ax.xaxis.set_major_formatter(lambda value, _pos: _money(value))
+
+
+def _funnel(ax, data):
+    ax.set_title("Заказы по статусам", fontsize=9)
+    rows = data['funnel'][::-1]
+    bars = ax.barh([row[0] for row in rows], [row[1] for row in rows], color=_FUNNEL)
+    ax.bar_label(bars, fontsize=7, padding=2)
+
+
+def render_dashboard(data, width, height):
+    """Рисует тренд выручки, топ категорий и воронку статусов; возвращает PNG (bytes)."""
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+    except ImportError:
+        raise ChartError("Для графиков нужен пакет matplotlib") from None
+    figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    grid = figure.add_gridspec(2, 2, height_ratios=(3, 2))
+    _trend(figure.add_subplot(grid[0, :]), data)
+    _categories(figure.add_subplot(grid[1, 0]), data)
+    _funnel(figure.add_subplot(grid[1, 1]), data)
+    for ax in figure.axes:
+        ax.tick_params(labelsize=7)
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Полнотекстовый поиск по товарам, клиентам и пользователям на SQLite FTS5.
+
+Индексы построены как external-content таблицы: текст хранится только в
+исходных таблицах, а FTS5 держит лишь инвертированный индекс. Триггеры
+синхронизируют индекс в той же транзакции, что и изменение данных, причем
+срабатывают только на изменение индексируемых колонок — списание остатков
+при проведении заказа индекс не трогает.
+
+Запрос пользователя превращается в префиксный поиск по каждому слову
+("ива" "пет" → "ива"* AND "пет"*); префиксы длиной 2 и 3 символа хранятся
+в индексе заранее (prefix='2 3'), поэтому поиск при наборе не перебирает
+словарь. Результаты ранжируются bm25 с весами колонок; если слово почти
+не отбирает записи (совпадений больше RANK_LIMIT), ранжирование пришлось бы
+считать по сотням тысяч строк — тогда показываются самые новые совпадения.
+"""
+
+import re
+
+RESULT_LIMIT = 10        # строк на каждый вид записей
+LOOKUP_LIMIT = 20        # вариантов в поле выбора записи
+MIN_QUERY_LENGTH = 2     # короче — префикс совпадает со слишком большой частью словаря
+RANK_LIMIT = 2000        # больше совпадений — bm25 не считаем, показываем новые записи
+
+# таблица -> (индексируемые колонки, веса bm25 в том же порядке)
+FTS_TABLES = {
+    'products': (('name', 'category'), (10.0, 2.0)),
+    'customers': (('name', 'email', 'phone', 'address'), (10.0, 5.0, 5.0, 1.0)),
+    'users': (('username', 'full_name', 'email'), (10.0, 10.0, 5.0)),
+}
+
+
+def _table_schema(table, columns, weights):
+    fts = f"{table}_fts"
+    cols = ', '.join(columns)
+    new = ', '.join(f"NEW.{c}" for c in columns)
+    old = ', '.join(f"OLD.{c}" for c in columns)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {cols}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        # Веса колонок сохраняются в конфигурации индекса: ORDER BY rank использует их
+        f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights))})')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fts_{table}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {cols}) VALUES (NEW.id, {new});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fts_{table}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fts_{table}_update AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old});
+            INSERT INTO {fts}(rowid, {cols}) VALUES (NEW.id, {new});
+        END
+        """,
+    ]
+
+
+SCHEMA = [sql for table, (columns, weights) in FTS_TABLES.items()
+          for sql in _table_schema(table, columns, weights)]
+
+
+def rebuild(conn):
+    """Перестраивает все индексы по содержимому исходных таблиц."""
+    for table in FTS_TABLES:
+        conn.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def match_expression(text):
+    """Строка пользователя -> выражение MATCH с префиксным поиском по каждому слову.
+
+    Возвращает None, если искать нечего. Слова берутся в кавычки, поэтому
+    операторы FTS5 (OR, NOT, *, :) во вводе не интерпретируются.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words or sum(len(w) for w in words) < MIN_QUERY_LENGTH:
+        return None
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def _record_number(text):
+    """Номер записи из ввода вида '#0042' или '42'."""
+    stripped = text.strip().lstrip('#').lstrip('№').strip()
+    return int(stripped) if stripped.isdigit() else None
+
+
+def _hits_query(conn, table, expression):
+    """SQL отбора лучших rowid внутри FTS (параметры: выражение, лимит) или None без совпадений.
+
+    Только отобранные rowid потом соединяются с исходной таблицей.
+    """
+    fts = f"{table}_fts"
+    matched = conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT rowid FROM {fts} WHERE {fts} MATCH ? LIMIT ?)",
+        (expression, RANK_LIMIT + 1)).fetchone()[0]
+    if not matched:
+        return None
+    if matched > RANK_LIMIT:
+        return f"SELECT rowid, -rowid AS rank FROM {fts} WHERE {fts} MATCH ? ORDER BY rowid DESC LIMIT ?"
+    return f"SELECT rowid, rank FROM {fts} WHERE {fts} MATCH ? ORDER BY rank LIMIT ?"
+
+
+# вид -> SQL выборки (id, заголовок, подробности) по найденным rowid
+_DETAILS = {
+    'products': """
+        SELECT p.id, p.name,
+               IFNULL(p.category, '—') || ' | ' || printf('%.2f ₽', p.price) || ' | остаток ' || p.quantity
+        FROM hits JOIN products p ON p.id = hits.rowid ORDER BY hits.rank
+    """,
+    'customers': """
+        SELECT c.id, c.name, IFNULL(c.email, '') || ' ' || IFNULL(c.phone, '')
+        FROM hits JOIN customers c ON c.id = hits.rowid ORDER BY hits.rank
+    """,
+    'users': """
+        SELECT u.id, u.full_name, u.username || ' | ' || u.role
+        FROM hits JOIN users u ON u.id = hits.rowid ORDER BY hits.rank
+    """,
+}
+
+
+def search(conn, text, limit=RESULT_LIMIT):
+    """Ищет text по заказам (номер), клиентам, товарам и пользователям.
+
+    Возвращает список (вид, id, заголовок, подробности): сначала заказ с
+    таким номером, затем по каждой таблице до limit лучших совпадений по bm25.
+    """
+    results = []
+    number = _record_number(text)
+    if number is not None:
+        row = conn.execute("""
+            SELECT o.id, c.name, o.status || ' | ' || printf('%.2f ₽', o.total_amount) || ' | ' || o.created_date
+            FROM orders o JOIN customers c ON c.id = o.customer_id
+            WHERE o.id = ?
+        """, (number,)).fetchone()
+        if row:
+            results.append(('orders',) + row)
+
+    expression = match_expression(text)
+    if expression is None:
+        return results
+    for table in ('customers', 'products', 'users'):
+        hits = _hits_query(conn, table, expression)
+        if hits:
+            rows = conn.execute(f"WITH hits AS ({hits}) {_DETAILS[table]}", (expression, limit))
+            results.extend((table,) + row for row in rows)
+    return results
+
+
+# таблица -> колонки, которые получает поле выбора записи; у товара — свободный остаток (без резервов)
+_LOOKUP_COLUMNS = {
+    'products': "t.id, t.name, t.price, t.quantity - t.reserved",
+    'customers': "t.id, t.name, t.email",
+}
+
+
+def lookup(conn, table, text, limit=LOOKUP_LIMIT):
+    """Варианты для поля выбора товара или клиента: не больше limit строк.
+
+    Номер ('42', '#42') находит запись по id; текст — префиксный поиск FTS;
+    пустая строка — первые записи по алфавиту (обход индекса по name).
+    """
+    columns = _LOOKUP_COLUMNS[table]
+    text = text.strip()
+    if not text:
+        return conn.execute(f"SELECT {columns} FROM {table} t ORDER BY t.name, t.id LIMIT ?", (limit,)).fetchall()
+    rows = []
+    number = _record_number(text)
+    if number is not None:
+        rows = conn.execute(f"SELECT {columns} FROM {table} t WHERE t.id = ?", (number,)).fetchall()
+    expression = match_expression(text)
+    hits = _hits_query(conn, table, expression) if expression else None
+    if hits:
+        rows.extend(row for row in conn.execute(
+            f"WITH hits AS ({hits}) SELECT {columns} FROM hits JOIN {table} t ON t.id = hits.rowid "
+            f"ORDER BY hits.rank", (expression, limit))
+            if row[0] != number)
+    return rows[:limit]
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+ABC/XYZ-классификация товаров и RFM-сегментация клиентов.
+
+Заказы периода читаются через pandas.read_sql пачками по CHUNK_ORDERS
+заказов (диапазон id). GROUP BY внутри пачки выполняет SQLite, поэтому в
+Python переходят частичные итоги — товар × месяц и клиент, — а не строки
+позиций: перенос строк в DataFrame стоит дороже самой выборки. pandas
+складывает итоги пачек (в памяти — только они) и считает классы векторно:
+
+    ABC — доля товара в выручке периода по нарастающей: A — первые 80 %,
+          B — следующие 15 %, C — остальное;
+    XYZ — коэффициент вариации месячного спроса (месяцы без продаж — нули):
+          X — до 0.25, Y — до 0.5, Z — выше;
+    RFM — давность последнего заказа, число заказов и их сумма, каждая
+          в баллах 1–5 по квинтилям; сегмент — по баллам R и F.
+
+Результат записывается в product_segments и customer_segments — их
+показывают экраны товаров и клиентов. Нужны pandas и NumPy.
+
+Запуск из командной строки:
+    python segmentation.py --months 12 [--db erp_database.db]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from connection_profiles import resolve_profile
+from order_service import run_write
+
+CHUNK_ORDERS = 100000       # заказов в одной пачке read_sql
+COMPACT_EVERY = 8           # частичных итогов, после которых они сворачиваются в один
+DEFAULT_MONTHS = 12         # период анализа
+ABC_LIMITS = (0.8, 0.95)    # границы A и B по накопленной доле выручки
+XYZ_LIMITS = (0.25, 0.5)    # границы X и Y по коэффициенту вариации
+RFM_SCORES = 5
+ANALYTICS_PROFILE = 'reporting'
+
+# (условие по баллам R и F, сегмент) — первое подходящее
+RFM_SEGMENTS = [
+    (lambda r, f: (r >= 4) & (f >= 4), "Чемпионы"),
+    (lambda r, f: (r >= 3) & (f >= 3), "Лояльные"),
+    (lambda r, f: (r >= 4) & (f <= 2), "Новые"),
+    (lambda r, f: (r <= 2) & (f >= 4), "Нельзя потерять"),
+    (lambda r, f: (r <= 2) & (f >= 3), "Под угрозой"),
+    (lambda r, f: (r <= 2) & (f <= 2), "Спящие"),
+]
+RFM_DEFAULT_SEGMENT = "Требуют внимания"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS product_segments (
+        product_id INTEGER PRIMARY KEY,
+        revenue REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        revenue_share REAL NOT NULL,
+        abc TEXT NOT NULL,
+        cv REAL NOT NULL,
+        xyz TEXT NOT NULL,
+        computed_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS customer_segments (
+        customer_id INTEGER PRIMARY KEY,
+        recency_days INTEGER NOT NULL,
+        frequency INTEGER NOT NULL,
+        monetary REAL NOT NULL,
+        r INTEGER NOT NULL,
+        f INTEGER NOT NULL,
+        m INTEGER NOT NULL,
+        segment TEXT NOT NULL,
+        computed_at TEXT NOT NULL
+    )
+    """,
+]
+
+# Пачка: id заказа в (?, ?] и дата в [?, ?). Месяц — порядковый номер
+# год * 12 + месяц: непрерывная шкала для XYZ
+_LINES_SQL = """
+    SELECT oi.product_id,
+           CAST(substr(o.created_date, 1, 4) AS INTEGER) * 12 + CAST(substr(o.created_date, 6, 2) AS INTEGER) AS month,
+           COUNT(*) AS lines, SUM(oi.quantity) AS quantity, SUM(oi.quantity * oi.price) AS revenue
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.id > ? AND o.id <= ? AND o.created_date >= ? AND o.created_date < ?
+    GROUP BY 1, 2
+"""
+# День последнего заказа — номер юлианского дня; julianday() считается на группу, а не на строку
+_ORDERS_SQL = """
+    SELECT customer_id, CAST(julianday(substr(MAX(created_date), 1, 10)) AS INTEGER) AS day,
+           COUNT(*) AS frequency, SUM(total_amount) AS monetary
+    FROM orders
+    WHERE id > ? AND id <= ? AND created_date >= ? AND created_date < ?
+    GROUP BY customer_id
+"""
+_LINES_TYPES = {'product_id': 'int64', 'month': 'int64', 'lines': 'int64', 'quantity': 'int64', 'revenue': 'float64'}
+_ORDERS_TYPES = {'customer_id': 'int64', 'day': 'int64', 'frequency': 'int64', 'monetary': 'float64'}
+
+
+class AnalyticsError(Exception):
+    """Расчет невозможен (например, не установлены pandas и NumPy)."""
+
+
+def _libraries():
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError:
+        raise AnalyticsError("Для ABC/XYZ и RFM нужны пакеты pandas и numpy") from None
+    return np, pd
+
+
+def _read_chunks(conn, pd, sql, since, until, dtype, chunk_orders):
+    """Итоги sql по пачкам заказов периода [since, until): по DataFrame на пачку."""
+    low, high = conn.execute("SELECT MIN(id), MAX(id) FROM orders WHERE created_date >= ? AND created_date < ?",
+                             (since, until)).fetchone()
+    if low is None:
+        return
+    for start in range(low - 1, high, chunk_orders):
+        yield pd.read_sql_query(sql, conn, params=(start, min(start + chunk_orders, high), since, until),
+                                dtype=dtype)
+
+
+def _aggregate(pd, chunks, keys, agg):
+    """Складывает итоги пачек по keys; agg — {колонка: 'sum' | 'max'}.
+
+    Итоги время от времени сворачиваются между собой, поэтому память
+    ограничена числом групп, а не числом пачек. None — заказов нет.
+    """
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk.set_index(keys))
+        if len(parts) >= COMPACT_EVERY:
+            parts = [pd.concat(parts).groupby(level=keys, sort=False).agg(agg)]
+    if not parts:
+        return None
+    return pd.concat(parts).groupby(level=keys).agg(agg)
+
+
+def _month_start(index):
+    """Первый день месяца по порядковому номеру год * 12 + месяц."""
+    return date((index - 1) // 12, (index - 1) % 12 + 1, 1).isoformat()
+
+
+def period(months=DEFAULT_MONTHS, today=None):
+    """Период ABC/XYZ: (первый месяц, последний месяц) — months полных месяцев до текущего."""
+    today = today or date.today()
+    current = today.year * 12 + today.month
+    return current - months, current - 1
+
+
+def classify_products(np, pd, monthly, first_month, last_month):
+    """ABC/XYZ по итогам товар × месяц (колонки quantity и revenue)."""
+    totals = monthly[['quantity', 'revenue']].groupby(level='product_id').sum()
+    totals = totals.sort_values('revenue', ascending=False)
+    revenue = totals['revenue'].to_numpy()
+    share = revenue / revenue.sum() if revenue.sum() else np.zeros_like(revenue)
+    # Доля товаров до текущего: товар, на котором накопленная доля переходит 80 %, еще в A
+    before = np.cumsum(share) - share
+    totals['revenue_share'] = share
+    totals['abc'] = np.select([before < ABC_LIMITS[0], before < ABC_LIMITS[1]], ['A', 'B'], 'C')
+
+    demand = monthly['quantity'].unstack(fill_value=0)
+    demand = demand.reindex(columns=range(first_month, last_month + 1), fill_value=0)
+    mean = demand.mean(axis=1)
+    cv = (demand.std(axis=1, ddof=0) / mean.where(mean > 0)).fillna(0)
+    totals['cv'] = cv.reindex(totals.index)
+    totals['xyz'] = np.select([totals['cv'] <= XYZ_LIMITS[0], totals['cv'] <= XYZ_LIMITS[1]], ['X', 'Y'], 'Z')
+    return totals
+
+
+def _scores(np, series, ascending=True):
+    """Баллы 1–RFM_SCORES по квинтилям; одинаковые значения получают одинаковый балл."""
+    scores = np.ceil(series.rank(pct=True, method='average').to_numpy() * RFM_SCORES).astype('int64')
+    return scores if ascending else RFM_SCORES + 1 - scores
+
+
+def segment_customers(np, pd, customers, today_day):
+    """RFM по итогам клиентов (колонки day — последний заказ, frequency, monetary)."""
+    result = pd.DataFrame(index=customers.index)
+    result['recency_days'] = today_day - customers['day']
+    result['frequency'] = customers['frequency']
+    result['monetary'] = customers['monetary']
+    result['r'] = r = _scores(np, result['recency_days'], ascending=False)
+    result['f'] = f = _scores(np, result['frequency'])
+    result['m'] = _scores(np, result['monetary'])
+    result['segment'] = np.select([condition(r, f) for condition, _ in RFM_SEGMENTS],
+                                  [segment for _, segment in RFM_SEGMENTS], RFM_DEFAULT_SEGMENT)
+    return result
+
+
+def _store(conn, table, columns, frame, computed_at, writes=None):
+    """Заменяет содержимое таблицы результатом расчета (одна запись: задание очереди writes или транзакция)."""
+    frame = frame.reset_index()
+    frame['computed_at'] = computed_at
+    placeholders = ', '.join('?' for _ in columns)
+    rows = list(frame[list(columns)].itertuples(index=False, name=None))
+
+    def replace(conn):
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    run_write(conn, writes, replace)
+
+
+def run(conn, months=DEFAULT_MONTHS, chunk_orders=CHUNK_ORDERS, progress=None, writes=None):
+    """Пересчитывает ABC/XYZ товаров и RFM клиентов.
+
+    ABC/XYZ считаются по months полным месяцам до текущего, RFM — по заказам
+    с начала того же периода по сегодня. Чтение идет через conn, результаты
+    записываются заданиями очереди writes, если она задана. progress(этап)
+    вызывается перед каждым этапом. Возвращает сводку: число строк, товаров, клиентов,
+    распределение классов и время этапов в мс.
+    """
+    np, pd = _libraries()
+    today = date.today()
+    first_month, last_month = period(months, today)
+    since, until = _month_start(first_month), _month_start(last_month + 1)
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    computed_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    timings = {}
+
+    def step(name, fn):
+        if progress:
+            progress(name)
+        started = time.perf_counter()
+        result = fn()
+        timings[name] = (time.perf_counter() - started) * 1000
+        return result
+
+    # Типы колонок заданы заранее: пустая пачка не превращает целые в float
+    monthly = step('lines', lambda: _aggregate(
+        pd, _read_chunks(conn, pd, _LINES_SQL, since, until, _LINES_TYPES, chunk_orders),
+        ['product_id', 'month'], {'lines': 'sum', 'quantity': 'sum', 'revenue': 'sum'}))
+    customers = step('orders', lambda: _aggregate(
+        pd, _read_chunks(conn, pd, _ORDERS_SQL, since, tomorrow, _ORDERS_TYPES, chunk_orders),
+        ['customer_id'], {'day': 'max', 'frequency': 'sum', 'monetary': 'sum'}))
+
+    summary = {'lines': 0, 'orders': 0, 'products': 0, 'customers': 0, 'abc': {}, 'xyz': {}, 'segments': {}}
+    if monthly is not None:
+        summary['lines'] = int(monthly['lines'].sum())
+        products = step('abc_xyz', lambda: classify_products(np, pd, monthly, first_month, last_month))
+        step('store_products', lambda: _store(
+            conn, 'product_segments',
+            ('product_id', 'revenue', 'quantity', 'revenue_share', 'abc', 'cv', 'xyz', 'computed_at'),
+            products, computed_at, writes))
+        summary['products'] = len(products)
+        summary['abc'] = products['abc'].value_counts().sort_index().to_dict()
+        summary['xyz'] = products['xyz'].value_counts().sort_index().to_dict()
+    if customers is not None:
+        summary['orders'] = int(customers['frequency'].sum())
+        # julianday() полуночи — целое + 0.5, в SQL и здесь берется целая часть
+        today_day = int(pd.Timestamp(today).to_julian_date())
+        rfm = step('rfm', lambda: segment_customers(np, pd, customers, today_day))
+        step('store_customers', lambda: _store(
+            conn, 'customer_segments',
+            ('customer_id', 'recency_days', 'frequency', 'monetary', 'r', 'f', 'm', 'segment', 'computed_at'),
+            rfm, computed_at, writes))
+        summary['customers'] = len(rfm)
+        summary['segments'] = rfm['segment'].value_counts().to_dict()
+    summary['ms'] = timings
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ABC/XYZ товаров и RFM-сегменты клиентов")
+    parser.add_argument('--months', type=int, default=DEFAULT_MONTHS, help="период анализа, полных месяцев")
+    parser.add_argument('--db', default=os.environ.get('ERP_DB_PATH', 'erp_database.db'))
+    parser.add_argument('--profile', default=ANALYTICS_PROFILE)
+    parser.add_argument('--chunk-orders', type=int, default=CHUNK_ORDERS)
+    args = parser.parse_args(argv)
+
+    # Таблицы результатов появились в миграции схемы; результаты пишет очередь записи базы
+    from main import Database
+    data = Database(args.db, args.profile)
+    conn = resolve_profile(args.profile).connect(args.db)
+    started = time.perf_counter()
+    try:
+        summary = run(conn, args.months, args.chunk_orders, progress=lambda name: print(f"⏳ {name}"),
+                      writes=data.writes)
+    except AnalyticsError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        conn.close()
+        data.close()
+    print(f"✅ Строк позиций: {summary['lines']}, заказов: {summary['orders']} "
+          f"за {time.perf_counter() - started:.1f} с")
+    print(f"📦 Товаров: {summary['products']}; ABC {summary['abc']}; XYZ {summary['xyz']}")
+    print(f"👤 Клиентов: {summary['customers']}; сегменты {summary['segments']}")
+    print("⏱ Этапы (мс): " + ", ".join(f"{name} {ms:.0f}" for name, ms in summary['ms'].items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
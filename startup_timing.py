@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Замер фаз запуска приложения.
+
+Отсчет идет с импорта этого модуля — main.py импортирует его первым из
+модулей приложения. Интерфейс отмечает окончание каждой фазы (импорт
+модулей, окно, первая отрисовка, открытие базы, данные главного экрана), а
+report() выводит длительность фаз и итог. Отчет включается параметром
+main.py --startup-report или переменной окружения ERP_STARTUP_REPORT=1.
+
+Тяжелые библиотеки (pandas, numpy, matplotlib, pyarrow) при запуске не
+загружаются — их импортируют экраны и выгрузки, которым они нужны; если
+какая-то из них попала в путь запуска, отчет это покажет.
+"""
+
+import os
+import sys
+import time
+
+_STARTED = time.perf_counter()
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib', 'pyarrow')
+
+
+def enabled(flag=False):
+    """Нужен ли отчет о запуске: параметр командной строки или ERP_STARTUP_REPORT=1."""
+    return flag or os.environ.get('ERP_STARTUP_REPORT') == '1'
+
+
+class StartupTimer:
+    """Длительности фаз запуска в порядке их окончания."""
+
+    def __init__(self, started=None):
+        self.started = _STARTED if started is None else started
+        self.phases = []    # [(фаза, мс)]
+        self._last = self.started
+
+    def mark(self, phase):
+        """Отмечает окончание фазы phase, начавшейся с предыдущей отметки."""
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last) * 1000))
+        self._last = now
+
+    def total_ms(self):
+        return (self._last - self.started) * 1000
+
+    def report(self):
+        lines = ["⏱  Запуск приложения:"]
+        lines.extend(f"   {phase:<30} {ms:8.1f} мс" for phase, ms in self.phases)
+        lines.append(f"   {'итого':<30} {self.total_ms():8.1f} мс")
+        heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+        lines.append(f"   тяжелые модули при запуске: {', '.join(heavy) if heavy else 'нет'}")
+        return "\n".join(lines)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Движок статистики для приветственного экрана и экрана статистики.
+
+Метрики собраны в группы; каждая группа считается одним запросом — либо
+чтением сводной строки stats_summary, либо одним совмещенным проходом по
+таблице. Результаты кэшируются до следующей записи в базу: движок держит
+собственное соединение только для чтения, и PRAGMA data_version на нем
+меняется, как только любое другое соединение зафиксирует изменения.
+"""
+
+import threading
+import time
+
+from stats_summary import read_summary
+
+
+def _orders_scan(conn):
+    """Один проход по orders: метрики, которых нет в сводной строке."""
+    max_order, active_customers = conn.execute("""
+        SELECT IFNULL(MAX(total_amount), 0), COUNT(DISTINCT customer_id) FROM orders
+    """).fetchone()
+    return {'max_order': max_order, 'active_customers': active_customers}
+
+
+def _products_scan(conn):
+    """Один проход по products: стоимость склада и позиции без остатка."""
+    stock_value, out_of_stock = conn.execute("""
+        SELECT IFNULL(SUM(price * quantity), 0), IFNULL(SUM(quantity <= 0), 0) FROM products
+    """).fetchone()
+    return {'stock_value': stock_value, 'out_of_stock': out_of_stock}
+
+
+# группа -> функция от соединения, возвращающая словарь метрик
+GROUPS = {
+    'summary': read_summary,
+    'orders': _orders_scan,
+    'products': _products_scan,
+}
+WELCOME_GROUPS = ('summary',)
+DETAILED_GROUPS = ('summary', 'orders', 'products')
+
+
+class StatisticsEngine:
+    """Считает метрики по группам и отдает их из кэша, пока база не менялась."""
+
+    def __init__(self, db):
+        self.db = db
+        self._conn = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._cache = {}       # группа -> словарь метрик
+        self._timings = {}     # группа -> время последнего расчета, мс
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            # Соединение используется из разных рабочих потоков, но только под self._lock
+            self._conn = self.db.open_connection(check_same_thread=False)
+        return self._conn
+
+    def _collect(self, groups):
+        with self._lock:
+            conn = self._connection()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._data_version:
+                self._cache.clear()
+                self._data_version = version
+            metrics = {}
+            for group in groups:
+                if group in self._cache:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    started = time.perf_counter()
+                    self._cache[group] = GROUPS[group](conn)
+                    self._timings[group] = (time.perf_counter() - started) * 1000
+                metrics.update(self._cache[group])
+            return metrics
+
+    def welcome(self):
+        """Метрики приветственного экрана (одна строка stats_summary)."""
+        return self._collect(WELCOME_GROUPS)
+
+    def detailed(self):
+        """Все метрики экрана статистики, включая производные показатели."""
+        stats = self._collect(DETAILED_GROUPS)
+        stats['avg_order'] = stats['total_sales'] / stats['orders'] if stats['orders'] else 0
+        stats['orders_per_customer'] = stats['orders'] / max(stats['customers'], 1)
+        stats['sales_per_product'] = stats['total_sales'] / max(stats['products'], 1)
+        return stats
+
+    def invalidate(self):
+        """Сбрасывает кэш (например, после пересчета сводных счетчиков)."""
+        with self._lock:
+            self._cache.clear()
+
+    def timings(self):
+        """Группа и время ее последнего расчета для каждой метрики: {метрика: (группа, мс группы)}.
+
+        Метрики группы считаются одним запросом, поэтому отдельного времени у
+        метрики нет: это время всей группы, общее для ее метрик (его же
+        возвращает group_timings()).
+        """
+        with self._lock:
+            return {metric: (group, self._timings[group])
+                    for group, metrics in self._cache.items() for metric in metrics}
+
+    def group_timings(self):
+        """Время последнего расчета по группам метрик, мс."""
+        with self._lock:
+            return dict(self._timings)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
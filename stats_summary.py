@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Сводные счетчики для приветственного экрана, поддерживаемые триггерами SQLite.
+
+Таблица stats_summary хранит ровно одну строку с количеством записей, суммой
+продаж и общим остатком; stats_order_status — количество заказов по статусам.
+Триггеры на users/products/customers/orders обновляют их в той же транзакции,
+что и сами данные, поэтому дашборд читает одну строку независимо от объема базы.
+"""
+
+from order_service import write_transaction
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS stats_summary (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        users_count INTEGER NOT NULL DEFAULT 0,
+        products_count INTEGER NOT NULL DEFAULT 0,
+        customers_count INTEGER NOT NULL DEFAULT 0,
+        orders_count INTEGER NOT NULL DEFAULT 0,
+        total_sales REAL NOT NULL DEFAULT 0,
+        total_stock INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_order_status (
+        status TEXT PRIMARY KEY,
+        orders_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT OR IGNORE INTO stats_summary (id) VALUES (1)",
+    # Пользователи и клиенты: только количество
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users BEGIN
+        UPDATE stats_summary SET users_count = users_count + 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+        UPDATE stats_summary SET users_count = users_count - 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_customers_insert AFTER INSERT ON customers BEGIN
+        UPDATE stats_summary SET customers_count = customers_count + 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_customers_delete AFTER DELETE ON customers BEGIN
+        UPDATE stats_summary SET customers_count = customers_count - 1 WHERE id = 1;
+    END
+    """,
+    # Товары: количество и общий остаток
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_products_insert AFTER INSERT ON products BEGIN
+        UPDATE stats_summary
+        SET products_count = products_count + 1, total_stock = total_stock + NEW.quantity
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_products_delete AFTER DELETE ON products BEGIN
+        UPDATE stats_summary
+        SET products_count = products_count - 1, total_stock = total_stock - OLD.quantity
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_products_update AFTER UPDATE OF quantity ON products
+    WHEN OLD.quantity IS NOT NEW.quantity BEGIN
+        UPDATE stats_summary SET total_stock = total_stock + NEW.quantity - OLD.quantity WHERE id = 1;
+    END
+    """,
+    # Заказы: количество, сумма продаж и разбивка по статусам
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_insert AFTER INSERT ON orders BEGIN
+        UPDATE stats_summary
+        SET orders_count = orders_count + 1, total_sales = total_sales + NEW.total_amount
+        WHERE id = 1;
+        INSERT INTO stats_order_status (status, orders_count) VALUES (NEW.status, 1)
+        ON CONFLICT(status) DO UPDATE SET orders_count = orders_count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_delete AFTER DELETE ON orders BEGIN
+        UPDATE stats_summary
+        SET orders_count = orders_count - 1, total_sales = total_sales - OLD.total_amount
+        WHERE id = 1;
+        UPDATE stats_order_status SET orders_count = orders_count - 1 WHERE status = OLD.status;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_amount AFTER UPDATE OF total_amount ON orders
+    WHEN OLD.total_amount IS NOT NEW.total_amount BEGIN
+        UPDATE stats_summary SET total_sales = total_sales + NEW.total_amount - OLD.total_amount WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_status AFTER UPDATE OF status ON orders
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        UPDATE stats_order_status SET orders_count = orders_count - 1 WHERE status = OLD.status;
+        INSERT INTO stats_order_status (status, orders_count) VALUES (NEW.status, 1)
+        ON CONFLICT(status) DO UPDATE SET orders_count = orders_count + 1;
+    END
+    """,
+]
+
+
+def recompute(conn):
+    """Пересчитывает счетчики по фактическим данным (внутри уже открытой транзакции).
+
+    Заказы, перенесенные в архив (order_archive), учитываются по их итогам в archived_days.
+    """
+    # При миграции схемы со старых версий таблицы archived_days еще нет
+    archived = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archived_days'").fetchone()
+    orders = "SELECT status, total_amount, 1 AS orders_count FROM orders"
+    if archived:
+        orders += " UNION ALL SELECT status, total_sales, orders_count FROM archived_days"
+    conn.execute(f"""
+        UPDATE stats_summary SET
+            users_count = (SELECT COUNT(*) FROM users),
+            products_count = (SELECT COUNT(*) FROM products),
+            customers_count = (SELECT COUNT(*) FROM customers),
+            orders_count = (SELECT IFNULL(SUM(orders_count), 0) FROM ({orders})),
+            total_sales = (SELECT IFNULL(SUM(total_amount), 0) FROM ({orders})),
+            total_stock = (SELECT IFNULL(SUM(quantity), 0) FROM products)
+        WHERE id = 1
+    """)
+    conn.execute("DELETE FROM stats_order_status")
+    conn.execute(f"""
+        INSERT INTO stats_order_status (status, orders_count)
+        SELECT status, SUM(orders_count) FROM ({orders}) GROUP BY status
+    """)
+
+
+def read_summary(conn):
+    """Читает сводные счетчики: одна строка stats_summary плюс разбивка по статусам."""
+    row = conn.execute("""
+        SELECT users_count, products_count, customers_count, orders_count, total_sales, total_stock
+        FROM stats_summary WHERE id = 1
+    """).fetchone()
+    users, products, customers, orders, total_sales, total_stock = row
+    by_status = dict(conn.execute(
+        "SELECT status, orders_count FROM stats_order_status WHERE orders_count > 0 ORDER BY status"))
+    return {
+        'users': users, 'products': products, 'customers': customers, 'orders': orders,
+        'total_sales': total_sales, 'total_products_qty': total_stock, 'by_status': by_status,
+    }
+
+
+def rebuild_summary(conn):
+    """Исправляет расхождение счетчиков с данными; возвращает {метрика: (было, стало)}."""
+    with write_transaction(conn):
+        before = read_summary(conn)
+        recompute(conn)
+        after = read_summary(conn)
+    return {key: (before[key], after[key]) for key in after if before[key] != after[key]}
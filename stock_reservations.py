@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Резервы остатков на время оформления заказа.
+
+Пока форма заказа открыта, добавленные в нее позиции резервируются: в
+products.reserved копится сумма активных резервов, а сами резервы лежат в
+stock_reservations с ключом (token формы, товар) и сроком действия. Резерв
+ставится одним условным UPDATE — «свободно = quantity - reserved не меньше
+запрошенного»; если не хватает, запрос сразу получает отказ, без ожидания и
+повторов. Транзакции короткие (BEGIN IMMEDIATE на пару выражений), поэтому
+несколько экземпляров приложения на одном файле не держат блокировку записи.
+
+Форма продлевает свои резервы, пока открыта; резервы закрытой или упавшей
+формы истекают через RESERVATION_TTL и снимаются при следующем резерве или
+проведении заказа по тем же товарам (или целиком — expire()).
+
+products.version — версия строки для оптимистической блокировки: триггер
+увеличивает ее при каждом изменении данных товара, а формы редактирования
+записывают изменения только при совпадении версии (Repository.update).
+"""
+
+import time
+import uuid
+
+from order_service import InsufficientStockError, OrderError, write_transaction
+
+RESERVATION_TTL = 300       # с: резерв без продления истекает
+RENEW_INTERVAL = 60         # с: как часто открытая форма продлевает резервы
+
+SCHEMA = [
+    "ALTER TABLE products ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    # Резервы версию не меняют: они не трогают данные, которые правит оператор
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_products_version
+    AFTER UPDATE OF name, price, quantity, category, sku, description ON products
+    WHEN NEW.version = OLD.version BEGIN
+        UPDATE products SET version = version + 1 WHERE id = NEW.id;
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_reservations (
+        token TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (token, product_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_stock_reservations_expiry ON stock_reservations(expires_at, product_id)",
+]
+
+
+def new_token():
+    """Идентификатор набора резервов одной формы заказа."""
+    return uuid.uuid4().hex
+
+
+def _release(conn, where, params):
+    """Снимает резервы, отобранные условием where, и возвращает их количество в свободный остаток."""
+    released = conn.execute(
+        f"SELECT product_id, SUM(quantity) FROM stock_reservations WHERE {where} GROUP BY product_id",
+        params).fetchall()
+    if released:
+        conn.executemany("UPDATE products SET reserved = MAX(reserved - ?, 0) WHERE id = ?",
+                         [(quantity, product_id) for product_id, quantity in released])
+        conn.execute(f"DELETE FROM stock_reservations WHERE {where}", params)
+    return released
+
+
+def _expire(conn, product_ids, now):
+    """Снимает истекшие резервы перечисленных товаров (внутри транзакции)."""
+    placeholders = ', '.join('?' for _ in product_ids)
+    return _release(conn, f"expires_at <= ? AND product_id IN ({placeholders})", (now, *product_ids))
+
+
+def reserve(conn, token, product_id, quantity, ttl=RESERVATION_TTL):
+    """Резервирует quantity товара для формы token; возвращает свободный остаток после резерва.
+
+    Недостаток свободного остатка — InsufficientStockError сразу, без ожидания.
+    """
+    if quantity <= 0:
+        raise OrderError("Количество должно быть больше нуля.")
+    now = time.time()
+    with write_transaction(conn):
+        _expire(conn, [product_id], now)
+        cursor = conn.execute(
+            "UPDATE products SET reserved = reserved + ? WHERE id = ? AND quantity - reserved >= ?",
+            (quantity, product_id, quantity))
+        if cursor.rowcount == 0:
+            row = conn.execute("SELECT name, quantity - reserved FROM products WHERE id = ?",
+                               (product_id,)).fetchone()
+            if row is None:
+                raise OrderError(f"Товар #{product_id} не найден.")
+            raise InsufficientStockError([(product_id, row[0], quantity, max(row[1], 0))])
+        conn.execute("""
+            INSERT INTO stock_reservations (token, product_id, quantity, expires_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(token, product_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity, expires_at = excluded.expires_at
+        """, (token, product_id, quantity, now + ttl))
+        return conn.execute("SELECT quantity - reserved FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+
+
+def renew(conn, token, ttl=RESERVATION_TTL):
+    """Продлевает резервы формы; возвращает число продленных (0 — резервы уже истекли и сняты)."""
+    with write_transaction(conn):
+        return conn.execute("UPDATE stock_reservations SET expires_at = ? WHERE token = ?",
+                            (time.time() + ttl, token)).rowcount
+
+
+def release(conn, token):
+    """Снимает все резервы формы (форма закрыта без сохранения или заказ не проведен)."""
+    with write_transaction(conn):
+        return _release(conn, "token = ?", (token,))
+
+
+def release_for_order(conn, token, product_ids):
+    """Снимает резервы формы перед списанием заказа и истекшие резервы его товаров.
+
+    Вызывается внутри транзакции проведения заказа: резерв формы превращается
+    в списание атомарно, и чужие истекшие резервы не мешают проверке остатка.
+    """
+    _release(conn, "token = ?", (token,))
+    _expire(conn, list(product_ids), time.time())
+
+
+def expire(conn):
+    """Снимает все истекшие резервы; возвращает [(товар, количество)]."""
+    with write_transaction(conn):
+        return _release(conn, "expires_at <= ?", (time.time(),))
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Модули приложения лежат в корне репозитория — делаем их импортируемыми из тестов."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
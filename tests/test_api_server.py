@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""HTTP API: ошибки запроса и сервера возвращаются клиенту JSON-ответом с кодом."""
+
+import http.client
+import json
+import threading
+
+import pytest
+
+from api_server import ApiServer, ErpApi
+from main import Database
+
+
+@pytest.fixture
+def server(tmp_path):
+    api = ErpApi(Database(str(tmp_path / 'erp.db')))
+    server = ApiServer(('127.0.0.1', 0), api, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    api.close()
+
+
+def request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_malformed_content_length_is_bad_request(server):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.putrequest('POST', '/api/customers')
+        conn.putheader('Content-Length', 'ten')
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 400
+        assert 'Content-Length' in json.loads(response.read())['error']
+    finally:
+        conn.close()
+
+
+def test_unknown_order_status_is_rejected(server):
+    body = json.dumps({'customer_id': 1, 'items': [{'product_id': 1, 'quantity': 1}], 'status': 'Потерян'})
+    status, payload = request(server, 'POST', '/api/orders', body, {'Content-Type': 'application/json'})
+    assert status == 400
+    assert 'Новый' in payload['statuses']
+    status, _ = request(server, 'PATCH', '/api/orders/1', json.dumps({'status': 'Потерян'}))
+    assert status == 400
+
+
+def test_handler_bug_is_json_500(server, monkeypatch, capsys):
+    def broken():
+        raise KeyError('summary')
+    monkeypatch.setattr(server.api, 'stats', broken)
+    status, payload = request(server, 'GET', '/api/stats')
+    assert (status, payload) == (500, {'error': "Внутренняя ошибка сервера"})
+    assert 'KeyError' in capsys.readouterr().err
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Журнал изменений: неудачный перенос не вытесняет из буфера новые записи."""
+
+import pytest
+
+from audit_log import AuditJournal
+
+
+class FailingWrites:
+    """Очередь записи, задание которой падает; за время задания в журнал приходят новые записи."""
+
+    def __init__(self):
+        self.journal = None
+        self.arrived = []
+
+    def after_commit(self, fn, arg):
+        fn(arg)
+
+    def call(self, fn):
+        for record_id in self.arrived:
+            self.journal.record('insert', 'products', record_id)
+        raise OSError("database is locked")
+
+
+def test_failed_flush_drops_oldest_entries():
+    writes = FailingWrites()
+    journal = AuditJournal(writes, capacity=5, interval=3600)
+    writes.journal = journal
+    for record_id in range(5):
+        journal.record('insert', 'products', record_id)
+    writes.arrived = [5, 6]
+    with pytest.raises(OSError):
+        journal.flush()
+    assert [entry[4] for entry in journal._buffer] == [2, 3, 4, 5, 6]
+    assert journal.metrics()['dropped'] == 2
+    assert journal.metrics()['errors'] == 1
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Сравнение замеров с эталоном: порог шума быстрых замеров зависит от эталона."""
+
+from benchmarks.report import (ACCEPTED, IMPROVEMENT, REGRESSION, UNCHANGED, accept_regressions, compare,
+                               has_regressions)
+
+
+def results(**medians):
+    return {'cases': {name: {'median_ms': ms} for name, ms in medians.items()}}
+
+
+def test_fast_case_slowdown_below_absolute_floor_is_regression():
+    rows = compare(results(update=0.022), results(update=0.123))
+    assert rows[0][4] == REGRESSION
+
+
+def test_noise_floor():
+    rows = compare(results(fast=0.02, slower=0.02, slow=10.0, faster=0.5),
+                   results(fast=0.024, slower=0.03, slow=10.15, faster=0.2))
+    assert [row[4] for row in rows] == [UNCHANGED, REGRESSION, UNCHANGED, IMPROVEMENT]
+
+
+def test_accepted_regression():
+    baseline = results(update=0.02, insert=0.08)
+    rows = compare(baseline, results(update=0.1, insert=0.08))
+    assert accept_regressions(baseline, rows, "очередь записи") == ['update']
+    assert not has_regressions(compare(baseline, results(update=0.11, insert=0.08)))
+    assert compare(baseline, results(update=0.11, insert=0.08))[0][4] == ACCEPTED
+    # Медленнее принятой медианы — снова регрессия
+    assert has_regressions(compare(baseline, results(update=0.2, insert=0.08)))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Импорт CSV: кодировка файла, ошибки, которые не должны ронять поток импорта, и сопоставление без ключа."""
+
+import pytest
+
+from importer import ImportFileError, import_file, open_import_connection
+from main import Database
+
+HEADER = "name;price;quantity;category\n"
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'erp.db')
+    Database(path).close()
+    conn = open_import_connection(path)
+    yield conn
+    conn.close()
+
+
+def test_cp1251_csv_is_imported(conn, tmp_path):
+    path = tmp_path / 'catalog.csv'
+    path.write_bytes((HEADER + "Стол письменный;12500,50;3;Мебель\n").encode('cp1251'))
+    result = import_file(conn, 'products', str(path))
+    assert result.written == 1
+    assert conn.execute("SELECT name, category FROM products WHERE sku = 'Стол письменный'").fetchone() == \
+        ('Стол письменный', 'Мебель')
+
+
+def test_bad_bytes_after_utf8_start_is_file_error(conn, tmp_path):
+    path = tmp_path / 'catalog.csv'
+    rows = "".join(f"Товар {n};100;1;Разное\n" for n in range(5000))
+    path.write_bytes((HEADER + rows).encode('utf-8') + "Стул;200;1;Мебель\n".encode('cp1251'))
+    with pytest.raises(ImportFileError):
+        import_file(conn, 'products', str(path))
+
+
+def test_product_without_sku_is_matched_by_name(conn, tmp_path):
+    # Товар, заведенный формой: артикула нет
+    conn.execute("INSERT INTO products (name, price, quantity, created_at) VALUES ('Стол письменный', 9000, 1, '2024-01-01')")
+    conn.commit()
+    path = tmp_path / 'catalog.csv'
+    path.write_text("sku;name;price;quantity\nT-100;Стол письменный;12500;3\n", encoding='utf-8')
+    import_file(conn, 'products', str(path))
+    import_file(conn, 'products', str(path))
+    assert conn.execute("SELECT sku, price, quantity FROM products").fetchall() == [('T-100', 12500.0, 3)]
+
+
+def test_customer_without_email_is_not_duplicated(conn, tmp_path):
+    path = tmp_path / 'customers.csv'
+    path.write_text("name;phone;address\nООО Ромашка;+7 900;Москва\nИП Петров;;Казань\n", encoding='utf-8')
+    import_file(conn, 'customers', str(path))
+    path.write_text("name;phone;address\nООО Ромашка;+7 900;Тверь\nИП Петров;;Казань\n", encoding='utf-8')
+    import_file(conn, 'customers', str(path))
+    assert conn.execute("SELECT name, address FROM customers ORDER BY name").fetchall() == \
+        [('ИП Петров', 'Казань'), ('ООО Ромашка', 'Тверь')]
+
+
+def test_fractional_quantity_is_rejected(conn, tmp_path):
+    path = tmp_path / 'catalog.csv'
+    path.write_text(HEADER + "Кабель;100;2,5;Разное\nПровод;50;4,0;Разное\n", encoding='utf-8')
+    result = import_file(conn, 'products', str(path))
+    assert (result.written, result.rejected) == (1, 1)
+    assert conn.execute("SELECT name, quantity FROM products").fetchall() == [('Провод', 4)]
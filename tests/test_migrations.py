@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Миграции схемы на файлах, созданных прежними версиями приложения."""
+
+import sqlite3
+
+import database
+from migrations import LATEST_VERSION, current_version
+
+# Схема, которую создавал прежний database.py (до общего слоя доступа)
+LEGACY_SCHEMA = [
+    """
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        role TEXT NOT NULL,
+        email TEXT,
+        created_date TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        price REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        category TEXT,
+        created_date TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE customers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT,
+        phone TEXT,
+        address TEXT,
+        created_date TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        total_amount REAL NOT NULL,
+        status TEXT NOT NULL,
+        created_date TEXT NOT NULL,
+        FOREIGN KEY (customer_id) REFERENCES customers (id)
+    )
+    """,
+    """
+    CREATE TABLE order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES orders (id),
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )
+    """,
+]
+
+
+def _legacy_file(path):
+    conn = sqlite3.connect(path)
+    for sql in LEGACY_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_file_with_empty_users_opens(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    _legacy_file(path)
+    db = database.Database(path)
+    try:
+        assert current_version(db.connect()) == LATEST_VERSION
+        usernames = {row[1] for row in db.get_all_users()}
+        assert 'admin' in usernames
+        columns = {row[1] for row in db.connect().execute("PRAGMA table_info(users)")}
+        assert 'created_at' in columns and 'created_date' not in columns
+    finally:
+        db.close()
+
+
+def test_legacy_facade_keeps_row_shapes_and_sample_users(tmp_path):
+    db = database.Database(str(tmp_path / 'fresh.db'))
+    try:
+        users = db.get_all_users()
+        assert {row[1] for row in users} >= {'admin', 'manager', 'operator'}
+        manager = next(row for row in users if row[1] == 'manager')
+        assert manager[2] == 'manager123' and len(manager) == 7
+        product = next(row for row in db.get_all_products() if row[1] == 'Мышь Logitech')
+        assert product[1:6] == ('Мышь Logitech', 'Оптическая мышь', 1200.0, 30, 'Аксессуары')
+        assert len(product) == 7
+        assert all(len(row) == 6 for row in db.get_all_customers())
+    finally:
+        db.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Перенос в архив: копия и удаление — отдельные транзакции, заказы не теряются между ними."""
+
+import sqlite3
+from datetime import date
+
+import pytest
+
+import order_archive
+import sales_analytics
+from main import Database
+from order_service import write_transaction
+
+DAYS = ('2020-01-10', '2020-01-11', '2020-01-12')
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'erp.db')
+    db = Database(path)
+    customer_id = db.insert('customers', ['name', 'created_at'], ["Клиент", '2020-01-01 00:00:00'])
+    product_id = db.insert('products', ['name', 'price', 'quantity', 'created_at'],
+                           ["Товар", 100.0, 1000, '2020-01-01 00:00:00'])
+    db.close()
+    conn = sqlite3.connect(path, isolation_level=None)
+    with write_transaction(conn):
+        for day in DAYS:
+            for n in range(2):
+                order_id = conn.execute(
+                    "INSERT INTO orders (customer_id, total_amount, status, created_date) VALUES (?, ?, ?, ?)",
+                    (customer_id, 200.0, "Доставлен", f"{day} 1{n}:00:00")).lastrowid
+                conn.execute("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, 2, 100)",
+                             (order_id, product_id))
+    sales_analytics.refresh(conn)
+    yield conn
+    conn.close()
+
+
+def totals(conn):
+    with order_archive.attached(conn):
+        return (conn.execute("SELECT COUNT(*), SUM(total_amount) FROM all_orders").fetchone(),
+                conn.execute("SELECT COUNT(*) FROM all_order_items").fetchone()[0])
+
+
+def test_archive_keeps_totals(conn):
+    before = totals(conn)
+    summary = order_archive.archive(conn, today=date(2024, 1, 1))
+    assert summary['orders'] == 6 and summary['lines'] == 6
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 0
+    assert totals(conn) == before
+    assert conn.execute("SELECT orders_count, total_sales FROM stats_summary").fetchone() == (6, 1200.0)
+
+
+def test_copy_without_delete_is_recovered(conn):
+    """Сбой после копии: заказы в обоих файлах не удваиваются, следующий перенос доводит дело до конца."""
+    before = totals(conn)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_days (day TEXT PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)")
+    with order_archive.attached(conn, create=True):
+        with write_transaction(conn):
+            order_archive._copy(conn, list(DAYS))
+    assert totals(conn) == before
+    assert order_archive.archive(conn, today=date(2024, 1, 1))['orders'] == 6
+    assert totals(conn) == before
+
+
+def test_order_changed_between_copy_and_delete_stays(conn):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_days (day TEXT PRIMARY KEY)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)")
+    with order_archive.attached(conn, create=True):
+        with write_transaction(conn):
+            order_archive._copy(conn, list(DAYS))
+        conn.execute("UPDATE orders SET total_amount = 250 WHERE id = 1")
+        with write_transaction(conn):
+            assert order_archive._delete(conn) == (5, 5)
+        order_archive._drop_stale_copies(conn)
+        assert conn.execute("SELECT id, total_amount FROM main.orders").fetchall() == [(1, 250.0)]
+        assert conn.execute("SELECT COUNT(*) FROM archive.orders WHERE id = 1").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*), SUM(total_amount) FROM all_orders").fetchone() == (6, 1250.0)
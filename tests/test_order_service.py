@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Проведение заказа: гонка за остаток не превращается в «нехватку» с пустым списком."""
+
+import sqlite3
+
+import pytest
+
+from main import Database
+from order_service import InsufficientStockError, OrderError, OrderService
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'erp.db'))
+    db.customer_id = db.insert('customers', ['name', 'created_at'], ["Клиент", '2024-01-01 00:00:00'])
+    db.product_id = db.insert('products', ['name', 'price', 'quantity', 'created_at'],
+                              ["Товар", 100.0, 0, '2024-01-01 00:00:00'])
+    yield db
+    db.close()
+
+
+def order(db, service, quantity=2):
+    conn = sqlite3.connect(db.db_name, isolation_level=None)
+    try:
+        return service.create_order(db.customer_id, [{'product_id': db.product_id, 'quantity': quantity,
+                                                      'price': 100.0}], conn=conn)
+    finally:
+        conn.close()
+
+
+def restock(db, quantity):
+    conn = sqlite3.connect(db.db_name)
+    with conn:
+        conn.execute("UPDATE products SET quantity = ? WHERE id = ?", (quantity, db.product_id))
+    conn.close()
+
+
+def test_stock_returned_during_order_is_retried(db, monkeypatch):
+    service = OrderService(db)
+    find_shortages = OrderService._find_shortages
+
+    def returned_meanwhile(conn, demand):
+        # Другое соединение вернуло товар между неудачным списанием и перечитыванием остатков
+        restock(db, 5)
+        return find_shortages(conn, demand)
+    monkeypatch.setattr(OrderService, '_find_shortages', staticmethod(returned_meanwhile))
+    assert order(db, service) > 0
+    assert db.products.get(db.product_id).quantity == 3
+
+
+def test_lost_race_without_shortage_is_order_error(db, monkeypatch):
+    service = OrderService(db)
+    monkeypatch.setattr(OrderService, '_find_shortages', staticmethod(lambda conn, demand: []))
+    with pytest.raises(OrderError, match="Повторите") as raised:
+        order(db, service)
+    assert not isinstance(raised.value, InsufficientStockError)
+
+
+def test_real_shortage_is_reported(db):
+    with pytest.raises(InsufficientStockError) as raised:
+        order(db, OrderService(db))
+    assert raised.value.shortages == [(db.product_id, "Товар", 2, 0)]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Трассировка SQL: нормализация текста, время запроса вместе с выборкой строк, настройки включения."""
+
+import sqlite3
+import time
+
+import pytest
+
+import query_trace
+
+
+@pytest.fixture(autouse=True)
+def tracing_off(monkeypatch):
+    monkeypatch.setattr(query_trace, '_settings', (query_trace.SLOW_MS, query_trace.SLOW_LOG))
+    yield
+    query_trace.disable()
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:', factory=query_trace.TracedConnection)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO items (name) VALUES (?)", [('a',), ('b',), ('c',)])
+
+    def slow(value):
+        time.sleep(0.01)
+        return value
+    conn.create_function('slow', 1, slow)
+    yield conn
+    conn.close()
+
+
+def test_normalize_replaces_literals_and_in_lists():
+    assert query_trace.normalize("SELECT *  FROM items\n WHERE id IN (?, ?, ?) AND name = 'x' AND n > 10") == \
+        "SELECT * FROM items WHERE id IN (?, ...) AND name = ? AND n > ?"
+    assert query_trace.normalize("SELECT id FROM t2 WHERE id = 5") == "SELECT id FROM t2 WHERE id = ?"
+
+
+def test_query_time_includes_fetching_rows(conn):
+    tracer = query_trace.enable(slow_ms=1000, log_path=None)
+    rows = conn.execute("SELECT slow(name) FROM items").fetchall()
+    assert len(rows) == 3
+    stats, = [row for row in tracer.snapshot() if 'slow(' in row['sql']]
+    assert (stats['count'], stats['rows']) == (1, 3)
+    # execute() возвращается после первой строки: остальные две считаются при выборке
+    assert stats['total_ms'] >= 25
+
+
+def test_abandoned_cursor_is_recorded(conn):
+    tracer = query_trace.enable(slow_ms=0, log_path=None)
+    assert conn.execute("SELECT name FROM items WHERE id = 2").fetchone() == ('b',)
+    stats, = [row for row in tracer.snapshot() if row['sql'] == "SELECT name FROM items WHERE id = ?"]
+    assert (stats['count'], stats['slow']) == (1, 1)
+    assert stats['plan']
+
+
+def test_reenable_keeps_configured_threshold_and_log(tmp_path):
+    log_path = str(tmp_path / 'slow.log')
+    assert query_trace.configure_from_env({'ERP_SQL_SLOW_MS': '5', 'ERP_SQL_SLOW_LOG': log_path}) is False
+    query_trace.configure(slow_ms=7)
+    query_trace.enable()
+    query_trace.disable()
+    tracer = query_trace.enable()
+    assert (tracer.slow_ms, tracer.log_path) == (7, log_path)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Кэш справочников: свои записи через очередь не сбрасывают кэш, чужие — сбрасывают."""
+
+import sqlite3
+
+import pytest
+
+from main import Database
+from reference_cache import ReferenceCache
+
+
+@pytest.fixture
+def cached(tmp_path):
+    path = str(tmp_path / 'erp.db')
+    db = Database(path)
+    ids = [db.insert('customers', ['name', 'email', 'created_at'],
+                     [f"Клиент {n}", f"c{n}@example.com", '2024-01-01 00:00:00']) for n in range(3)]
+    refs = ReferenceCache(db)
+    for customer_id in ids:
+        refs.get('customers', customer_id)
+    yield path, db, refs, ids
+    db.close()
+
+
+def test_own_write_keeps_unrelated_rows(cached):
+    _, db, refs, ids = cached
+    assert db.update('customers', ids[0], ['name'], ["Переименован"])
+    db.audit.flush()
+    assert refs.get('customers', ids[0])['name'] == "Переименован"
+    assert refs.get('customers', ids[1])['name'] == "Клиент 1"
+    stats = refs.stats()
+    assert stats['rows'] == 3
+    assert stats['invalidations'] == 0
+    assert stats['misses'] == 3
+
+
+def test_foreign_write_invalidates(cached):
+    path, _, refs, ids = cached
+    other = sqlite3.connect(path)
+    with other:
+        other.execute("UPDATE customers SET name = 'Извне' WHERE id = ?", (ids[2],))
+    other.close()
+    assert refs.get('customers', ids[2])['name'] == "Извне"
+    assert refs.stats()['invalidations'] == 1
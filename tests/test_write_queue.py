@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Очередь записи: ошибка одного задания не мешает пакету, прерванный пакет не останавливает поток,
+при пустой очереди запись выполняется в потоке вызывающего."""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    conn.close()
+    return path
+
+
+def connector(path):
+    return lambda: sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+
+@contextmanager
+def bind_connection(conn):
+    yield conn
+
+
+def insert(item_id, gate=None):
+    def job(conn):
+        if gate:
+            gate.wait(5)
+        conn.execute("INSERT INTO items (id) VALUES (?)", (item_id,))
+        return item_id
+    return job
+
+
+def stored(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM items ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def fail(conn):
+    conn.execute("INSERT INTO items (id) VALUES (99)")
+    raise ValueError("ошибка задания")
+
+
+def test_failed_job_does_not_fail_batch(path):
+    writes = WriteQueue(connector(path), budget_ms=1000)
+    gate = threading.Event()
+    # Первое задание держит пакет открытым, пока в очередь встают остальные
+    futures = [writes.submit(insert(1, gate)), writes.submit(fail), writes.submit(insert(2))]
+    gate.set()
+    assert futures[0].result(5) == 1
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5) == 2
+    assert writes.metrics()['last_batch'] == 3
+    writes.close()
+    assert stored(path) == [1, 2]
+
+
+def test_job_ending_transaction_aborts_batch_not_thread(path):
+    writes = WriteQueue(connector(path), budget_ms=1000)
+    gate = threading.Event()
+
+    def disk_full(conn):
+        # Так SQLite завершает транзакцию при SQLITE_FULL/IOERR
+        conn.execute("ROLLBACK")
+        raise sqlite3.OperationalError("database or disk is full")
+    first, broken = writes.submit(insert(1, gate)), writes.submit(disk_full)
+    gate.set()
+    with pytest.raises(sqlite3.OperationalError, match="прерван"):
+        first.result(5)
+    with pytest.raises(sqlite3.OperationalError, match="disk is full"):
+        broken.result(5)
+    assert writes.submit(insert(2)).result(5) == 2
+    writes.close()
+    assert stored(path) == [2]
+
+
+def test_connect_failure_fails_job_and_retries(path):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError("unable to open database file")
+        return connector(path)()
+    writes = WriteQueue(connect)
+    with pytest.raises(sqlite3.OperationalError):
+        writes.submit(insert(1)).result(5)
+    assert writes.submit(insert(2)).result(5) == 2
+    writes.close()
+    assert stored(path) == [2]
+
+
+def test_idle_call_runs_in_caller_thread(path):
+    bound = []
+
+    @contextmanager
+    def bind(conn):
+        bound.append(threading.get_ident())
+        yield conn
+    writes = WriteQueue(connector(path), bind=bind)
+    writes.flush()      # соединение записи открывает поток записи
+    hooks = []
+
+    def job(conn):
+        writes.after_commit(hooks.append, 'после фиксации')
+        assert hooks == []
+        return insert(1)(conn)
+    assert writes.call(job) == 1
+    assert bound == [threading.get_ident()]
+    assert hooks == ['после фиксации']
+    with pytest.raises(ValueError):
+        writes.call(fail)
+    assert writes.metrics()['failed'] == 1
+    writes.close()
+    assert stored(path) == [1]
+
+
+def test_call_waits_behind_queued_jobs(path):
+    writes = WriteQueue(connector(path), bind=bind_connection)
+    writes.flush()
+    gate = threading.Event()
+    first = writes.submit(insert(1, gate))
+    threading.Timer(0.1, gate.set).start()
+    # Поставленное раньше задание фиксируется раньше, даже если очередь могла бы выполнить call() сразу
+    assert writes.call(lambda conn: conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]) == 1
+    assert first.result(5) == 1
+    writes.close()
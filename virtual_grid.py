@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+Виртуализированная таблица (ttk.Treeview) с постраничной загрузкой по ключу.
+
+Вместо fetchall() всей таблицы в Treeview держится только окно из нескольких
+страниц. Страницы выбираются keyset-пагинацией по текущей колонке сортировки:
+WHERE (ключ, id) > (?, ?) ORDER BY ключ, id LIMIT ? — такой запрос идет по
+индексу и не зависит от того, насколько далеко пользователь пролистал таблицу.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+PAGE_SIZE = 100          # строк в одной странице
+MAX_PAGES = 3            # страниц, одновременно живущих в Treeview
+SCROLL_THRESHOLD = 0.15  # доля до края окна, при которой догружаем соседнюю страницу
+PLACEHOLDER_SUFFIX = '/...'  # iid заглушки вложенных строк: '<ключ>/...'
+
+
+class KeysetQuery:
+    """Описание выборки для виртуальной таблицы: колонки, источник и ключи сортировки."""
+
+    def __init__(self, select, source, sort_exprs, key='id'):
+        self.select = select            # SQL-выражения колонок в порядке отображения
+        self.source = source            # FROM-часть: таблица или JOIN
+        self.sort_exprs = sort_exprs    # колонка таблицы -> SQL-выражение сортировки
+        self.key = key                  # уникальный ключ, разрывающий равные значения
+
+    def page(self, sort_col, descending, cursor=None, backwards=False, limit=PAGE_SIZE):
+        """Возвращает (sql, params) страницы после (или до) позиции cursor=(ключ, id)."""
+        expr = self.sort_exprs[sort_col]
+        # При движении назад направление сортировки и сравнения инвертируется
+        reverse = descending != backwards
+        direction = 'DESC' if reverse else 'ASC'
+        sql = f"SELECT {expr}, {self.key}, {', '.join(self.select)} FROM {self.source}"
+        params = []
+        if cursor is not None:
+            sql += f" WHERE ({expr}, {self.key}) {'<' if reverse else '>'} (?, ?)"
+            params.extend(cursor)
+        sql += f" ORDER BY {expr} {direction}, {self.key} {direction} LIMIT ?"
+        params.append(limit)
+        return sql, params
+
+    def rows(self, sort_col, keys):
+        """Возвращает (sql, params) выборки отдельных записей по ключу — в том же формате, что page()."""
+        expr = self.sort_exprs[sort_col]
+        sql = (f"SELECT {expr}, {self.key}, {', '.join(self.select)} FROM {self.source} "
+               f"WHERE {self.key} IN ({', '.join('?' for _ in keys)})")
+        return sql, list(keys)
+
+
+class VirtualTreeview(tk.Frame):
+    """Treeview с фиксированным числом элементов и догрузкой страниц при прокрутке.
+
+    Элементы дерева получают iid, равный первичному ключу записи, поэтому код
+    экранов продолжает работать через self.tree.selection() / item().
+
+    Если передан children(key, callback), строки можно раскрыть: вложенные
+    строки (кортежи значений колонок) запрашиваются при первом раскрытии.
+    """
+
+    def __init__(self, parent, db, query, columns, headings, sort, formatter=None,
+                 page_size=PAGE_SIZE, max_pages=MAX_PAGES, fetch=None, children=None):
+        super().__init__(parent, bg='white')
+        self.db = db
+        self.query = query
+        self.columns = columns
+        self.headings = headings
+        self.formatter = formatter or (lambda row: row)
+        self.page_size = page_size
+        self.max_items = page_size * max_pages
+        self.sort_col, self.descending = sort
+        self.fetch = fetch or self._fetch_now
+        self.children_loader = children
+
+        show = 'tree headings' if children else 'headings'
+        self.tree = ttk.Treeview(self, columns=columns, show=show, selectmode='browse')
+        if children:
+            self.tree.column('#0', width=30, stretch=False)
+            self.tree.bind('<<TreeviewOpen>>', self._on_open)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        for col in columns:
+            if col in query.sort_exprs:
+                self.tree.heading(col, command=lambda c=col: self.sort_by(c))
+        self._update_headings()
+
+        self._keys = []            # (ключ сортировки, id) для каждого элемента окна
+        self._at_start = True      # окно начинается с первой записи выборки
+        self._at_end = False       # окно заканчивается последней записью выборки
+        self._prefetched = None    # заранее загруженная следующая страница
+        self._loading = False
+        self._generation = 0       # отбрасывает ответы, пришедшие после reload()
+
+    # ------------------ ЗАГРУЗКА ------------------
+
+    def _fetch_now(self, sql, params, callback):
+        """Синхронная выборка через общее соединение Database."""
+        callback(self.db.connect().execute(sql, params).fetchall())
+
+    def _request(self, cursor, backwards, callback):
+        sql, params = self.query.page(self.sort_col, self.descending, cursor, backwards, self.page_size)
+        generation = self._generation
+
+        def deliver(rows):
+            if generation == self._generation:
+                callback(rows)
+        self.fetch(sql, params, deliver)
+
+    def reload(self):
+        """Сбрасывает окно и загружает первую страницу в текущей сортировке."""
+        self._generation += 1
+        self._keys = []
+        self._at_start, self._at_end = True, False
+        self._prefetched = None
+        self._loading = True
+        self.tree.delete(*self.tree.get_children())
+        self._request(None, False, self._on_first_page)
+
+    def _on_first_page(self, rows):
+        self._loading = False
+        self._append(rows)
+        self._prefetch_forward()
+
+    def _prefetch_forward(self):
+        """Загружает следующую страницу заранее, пока пользователь листает текущую."""
+        if self._at_end or self._prefetched is not None or not self._keys:
+            return
+
+        def store(rows):
+            self._prefetched = rows
+        self._request(self._keys[-1], False, store)
+
+    def _extend_forward(self):
+        if self._loading or self._at_end or not self._keys:
+            return
+        if self.tree.yview()[1] <= 1 - SCROLL_THRESHOLD:
+            return  # пока ждали idle, окно уже сдвинулось
+        if self._prefetched is not None:
+            rows, self._prefetched = self._prefetched, None
+            self._append(rows)
+            self._prefetch_forward()
+            return
+        self._loading = True
+
+        def done(rows):
+            self._loading = False
+            self._append(rows)
+            self._prefetch_forward()
+        self._request(self._keys[-1], False, done)
+
+    def _extend_backward(self):
+        if self._loading or self._at_start or not self._keys:
+            return
+        if self.tree.yview()[0] >= SCROLL_THRESHOLD:
+            return
+        self._loading = True
+
+        def done(rows):
+            self._loading = False
+            self._prepend(list(reversed(rows)))
+        self._request(self._keys[0], True, done)
+
+    # ------------------ ТОЧЕЧНОЕ ОБНОВЛЕНИЕ ------------------
+
+    def refresh_rows(self, keys):
+        """Перечитывает записи keys и применяет к окну только их изменения.
+
+        Запись, которой больше нет, удаляется из окна; измененная обновляется
+        на месте (или переезжает, если сменился ключ сортировки); новая
+        вставляется, если по сортировке попадает в загруженное окно. Позиция
+        прокрутки и выделение сохраняются.
+        """
+        keys = [key for key in keys if key is not None]
+        if not keys:
+            return
+        sql, params = self.query.rows(self.sort_col, keys)
+        generation = self._generation
+
+        def apply(rows):
+            if generation == self._generation and self.winfo_exists():
+                self._apply_rows(keys, rows)
+        self.fetch(sql, params, apply)
+
+    def _apply_rows(self, keys, rows):
+        found = {str(row[1]): row for row in rows}
+        anchor = self._anchor()
+        first = self._first_visible()
+        selection = self.tree.selection()
+        # Заранее загруженная страница могла устареть
+        self._prefetched = None
+        for key in keys:
+            iid = str(key)
+            row = found.get(iid)
+            fits = row is not None and self._fits(row)
+            if self.tree.exists(iid):
+                del self._keys[next(i for i, k in enumerate(self._keys) if str(k[1]) == iid)]
+                if not fits:
+                    self.tree.delete(iid)
+                    continue
+                # Отсоединенный элемент сохраняет вложенные строки, а индекс вставки однозначен
+                self.tree.detach(iid)
+                position = self._position(row)
+                self.tree.move(iid, '', position)
+                self.tree.item(iid, values=self.formatter(row[2:]))
+                self._keys.insert(position, (row[0], row[1]))
+            elif fits:
+                position = self._position(row)
+                self._insert_row(position, row)
+                self._keys.insert(position, (row[0], row[1]))
+        kept = [iid for iid in selection if self.tree.exists(iid)]
+        if kept:
+            self.tree.selection_set(kept)
+        if anchor is not None and self.tree.exists(anchor):
+            self.tree.yview_moveto(self._display_index(anchor) / self._display_count())
+        else:
+            self.tree.yview_moveto(first / self._display_count())
+
+    def _before(self, a, b):
+        """a идет раньше b в текущей сортировке (a и b — пары (ключ сортировки, id))."""
+        return a > b if self.descending else a < b
+
+    def _position(self, row):
+        """Индекс, на который встает запись в окне (двоичный поиск по self._keys)."""
+        key = (row[0], row[1])
+        low, high = 0, len(self._keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self._before(self._keys[middle], key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _fits(self, row):
+        """Запись попадает в диапазон ключей загруженного окна (а не на страницы до или после него)."""
+        key = (row[0], row[1])
+        if not self._keys:
+            return self._at_start and self._at_end
+        if not self._at_start and self._before(key, self._keys[0]):
+            return False
+        if not self._at_end and self._before(self._keys[-1], key):
+            return False
+        return True
+
+    def _anchor(self):
+        """Строка верхнего уровня, которая сейчас первой видна в таблице."""
+        first = self._first_visible()
+        seen = 0
+        for iid in self.tree.get_children():
+            seen += 1
+            if self.tree.item(iid, 'open'):
+                seen += len(self.tree.get_children(iid))
+            if seen > first:
+                return iid
+        return None
+
+    def _display_index(self, iid):
+        """Номер отображаемой строки, с которой начинается элемент iid."""
+        children = self.tree.get_children()
+        return self._display_count(children[:children.index(iid)]) if iid != children[0] else 0
+
+    # ------------------ ВЛОЖЕННЫЕ СТРОКИ ------------------
+
+    def _insert_row(self, index, row):
+        iid = str(row[1])
+        self.tree.insert('', index, iid=iid, values=self.formatter(row[2:]))
+        if self.children_loader:
+            # Заглушка нужна, чтобы у строки появился значок раскрытия
+            self.tree.insert(iid, 'end', iid=iid + PLACEHOLDER_SUFFIX,
+                             values=('',) + ('загрузка...',) + ('',) * (len(self.columns) - 2))
+
+    def _on_open(self, event):
+        iid = self.tree.focus()
+        if not self.tree.exists(iid + PLACEHOLDER_SUFFIX):
+            return  # строки уже загружены
+
+        def deliver(rows):
+            if not self.tree.exists(iid + PLACEHOLDER_SUFFIX):
+                return  # строку удалили из окна, пока шел запрос
+            first = self._first_visible()
+            self.tree.delete(iid + PLACEHOLDER_SUFFIX)
+            for number, values in enumerate(rows):
+                self.tree.insert(iid, 'end', iid=f"{iid}/{number}", values=values)
+            if not rows:
+                self.tree.insert(iid, 'end', iid=f"{iid}/empty",
+                                 values=('',) + ('нет строк',) + ('',) * (len(self.columns) - 2))
+            self.tree.yview_moveto(first / self._display_count())
+        self.children_loader(iid, deliver)
+
+    def selected_key(self):
+        """iid строки верхнего уровня для текущего выделения (вложенная строка -> ее родитель)."""
+        selection = self.tree.selection()
+        if not selection:
+            return None
+        return self.tree.parent(selection[0]) or selection[0]
+
+    # ------------------ ОКНО ЭЛЕМЕНТОВ ------------------
+
+    def _display_count(self, iids=None):
+        """Число отображаемых строк: элементы окна плюс вложенные строки раскрытых элементов."""
+        iids = self.tree.get_children() if iids is None else iids
+        count = len(iids)
+        if self.children_loader:
+            count += sum(len(self.tree.get_children(iid)) for iid in iids if self.tree.item(iid, 'open'))
+        return max(count, 1)
+
+    def _first_visible(self):
+        return int(round(self.tree.yview()[0] * self._display_count()))
+
+    def _append(self, rows):
+        if len(rows) < self.page_size:
+            self._at_end = True
+        first = self._first_visible()
+        for row in rows:
+            if self.tree.exists(str(row[1])):
+                continue  # запись сменила ключ сортировки между запросами страниц
+            self._keys.append((row[0], row[1]))
+            self._insert_row('end', row)
+        overflow = len(self._keys) - self.max_items
+        if overflow > 0:
+            # Удаляем верхние элементы и сохраняем видимую позицию
+            removed = self.tree.get_children()[:overflow]
+            removed_rows = self._display_count(removed)
+            self.tree.delete(*removed)
+            del self._keys[:overflow]
+            self._at_start = False
+            self.tree.yview_moveto(max(first - removed_rows, 0) / self._display_count())
+
+    def _prepend(self, rows):
+        if len(rows) < self.page_size:
+            self._at_start = True
+        if not rows:
+            return
+        first = self._first_visible()
+        rows = [row for row in rows if not self.tree.exists(str(row[1]))]
+        for row in reversed(rows):
+            self._keys.insert(0, (row[0], row[1]))
+            self._insert_row(0, row)
+        overflow = len(self._keys) - self.max_items
+        if overflow > 0:
+            self.tree.delete(*self.tree.get_children()[-overflow:])
+            del self._keys[-overflow:]
+            self._at_end = False
+            self._prefetched = None
+        self.tree.yview_moveto((first + len(rows)) / self._display_count())
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) > 1 - SCROLL_THRESHOLD:
+            self.after_idle(self._extend_forward)
+        elif float(first) < SCROLL_THRESHOLD:
+            self.after_idle(self._extend_backward)
+
+    # ------------------ СОРТИРОВКА ------------------
+
+    def sort_by(self, col):
+        """Переключает сортировку по колонке (повторный щелчок меняет направление)."""
+        if col == self.sort_col:
+            self.descending = not self.descending
+        else:
+            self.sort_col, self.descending = col, False
+        self._update_headings()
+        self.reload()
+
+    def _update_headings(self):
+        for col in self.columns:
+            text = self.headings[col]
+            if col == self.sort_col:
+                text += ' ▼' if self.descending else ' ▲'
+            self.tree.heading(col, text=text)
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь записи: один поток-писатель с групповой фиксацией.
+
+Все изменения базы (формы интерфейса, проведение заказов, HTTP API)
+ставятся в очередь заданиями fn(conn) и выполняются одним потоком на одном
+соединении. Поток открывает транзакцию (BEGIN IMMEDIATE) и выполняет подряд
+задания, накопившиеся в очереди, — каждое под своей точкой сохранения, —
+а затем фиксирует их одним COMMIT. Пакет закрывается, когда очередь
+опустела, набралось MAX_BATCH заданий или истек бюджет задержки budget_ms с
+начала пакета. Так одновременные записи платят за одну фиксацию на всех и
+не соревнуются за блокировку записи файла.
+
+Если очередь пуста и пакет не выполняется, call() не передает задание
+потоку записи: оно выполняется и фиксируется сразу в потоке вызывающего на
+том же соединении записи (под той же блокировкой пакета), и одиночная
+запись не платит за переключение потоков.
+
+Ошибка задания откатывает только его точку сохранения: остальные задания
+пакета фиксируются, а Future упавшего задания получает исключение.
+Задание не должно само вызывать commit() или rollback(); транзакции внутри
+него (order_service.write_transaction, запись репозиториев) становятся
+вложенными и работают как обычно. Если транзакция пакета все же кончилась
+посреди него (свой commit() задания, SQLITE_FULL, ошибка ввода-вывода),
+пакет прерывается: его задания получают ошибку, незафиксированное
+откатывается, а поток записи продолжает работу со следующего задания. Действия, которые имеют смысл только для
+зафиксированных изменений (журнал аудита), задание откладывает через
+after_commit().
+
+Пакетные записи идут через очередь по одному заданию на пачку
+(order_service.run_write): догрузка сводок продаж sales_analytics.refresh
+и rebuild, сохранение сегментов segmentation.run. Мимо очереди, на своем
+соединении, пишут только:
+  - order_archive.archive — ATTACH архивной базы невозможен внутри
+    транзакции потока записи, а перенос держит архив подключенным между
+    пачками (перед переносом он сам догружает сводки на своем соединении);
+  - importer — массовая загрузка с отдельным профилем соединения;
+  - migrations — схема обновляется до запуска очереди;
+  - обслуживание из командной строки (stats_summary.rebuild_summary)
+    и замеры benchmarks, сравнивающие прямую запись с очередью.
+
+generation() — счетчик фиксаций очереди и фиксаций других соединений,
+замеченных потоком записи. По нему кэши, следящие за PRAGMA data_version
+своего соединения, отличают собственные записи приложения от чужих.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+BUDGET_MS = 20      # мс: дольше пакет не набирается, даже если задания продолжают поступать
+LINGER_MS = 0       # мс: сколько ждать следующего задания при пустой очереди перед фиксацией
+MAX_BATCH = 500     # заданий в одной фиксации
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Единственный поток записи с групповой фиксацией; задания возвращают Future.
+
+    connect — фабрика соединения, вызывается один раз в потоке-писателе;
+    закрывает соединение его владелец (у DataAccess — пул соединений).
+    bind(conn) — контекст, в котором conn служит соединением текущего потока
+    (ConnectionPool.bind): без него call() всегда передает задание потоку записи.
+    """
+
+    def __init__(self, connect, budget_ms=BUDGET_MS, linger_ms=LINGER_MS, max_batch=MAX_BATCH, bind=None):
+        self._connect = connect
+        self._bind = bind
+        self.budget = budget_ms / 1000
+        self.linger = linger_ms / 1000
+        self.max_batch = max_batch
+        self._jobs = queue.Queue()
+        self._conn = None       # соединение записи: открывается потоком записи с первым заданием
+        self._hooks = None      # отложенные действия выполняемого задания (у потока, выполняющего пакет)
+        self._data_version = None   # PRAGMA data_version соединения записи после прошлого пакета
+        self._lock = threading.Lock()
+        self._batch_lock = threading.Lock()     # пакет выполняет один поток: писатель или вызывающий
+        self._owner = None      # идентификатор потока, выполняющего пакет
+        self._pending = 0       # заданий в очереди и в работе
+        self._stats = {'jobs': 0, 'failed': 0, 'commits': 0, 'external': 0, 'max_batch': 0, 'last_batch': 0,
+                       'commit_s': 0.0}
+        self._thread = threading.Thread(target=self._run, name='erp-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """Ставит fn(conn) в очередь и возвращает Future с его результатом (после фиксации)."""
+        future = Future()
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._settled)
+        self._jobs.put((fn, future))
+        return future
+
+    def _settled(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def call(self, fn):
+        """Выполняет fn(conn) на соединении записи и ждет фиксации (исключение пробрасывается).
+
+        Если очередь пуста и пакет не выполняется, задание выполняется и
+        фиксируется сразу в потоке вызывающего, без передачи потоку записи.
+        """
+        if self._owner == threading.get_ident():
+            # Задание ставит вложенную запись: она выполняется сразу в его транзакции
+            return fn(self._conn)
+        conn = self._conn
+        if conn is not None and self._bind is not None and self._thread.is_alive():
+            with self._lock:
+                # Задания, поставленные раньше, выполняются раньше: при непустой очереди — только через нее
+                idle = not self._pending and self._batch_lock.acquire(blocking=False)
+            if idle:
+                try:
+                    with self._bind(conn):
+                        return self._alone(conn, fn)
+                finally:
+                    self._batch_lock.release()
+        return self.submit(fn).result()
+
+    def after_commit(self, fn, *args):
+        """Вызывает fn(*args) после фиксации текущего задания очереди.
+
+        Если задание упадет или фиксация не удастся, вызова не будет. Вне
+        задания очереди fn вызывается сразу.
+        """
+        if self._owner == threading.get_ident() and self._hooks is not None:
+            self._hooks.append((fn, args))
+        else:
+            fn(*args)
+
+    def flush(self):
+        """Ждет, пока будут зафиксированы все поставленные ранее задания."""
+        self.call(lambda conn: None)
+
+    def generation(self):
+        """(фиксаций очереди, замеченных фиксаций других соединений) — растут с каждой фиксацией.
+
+        Другие соединения замечаются в начале пакета: их фиксация после
+        последнего пакета видна здесь только со следующим пакетом.
+        """
+        with self._lock:
+            return self._stats['commits'], self._stats['external']
+
+    def metrics(self):
+        """Глубина очереди и статистика фиксаций: число заданий, фиксаций, размер пакета."""
+        with self._lock:
+            stats = dict(self._stats)
+        commits = stats['commits']
+        return {
+            'queue_depth': self._jobs.qsize(),
+            'jobs': stats['jobs'],
+            'failed': stats['failed'],
+            'commits': commits,
+            'external_commits': stats['external'],
+            'mean_batch': round(stats['jobs'] / commits, 2) if commits else 0,
+            'max_batch': stats['max_batch'],
+            'last_batch': stats['last_batch'],
+            'mean_commit_ms': round(stats['commit_s'] / commits * 1000, 3) if commits else 0,
+        }
+
+    def close(self):
+        """Фиксирует оставшиеся задания и останавливает поток."""
+        if self._thread.is_alive():
+            self._jobs.put(_STOP)
+            self._thread.join()
+
+    # ------------------ ПОТОК ЗАПИСИ ------------------
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            job = self._jobs.get()
+            if job is _STOP:
+                break
+            if conn is None:
+                # Соединение открывается с первым заданием — когда схема базы уже приведена к версии
+                try:
+                    conn = self._conn = self._connect()
+                except Exception as e:
+                    # База не открывается — задание получает ошибку, следующее попробует снова
+                    _fail(job[1], e)
+                    continue
+            with self._batch_lock:
+                stopping = self._batch(conn, job)
+
+    def _batch(self, conn, job):
+        """Выполняет и фиксирует пакет, начиная с job; True — в пакете встретилась остановка очереди."""
+        deadline = time.monotonic() + self.budget
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            # Блокировку не отдал другой процесс за busy_timeout — задание получает ошибку
+            _fail(job[1], e)
+            return False
+        self._owner = threading.get_ident()
+        done, hooks, failed = [], [], 0
+        current = None
+        stopping = False
+        try:
+            self._check_external(conn)
+            while True:
+                current = job
+                failed += not self._apply(conn, job, done, hooks)
+                current = None
+                if len(done) + failed >= self.max_batch:
+                    break
+                job = self._next(deadline)
+                if job is None:
+                    break
+                if job is _STOP:
+                    stopping = True
+                    break
+            self._commit(conn, done, hooks, failed)
+        except Exception as e:
+            # Поток записи не должен остановиться: иначе Future оставшихся заданий не завершатся
+            self._abort(conn, current, done, failed, e)
+        finally:
+            self._owner = None
+        return stopping
+
+    def _alone(self, conn, fn):
+        """Пакет из одного задания в потоке вызывающего: без Future и точки сохранения.
+
+        Вызывается под _batch_lock, когда очередь пуста; ошибка задания или
+        фиксации откатывает транзакцию и пробрасывается вызывающему.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        self._owner = threading.get_ident()
+        self._hooks = []
+        try:
+            self._check_external(conn)
+            result = fn(conn)
+            started = time.perf_counter()
+            conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            self._account(0, 1, None)
+            raise
+        finally:
+            hooks, self._hooks = self._hooks, None
+            self._owner = None
+        self._account(1, 0, time.perf_counter() - started)
+        _call_hooks(hooks)
+        return result
+
+    def _check_external(self, conn):
+        """Считает фиксации других соединений с прошлого пакета (в начале транзакции пакета)."""
+        # Свои фиксации data_version этого соединения не меняют — только чужие
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            with self._lock:
+                self._stats['external'] += self._data_version is not None
+            self._data_version = version
+
+    def _next(self, deadline):
+        """Следующее задание пакета или None, если пакет пора фиксировать."""
+        try:
+            return self._jobs.get_nowait()
+        except queue.Empty:
+            pass
+        wait = min(self.linger, deadline - time.monotonic())
+        if wait <= 0:
+            return None
+        try:
+            return self._jobs.get(timeout=wait)
+        except queue.Empty:
+            return None
+
+    def _apply(self, conn, job, done, hooks):
+        """Выполняет задание под точкой сохранения; False — задание упало и откачено."""
+        fn, future = job
+        if not future.set_running_or_notify_cancel():
+            return True
+        conn.execute("SAVEPOINT write_job")
+        self._hooks = []
+        try:
+            result = fn(conn)
+        except BaseException as e:
+            future.set_exception(e)
+            # Если задание завершило транзакцию (SQLITE_FULL, IOERR, свой commit()), точки
+            # сохранения уже нет — исключение прерывает пакет целиком (_abort)
+            conn.execute("ROLLBACK TO write_job")
+            conn.execute("RELEASE write_job")
+            return False
+        finally:
+            job_hooks, self._hooks = self._hooks, None
+        conn.execute("RELEASE write_job")
+        done.append((future, result))
+        hooks.extend(job_hooks)
+        return True
+
+    def _commit(self, conn, done, hooks, failed):
+        started = time.perf_counter()
+        try:
+            conn.commit()
+        except BaseException as e:
+            conn.rollback()
+            for future, _ in done:
+                future.set_exception(e)
+            failed, done, hooks = failed + len(done), [], []
+        self._account(len(done), failed, time.perf_counter() - started)
+        _call_hooks(hooks)
+        for future, result in done:
+            future.set_result(result)
+
+    def _account(self, done, failed, elapsed):
+        """Учитывает пакет в статистике; elapsed — время фиксации (None — фиксации не было)."""
+        with self._lock:
+            stats = self._stats
+            stats['jobs'] += done + failed
+            stats['failed'] += failed
+            if elapsed is not None:
+                stats['commits'] += 1
+                stats['last_batch'] = done + failed
+                stats['max_batch'] = max(stats['max_batch'], stats['last_batch'])
+                stats['commit_s'] += elapsed
+
+    def _abort(self, conn, current, done, failed, error):
+        """Пакет прерван: его задания получают ошибку, незафиксированная транзакция откатывается.
+
+        current — задание, во время которого пакет прервался (или None).
+        """
+        aborted = sqlite3.OperationalError(f"Пакет записи прерван, изменения не зафиксированы: {error}")
+        aborted.__cause__ = error
+        pending = [future for future, _ in done] + ([current[1]] if current else [])
+        for future in pending:
+            _fail(future, aborted)
+        self._account(0, len(pending) + failed, None)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Следующий пакет начнется с BEGIN IMMEDIATE и сообщит об ошибке своим заданиям
+            traceback.print_exc()
+
+
+def _call_hooks(hooks):
+    for fn, args in hooks:
+        try:
+            fn(*args)
+        except Exception:
+            # Ошибка отложенного действия не должна останавливать запись
+            traceback.print_exc()
+
+
+def _fail(future, error):
+    """Завершает Future ошибкой, если он еще не завершен (или не отменен)."""
+    if not future.done():
+        future.set_exception(error)